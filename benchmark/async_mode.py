@@ -0,0 +1,176 @@
+#
+# Copyright 2020-2023 IBM Inc. All rights reserved
+# SPDX-License-Identifier: Apache2.0
+#
+
+# Compares the throughput of the sync (threadpool) and the async execution modes of the
+# dialog manager. The remote classifiers are replaced by a local stub server with a fixed
+# latency. The benchmark writes many dialogs, so it refuses to run against the configured
+# MongoDB: it needs a database of its own (e.g. a local one, started with
+# docker run -p 27017:27017 mongo), to which the content of the resources is uploaded, and
+# in which the dialogs are written with a self-expiring label.
+#
+# usage: PYTHONPATH=. python benchmark/async_mode.py -db_url mongodb://localhost:27017 -sessions 200 -turns 3
+
+import asyncio
+import json
+import os
+import threading
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import time, sleep
+
+import pandas as pd
+from pymongo.uri_parser import parse_uri
+
+os.environ['EVAL_LABEL'] = 'self-expiring-benchmark'
+
+from components.intent_detection import intent_classes
+from tools.configuration import Configuration
+from tools.db_manager import DB_URL_VARIABLE, DBManager, read_credentials_db_url
+
+# the default size of the starlette threadpool
+THREADPOOL_SIZE = 40
+
+
+def create_stub_handler(labels, latency):
+    class StubHandler(BaseHTTPRequestHandler):
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers['Content-Length']))
+            sleep(latency)
+            body = json.dumps({
+                'intents': labels,
+                'scores': [1.0 - i / len(labels) for i in range(len(labels))]
+            }).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return StubHandler
+
+
+def start_stub_server(labels, latency):
+    ThreadingHTTPServer.request_queue_size = 1024
+    server = ThreadingHTTPServer(('127.0.0.1', 0), create_stub_handler(labels, latency))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}/'
+
+
+def use_benchmark_db(db_url):
+    # the benchmark database must not be the configured one
+    credentials_path = os.path.join('resources', 'db', 'db_credentials.json')
+    if os.path.exists(credentials_path) and \
+            set(parse_uri(db_url)['nodelist']) & set(parse_uri(read_credentials_db_url())['nodelist']):
+        raise ValueError('The benchmark database %s is the configured database' % db_url)
+    os.environ[DB_URL_VARIABLE] = db_url
+
+
+def upload_content():
+    from tools import db_utils
+    with open(os.path.join('resources', 'configuration', 'configuration.json'), 'rt', encoding='utf-8') as fp:
+        data = json.load(fp)
+    with DBManager().content_upload():
+        DBManager().upload_configuration(Configuration(data))
+        db_utils.import_canned_text_path('canned_text')
+        db_utils.import_response_db_path('response_db')
+        db_utils.import_kp_qform_path('kps_to_qform')
+        db_utils.import_kp_idx_path('kps_to_parent.csv')
+        db_utils.import_profanity_lexicon('profanity_lexicon.csv')
+        db_utils.import_profanity_texts('profanity_texts.csv')
+
+
+def read_questions(language_code):
+    path = os.path.join('resources', 'response_db', f'kps_to_qform_{language_code}.csv')
+    return pd.read_csv(path, encoding="ISO-8859-1")['q_form'].dropna().tolist()
+
+
+def run_sync(dialog_manager, questions, n_sessions, n_turns, language_code):
+    latencies = []
+
+    def run_session(session_index):
+        t0 = time()
+        response = dialog_manager.process_new_session(None, None, None, None, language_code)
+        latencies.append(time() - t0)
+        for turn in range(n_turns):
+            text = questions[(session_index + turn) % len(questions)]
+            t0 = time()
+            dialog_manager.process_user_text(response['session_id'], text, False, False, False)
+            latencies.append(time() - t0)
+
+    with ThreadPoolExecutor(max_workers=THREADPOOL_SIZE) as executor:
+        list(executor.map(run_session, range(n_sessions)))
+    return latencies
+
+
+async def run_async(dialog_manager, questions, n_sessions, n_turns, language_code, concurrency):
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_session(session_index):
+        async with semaphore:
+            t0 = time()
+            response = await dialog_manager.async_process_new_session(None, None, None, None, language_code)
+            latencies.append(time() - t0)
+            for turn in range(n_turns):
+                text = questions[(session_index + turn) % len(questions)]
+                t0 = time()
+                await dialog_manager.async_process_user_text(response['session_id'], text, False, False, False)
+                latencies.append(time() - t0)
+
+    await asyncio.gather(*[run_session(i) for i in range(n_sessions)])
+    return latencies
+
+
+def report(mode, latencies, elapsed):
+    latencies = sorted(latencies)
+    print("%-6s requests: %5d  elapsed: %7.2f secs  throughput: %8.1f req/sec  "
+          "p50: %6.1f ms  p99: %6.1f ms" %
+          (mode, len(latencies), elapsed, len(latencies) / elapsed,
+           1000 * latencies[len(latencies) // 2], 1000 * latencies[int(len(latencies) * 0.99)]))
+
+
+def main():
+    parser = ArgumentParser(description="Sync vs. async dialog manager benchmark")
+    parser.add_argument("-db_url", dest="db_url", type=str, required=True,
+                        help="url of a MongoDB for the benchmark, other than the configured one")
+    parser.add_argument("-sessions", dest="sessions", type=int, default=200, help="number of sessions")
+    parser.add_argument("-turns", dest="turns", type=int, default=3, help="user turns per session")
+    parser.add_argument("-latency", dest="latency", type=float, default=50, help="stub latency in ms")
+    parser.add_argument("-concurrency", dest="concurrency", type=int, default=500,
+                        help="concurrent sessions in async mode")
+    parser.add_argument("-language", dest="language_code", type=str, default='en', help="language code")
+    args = parser.parse_args()
+
+    use_benchmark_db(args.db_url)
+    upload_content()
+    from components.dialog_manager import DialogManager
+    dialog_manager = DialogManager()
+    kp_server, kp_url = start_stub_server(DBManager().read_kp_idx_mapping(), args.latency / 1000)
+    intent_server, intent_url = start_stub_server(intent_classes, args.latency / 1000)
+    dialog_manager.kp_matcher.url = kp_url
+    dialog_manager.user_intent_detection.intent_classifier.url = intent_url
+    questions = read_questions(args.language_code)
+
+    t0 = time()
+    latencies = run_sync(dialog_manager, questions, args.sessions, args.turns, args.language_code)
+    report('sync', latencies, time() - t0)
+
+    t0 = time()
+    latencies = asyncio.run(run_async(dialog_manager, questions, args.sessions, args.turns,
+                                      args.language_code, args.concurrency))
+    report('async', latencies, time() - t0)
+
+    kp_server.shutdown()
+    intent_server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
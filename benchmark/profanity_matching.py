@@ -0,0 +1,99 @@
+#
+# Copyright 2020-2023 IBM Inc. All rights reserved
+# SPDX-License-Identifier: Apache2.0
+#
+
+# Compares the cost of the lexicon matching of the profanity classifier, with the previous regex
+# alternation and with the phrase matcher, for growing lexicon sizes. The lexicon is the profanity
+# lexicon, extended with synthetic terms, and the messages are the responses of the response db
+# with lexicon terms inserted into some of them. The decisions of both must be identical.
+#
+# usage: PYTHONPATH=. python benchmark/profanity_matching.py -sizes 540 2000 8000 32000 -messages 2000
+
+import os
+import random
+import re
+from argparse import ArgumentParser
+from time import perf_counter
+
+import pandas as pd
+
+from tools.phrase_matcher import PhraseMatcher
+
+RESPONSE_DB_DIR = os.path.join('resources', 'response_db')
+CLEANER_PATTERN = re.compile(r"[^A-Za-z0-9\-]")
+
+
+def normalize(text):
+    return ' '.join(CLEANER_PATTERN.sub(" ", text).lower().split())
+
+
+def read_lexicon():
+    df = pd.read_csv(os.path.join(RESPONSE_DB_DIR, 'profanity_lexicon.csv'), encoding='utf-8-sig')
+    return [term.strip().lower() for term in df['lexicon'].dropna().tolist()]
+
+
+def create_lexicon(rng, lexicon, size):
+    words = sorted({word for term in lexicon for word in term.split()})
+    terms = list(lexicon)
+    while len(terms) < size:
+        # synthetic terms of one to three words, that mostly share their prefixes with real ones
+        term = ' '.join(rng.choice(words) for _ in range(rng.randint(1, 3)))
+        terms.append(term + rng.choice(['', 's', 'er', 'x%d' % len(terms)]))
+    return terms[:size]
+
+
+def create_messages(rng, lexicon, n_messages, profanity_rate):
+    df = pd.read_csv(os.path.join(RESPONSE_DB_DIR, 'response_db_en.csv'), encoding='utf-8-sig')
+    responses = df['system_response'].dropna().tolist()
+    messages = []
+    for _ in range(n_messages):
+        words = rng.choice(responses).split()[:rng.randint(3, 30)]
+        if rng.random() < profanity_rate:
+            words.insert(rng.randint(0, len(words)), rng.choice(lexicon))
+        messages.append(normalize(' '.join(words)))
+    return messages
+
+
+def time_matching(match, messages, repeats):
+    start_time = perf_counter()
+    for _ in range(repeats):
+        decisions = [match(message) for message in messages]
+    return 1e6 * (perf_counter() - start_time) / (repeats * len(messages)), decisions
+
+
+def main():
+    parser = ArgumentParser(description="Profanity lexicon matching benchmark")
+    parser.add_argument("-sizes", dest="sizes", type=int, nargs='+', default=[540, 2000, 8000, 32000],
+                        help="lexicon sizes")
+    parser.add_argument("-messages", dest="messages", type=int, default=2000, help="number of messages")
+    parser.add_argument("-profanity_rate", dest="profanity_rate", type=float, default=0.1)
+    parser.add_argument("-repeats", dest="repeats", type=int, default=3)
+    parser.add_argument("-seed", dest="seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    base_lexicon = read_lexicon()
+    print('%8s %12s %12s %12s %12s' % ('terms', 'regex build', 'regex', 'trie build', 'trie'))
+    for size in args.sizes:
+        lexicon = create_lexicon(rng, base_lexicon, size)
+        messages = create_messages(rng, lexicon, args.messages, args.profanity_rate)
+
+        start_time = perf_counter()
+        regex = re.compile(r"\b(" + "|".join([re.escape(term) for term in lexicon]) + r")\b")
+        regex_build_time = perf_counter() - start_time
+        start_time = perf_counter()
+        matcher = PhraseMatcher(lexicon)
+        matcher_build_time = perf_counter() - start_time
+
+        regex_time, expected = time_matching(lambda message: regex.search(message) is not None,
+                                             messages, args.repeats)
+        matcher_time, decisions = time_matching(matcher.search, messages, args.repeats)
+        if decisions != expected:
+            raise ValueError('Decision mismatch with a lexicon of %d terms' % size)
+        print('%8d %10.1fms %8.1fus/msg %10.1fms %8.1fus/msg' % (size, 1e3 * regex_build_time, regex_time,
+                                                               1e3 * matcher_build_time, matcher_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+#
+# Copyright 2020-2023 IBM Inc. All rights reserved
+# SPDX-License-Identifier: Apache2.0
+#
+
+# Compares the recency penalty of the response selection, computed for all the candidates at once,
+# with the previous computation per candidate, over synthetic sessions. In each turn the candidates
+# combine the responses of a random kp with random canned text prefixes and suffixes (as created by
+# the connecting text library), and the top scored candidate is added to the history of the session.
+# The scores of both computations must be identical.
+#
+# usage: PYTHONPATH=. python benchmark/recency_scoring.py -sessions 20 -turns 100 -language en
+
+import json
+import os
+import random
+from argparse import ArgumentParser
+from time import perf_counter
+
+import pandas as pd
+
+from components.response_selection import RANDOM_INIT_SCORE, diminish_scores_by_recency_usage
+from tools.argument import Argument
+from tools.configuration import Configuration
+
+RESPONSE_DB_DIR = os.path.join('resources', 'response_db')
+
+
+def diminish_score_by_recency_usage(arg, score, system_argument_history, last_usage_factors):
+    # the previous computation, per candidate
+    response_base_used = [i for i, arg_history in enumerate(system_argument_history)
+                          if arg_history.base_response == arg.base_response]
+    response_base_last_used_index = response_base_used[-1] if len(response_base_used) > 0 else -1
+    canned_text_last_used_indices = []
+    for ct in arg.canned_text:
+        if len(ct) > 0:
+            canned_text_used = [i for i, arg_history in enumerate(system_argument_history)
+                                if ct in arg_history.canned_text]
+            canned_text_last_used_indices.append(canned_text_used[-1] if len(canned_text_used) > 0 else -1)
+    if response_base_last_used_index > -1:
+        score *= pow(last_usage_factors['response_db'],
+                     5 / (len(system_argument_history) - response_base_last_used_index))
+    for canned_text_last_used_index in canned_text_last_used_indices:
+        if canned_text_last_used_index > -1:
+            score *= pow(last_usage_factors['canned_text'],
+                         5 / (len(system_argument_history) - canned_text_last_used_index))
+    return score
+
+
+def read_content(language_code):
+    responses = pd.read_csv(os.path.join(RESPONSE_DB_DIR, 'response_db_%s.csv' % language_code),
+                            encoding='utf-8-sig')
+    kp_responses = [group['system_response'].dropna().tolist() for _, group in responses.groupby('system_kp')]
+    canned_text = pd.read_csv(os.path.join(RESPONSE_DB_DIR, 'canned_text_%s.csv' % language_code),
+                              encoding='utf-8-sig')
+    prefixes = canned_text[canned_text['position'] == 'prefix']['text'].dropna().unique().tolist()
+    suffixes = canned_text[canned_text['position'] == 'suffix']['text'].dropna().unique().tolist()
+    return [r for r in kp_responses if len(r) > 0], prefixes + [''], suffixes + ['']
+
+
+def create_candidates(rng, responses, prefixes, suffixes, n_candidates):
+    candidates = []
+    for _ in range(n_candidates):
+        response, prefix, suffix = rng.choice(responses), rng.choice(prefixes), rng.choice(suffixes)
+        candidates.append(Argument(text=' '.join(t for t in [prefix, response, suffix] if len(t) > 0),
+                                   arg_type='general', base_response=response, canned_text=[prefix, suffix]))
+    return candidates
+
+
+def main():
+    parser = ArgumentParser(description="Recency penalty scoring benchmark")
+    parser.add_argument("-sessions", dest="sessions", type=int, default=20, help="number of sessions")
+    parser.add_argument("-turns", dest="turns", type=int, default=100, help="system turns per session")
+    parser.add_argument("-candidates", dest="candidates", type=int, default=60, help="candidates per turn")
+    parser.add_argument("-language", dest="language_code", type=str, default='en', help="language code")
+    parser.add_argument("-seed", dest="seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with open(os.path.join('resources', 'configuration', 'configuration.json')) as fp:
+        last_usage_factors = Configuration(json.load(fp)).get_last_usage_factors()
+    kp_responses, prefixes, suffixes = read_content(args.language_code)
+    rng = random.Random(args.seed)
+
+    times = {'per candidate': 0, 'batched': 0}
+    n_turns = 0
+    for _ in range(args.sessions):
+        history = []
+        responses = rng.sample(kp_responses, min(10, len(kp_responses)))
+        for _ in range(args.turns):
+            candidates = create_candidates(rng, rng.choice(responses), prefixes, suffixes, args.candidates)
+            scores = [max(RANDOM_INIT_SCORE - i / RANDOM_INIT_SCORE, 0) for i in range(len(candidates))]
+
+            start_time = perf_counter()
+            expected = [diminish_score_by_recency_usage(arg, score, history, last_usage_factors)
+                        for arg, score in zip(candidates, scores)]
+            times['per candidate'] += perf_counter() - start_time
+
+            start_time = perf_counter()
+            new_scores = diminish_scores_by_recency_usage(candidates, scores, history, last_usage_factors)
+            times['batched'] += perf_counter() - start_time
+
+            if new_scores != expected:
+                raise ValueError('Score mismatch in turn %d' % len(history))
+            history.append(candidates[max(range(len(candidates)), key=lambda i: new_scores[i])])
+            n_turns += 1
+
+    print('Sessions: %d, turns: %d, candidates: %d' % (args.sessions, args.turns, args.candidates))
+    for name, elapsed in times.items():
+        print('%-14s %8.1f us/turn' % (name, 1e6 * elapsed / n_turns))
+
+
+if __name__ == '__main__':
+    main()
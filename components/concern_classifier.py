@@ -3,12 +3,14 @@
 # SPDX-License-Identifier: Apache2.0
 #
 
+from tools.batch_processing import apply_batch
+from tools.text_analysis import TextAnalysis
 from tools.text_cleansing import clean_text, clean_words
 
 
 class ConcernClassifier:
 
-    def apply(self, user_text, dialog_data):
+    def apply(self, user_text, dialog_data, analysis=None):
         pass
 
 
@@ -20,13 +22,24 @@ class LexicalConcernClassifier(ConcernClassifier):
                                           'understand clear clarify not')
     CONCERN_WORDS_THRESHOLD = 0
 
-    def apply(self, user_text, dialog_data):
-        text = clean_text(user_text, ignore_words=self.COMMON_NO_CONCERN_WORDS)
-        n_words = len(text.split())
+    def apply(self, user_text, dialog_data, analysis=None):
+        if analysis is not None:
+            n_words = len([word for word in analysis.content_words if word not in self.COMMON_NO_CONCERN_WORDS])
+        else:
+            text = clean_text(user_text, ignore_words=self.COMMON_NO_CONCERN_WORDS)
+            n_words = len(text.split())
         return n_words > self.CONCERN_WORDS_THRESHOLD
 
+    def apply_many(self, user_texts):
+        return [self.apply(user_text, None, TextAnalysis(user_text)) for user_text in user_texts]
+
+    # the lexical classifier does not depend on the dialog, so a batch is a list of texts
+    def apply_batch(self, user_texts, n_processes=1):
+        return apply_batch(self, 'apply_many', user_texts, n_processes=n_processes)
+
 
 if __name__ == "__main__":
     lex = LexicalConcernClassifier()
     print(lex.apply('good', None))
     print(lex.apply("I'm sorry, but I'm not sure I understood your point.", None))
+    print(lex.apply_batch(['good', 'what are the side effects?', 'good']))
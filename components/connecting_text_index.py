@@ -0,0 +1,240 @@
+#
+# Copyright 2020-2023 IBM Inc. All rights reserved
+# SPDX-License-Identifier: Apache2.0
+#
+
+import logging
+import struct
+import time
+
+from components.connecting_text_library import ConnectingTextLibraryML, ConnectingTextType
+from components.response_db import ResponseDBML
+from tools.argument import Argument
+from tools.db_manager import DBManager
+from tools.language_content import LanguageML
+from tools.memory_utils import format_size, get_deep_size
+from tools.shared_store import NONE_ID, StringTable, StringTableBuilder, open_shared_store
+
+# the layout of a serialized index: a header, the keys (pro_kp, campaign, intent, persona, start, count),
+# the recipes (kind and string ids), the recipe ids of each key (from start, count ids) and the strings
+SHARED_INDEX_HEADER = struct.Struct('<4sIIIIII')
+SHARED_INDEX_MAGIC = b'VCTI'
+SHARED_INDEX_FORMAT = 1
+KEY_SIZE = 6
+RECIPE_SIZE = 7
+RECIPE_COMBINED = 0
+RECIPE_NO_CANNED_TEXT = 1
+RECIPE_FULL = 2
+
+
+def get_argument_fields(arg):
+    return arg.text, arg.type, arg.base_response, tuple(arg.canned_text), arg.expression
+
+
+class ConnectingTextIndex:
+    # the rephrased arguments of every (pro_kp, campaign, intent, persona), as created by
+    # ConnectingTextLibrary.rephrase, computed once since the canned text and the response db
+    # only change on deploy. to keep the index compact, it holds the recipes of the arguments
+    # (e.g. the prefix, pro argument and suffix to combine) rather than their full texts, and
+    # equal recipes and recipe lists are stored once. the arguments are created on lookup.
+
+    def __init__(self, response_db, connecting_text):
+        self.response_db = response_db
+        self.connecting_text = connecting_text
+        self.index = {}
+        self.campaigns = {}
+        values = {}
+        for pro_kp in [None] + self.response_db.get_pro_kps():
+            campaigns = self.response_db.get_pro_kp_campaigns(pro_kp) if pro_kp is not None else []
+            self.campaigns[pro_kp] = frozenset(campaigns)
+            for campaign_id in [None] + campaigns:
+                pro_args = self.response_db.get_pro_kp_args(pro_kp, campaign_id)
+                for intent, personas in self.connecting_text.connecting_text_library.items():
+                    for persona in personas.keys():
+                        recipes = tuple(
+                            values.setdefault((create_argument, params), (
+                                values.setdefault(create_argument, create_argument),
+                                tuple(values.setdefault(param, param) for param in params)))
+                            for create_argument, params in
+                            self.connecting_text.get_rephrase_recipes(pro_args, intent.name, persona))
+                        self.index[(pro_kp, campaign_id, intent.name, persona)] = values.setdefault(recipes, recipes)
+
+    def get_key(self, pro_kp, campaign_id, intent, persona):
+        # campaigns without specific links get the default arguments. the intents are keyed by the
+        # name of their connecting text type, and are given by their (lowercase) intent labels
+        if campaign_id not in self.campaigns.get(pro_kp, ()):
+            campaign_id = None
+        return pro_kp, campaign_id, ConnectingTextType.from_str(intent).name, persona
+
+    def rephrase(self, pro_kp, campaign_id, intent, persona):
+        recipes = self.index.get(self.get_key(pro_kp, campaign_id, intent, persona))
+        if recipes is None:
+            # unknown combinations are handled (and reported) by the library
+            return self.connecting_text.rephrase(self.response_db.get_pro_kp_args(pro_kp, campaign_id),
+                                                 intent=intent, persona=persona)
+        return [create_argument(*params) for create_argument, params in recipes]
+
+    def verify(self):
+        # checks that the index produces the same arguments as the library, in the same order
+        for pro_kp, campaign_id, intent, persona in self.index.keys():
+            arguments = self.rephrase(pro_kp, campaign_id, intent, persona)
+            expected = self.connecting_text.rephrase(self.response_db.get_pro_kp_args(pro_kp, campaign_id),
+                                                     intent=intent, persona=persona)
+            if [get_argument_fields(arg) for arg in arguments] != [get_argument_fields(arg) for arg in expected]:
+                raise ValueError('Connecting text index mismatch for %s' % str((pro_kp, campaign_id, intent, persona)))
+
+    def get_size(self):
+        return sum(len(recipes) for recipes in self.index.values())
+
+    def get_memory_size(self):
+        return get_deep_size(self.index)
+
+
+def get_recipe_strings(connecting_text, create_argument, params):
+    if create_argument == connecting_text.create_combined_argument:
+        prefix, arg, suffix = params
+        return RECIPE_COMBINED, [prefix[0], prefix[1], arg.text, arg.type, suffix[0], suffix[1]]
+    if create_argument == connecting_text.create_no_canned_text_argument:
+        arg, = params
+        return RECIPE_NO_CANNED_TEXT, [arg.text, arg.type]
+    if create_argument == connecting_text.create_full_argument:
+        return RECIPE_FULL, list(params)
+    raise ValueError('Unsupported recipe: %s' % create_argument)
+
+
+def serialize_index(index):
+    strings = StringTableBuilder()
+    keys = []
+    recipes = []
+    recipe_ids = {}
+    recipe_lists = {}
+    list_items = []
+    for (pro_kp, campaign_id, intent, persona), key_recipes in index.index.items():
+        # equal recipe lists are stored once, as in the index
+        if id(key_recipes) not in recipe_lists:
+            recipe_lists[id(key_recipes)] = len(list_items)
+            for create_argument, params in key_recipes:
+                kind, recipe_strings = get_recipe_strings(index.connecting_text, create_argument, params)
+                recipe = tuple([kind] + [strings.add(text) for text in recipe_strings] +
+                               [NONE_ID] * (RECIPE_SIZE - 1 - len(recipe_strings)))
+                if recipe not in recipe_ids:
+                    recipe_ids[recipe] = len(recipes)
+                    recipes.append(recipe)
+                list_items.append(recipe_ids[recipe])
+        keys.append((strings.add(pro_kp), strings.add(campaign_id), strings.add(intent), strings.add(persona),
+                     recipe_lists[id(key_recipes)], len(key_recipes)))
+    string_table = strings.to_bytes()
+    return b''.join([
+        SHARED_INDEX_HEADER.pack(SHARED_INDEX_MAGIC, SHARED_INDEX_FORMAT, len(keys), len(recipes), len(list_items),
+                                 len(strings.strings), len(string_table)),
+        struct.pack('<%dI' % (KEY_SIZE * len(keys)), *[value for key in keys for value in key]),
+        struct.pack('<%dI' % (RECIPE_SIZE * len(recipes)), *[value for recipe in recipes for value in recipe]),
+        struct.pack('<%dI' % len(list_items), *list_items),
+        string_table,
+    ])
+
+
+class SharedConnectingTextIndex(ConnectingTextIndex):
+    # a connecting text index that is read from a memory mapped store, shared by the worker processes of
+    # the host. only the keys are held by each process, and the arguments are created from the store.
+
+    def __init__(self, response_db, connecting_text, store):
+        self.response_db = response_db
+        self.connecting_text = connecting_text
+        self.store = store
+        buffer = memoryview(store)
+        magic, version, n_keys, n_recipes, n_list_items, n_strings, _ = SHARED_INDEX_HEADER.unpack_from(buffer)
+        if magic != SHARED_INDEX_MAGIC or version != SHARED_INDEX_FORMAT:
+            raise ValueError('Unsupported connecting text index store')
+        offset = SHARED_INDEX_HEADER.size
+        self.keys = buffer[offset:offset + 4 * KEY_SIZE * n_keys].cast('I')
+        offset += self.keys.nbytes
+        self.recipes = buffer[offset:offset + 4 * RECIPE_SIZE * n_recipes].cast('I')
+        offset += self.recipes.nbytes
+        self.list_items = buffer[offset:offset + 4 * n_list_items].cast('I')
+        offset += self.list_items.nbytes
+        self.strings = StringTable(buffer, offset, n_strings)
+        # the keys map to their offset in the store, and their strings are decoded once
+        self.index = {}
+        campaigns = {}
+        key_strings = {}
+        for i in range(0, len(self.keys), KEY_SIZE):
+            pro_kp, campaign_id, intent, persona = [
+                key_strings[string_id] if string_id in key_strings else
+                key_strings.setdefault(string_id, self.strings.get(string_id)) for string_id in self.keys[i:i + 4]]
+            self.index[(pro_kp, campaign_id, intent, persona)] = i
+            campaigns.setdefault(pro_kp, set())
+            if campaign_id is not None:
+                campaigns[pro_kp].add(campaign_id)
+        self.campaigns = {pro_kp: frozenset(pro_kp_campaigns) for pro_kp, pro_kp_campaigns in campaigns.items()}
+
+    def rephrase(self, pro_kp, campaign_id, intent, persona):
+        offset = self.index.get(self.get_key(pro_kp, campaign_id, intent, persona))
+        if offset is None:
+            return self.connecting_text.rephrase(self.response_db.get_pro_kp_args(pro_kp, campaign_id),
+                                                 intent=intent, persona=persona)
+        start, count = self.keys[offset + 4], self.keys[offset + 5]
+        return [self.create_argument(recipe_id) for recipe_id in self.list_items[start:start + count]]
+
+    def create_argument(self, recipe_id):
+        offset = RECIPE_SIZE * recipe_id
+        kind = self.recipes[offset]
+        texts = [self.strings.get(string_id) for string_id in self.recipes[offset + 1:offset + RECIPE_SIZE]]
+        if kind == RECIPE_COMBINED:
+            return self.connecting_text.create_combined_argument(
+                (texts[0], texts[1]), Argument(text=texts[2], arg_type=texts[3]), (texts[4], texts[5]))
+        if kind == RECIPE_NO_CANNED_TEXT:
+            return self.connecting_text.create_no_canned_text_argument(Argument(text=texts[0], arg_type=texts[1]))
+        return self.connecting_text.create_full_argument(texts[0], texts[1], texts[2])
+
+    def get_size(self):
+        return sum(self.keys[offset + 5] for offset in self.index.values())
+
+    def get_memory_size(self):
+        # the store itself is shared
+        return get_deep_size(self.index)
+
+
+class ConnectingTextIndexML(LanguageML):
+
+    def __init__(self, response_db_ml, connecting_text_ml, language_codes, verify=False, shared_store=None):
+        self.response_db_ml = response_db_ml
+        self.connecting_text_ml = connecting_text_ml
+        self.verify = verify
+        self.shared_store = shared_store
+        super().__init__(language_codes)
+
+    def create(self, language_code):
+        start_time = time.time()
+        response_db = self.response_db_ml[language_code]
+        connecting_text = self.connecting_text_ml[language_code]
+        if self.shared_store is not None and self.shared_store['enabled']:
+            store = open_shared_store(self.shared_store['path'], 'connecting_text_index-%s' % language_code,
+                                      DBManager().get_content_version(),
+                                      lambda: serialize_index(ConnectingTextIndex(response_db, connecting_text)))
+            index = SharedConnectingTextIndex(response_db, connecting_text, store)
+        else:
+            index = ConnectingTextIndex(response_db, connecting_text)
+        logging.info('Connecting text index of %s: %d keys, %d arguments, %s (%.2fs)' %
+                     (language_code, len(index.index), index.get_size(), format_size(index.get_memory_size()),
+                      time.time() - start_time))
+        if self.verify:
+            index.verify()
+        return index
+
+    def get_size(self, item):
+        # the response db and the connecting text library are accounted for by their own components
+        return item.get_memory_size()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    language_codes = ['en']
+    index_ml = ConnectingTextIndexML(ResponseDBML(language_codes),
+                                     ConnectingTextLibraryML(False, language_codes), language_codes, verify=True)
+    for language_code in language_codes:
+        index_ml[language_code]
+
+
+if __name__ == "__main__":
+    main()
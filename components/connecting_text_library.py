@@ -7,6 +7,7 @@ from enum import Enum
 
 from tools.argument import Argument, GENERAL_ARG_TYPE
 from tools.db_manager import DBManager
+from tools.language_content import LanguageML
 from tools.argument import NO_CANNED_TEXT_TYPE
 import itertools
 
@@ -70,8 +71,13 @@ class ConnectingTextLibrary:
 
     # creating cartesian product of prefixes, arguments and suffixes
     def rephrase(self, arguments, intent, persona, init=False, both_prefix_and_suffix=False):
+        return [create_argument(*params) for create_argument, params in
+                self.get_rephrase_recipes(arguments, intent, persona, init, both_prefix_and_suffix)]
+
+    # returns how to create each of the rephrased arguments, as pairs of a create method and its params
+    def get_rephrase_recipes(self, arguments, intent, persona, init=False, both_prefix_and_suffix=False):
         intent_type = ConnectingTextType.from_str(intent)
-        new_args = []
+        recipes = []
         persona_intent_args = self.connecting_text_library[intent_type][persona]
         # handling separately responses that need canned text, and those that don't
         arguments_need_canned_text = [arg for arg in arguments if arg.type != NO_CANNED_TEXT_TYPE]
@@ -110,28 +116,34 @@ class ConnectingTextLibrary:
                                                                                 arg_type_arguments_need_canned_text,
                                                                                 suffixes)])
                 # converting to Argument object
-                new_args.extend([Argument(text=(arg[0][0] + self.lower_if_needed(arg[1].text,
-                                                                                 arg[0][0]) + arg[2][0]).strip(),
-                                          arg_type=arg[1].type,
-                                          base_response=arg[1].text,
-                                          canned_text=[arg[0][0], arg[2][0]],
-                                          expression=arg[0][1] if arg[0][1] != '' else arg[2][1])
-                                 for arg in cartesian_args])
+                recipes.extend([(self.create_combined_argument, arg) for arg in cartesian_args])
         # adding arguments that don't need canned text
-        new_args.extend([Argument(text=arg.text,
-                                  arg_type=arg.type, base_response=arg.text, canned_text=['', ''],
-                                  expression=DEFAULT_EXPRESSION)
-                         for arg in arguments_no_need_canned_text])
+        recipes.extend([(self.create_no_canned_text_argument, (arg,)) for arg in arguments_no_need_canned_text])
         # if no combination exists, take generic full responses (i.e., that do not use the response DB)
-        if len(new_args) == 0 or init:
+        if len(recipes) == 0 or init:
             for arg_type in persona_intent_args.keys():
                 # adding canned texts that don't need arguments
-                new_args.extend([Argument(text=arg, arg_type=arg_type,
-                                          base_response=arg,
-                                          canned_text=['', ''], expression=emoji) for arg, emoji
+                recipes.extend([(self.create_full_argument, (arg, arg_type, emoji)) for arg, emoji
                                 in persona_intent_args[arg_type]['full']]
-                                if 'full' in persona_intent_args[arg_type] else [])
-        return new_args
+                               if 'full' in persona_intent_args[arg_type] else [])
+        return recipes
+
+    def create_combined_argument(self, prefix, arg, suffix):
+        return Argument(text=(prefix[0] + self.lower_if_needed(arg.text, prefix[0]) + suffix[0]).strip(),
+                        arg_type=arg.type,
+                        base_response=arg.text,
+                        canned_text=[prefix[0], suffix[0]],
+                        expression=prefix[1] if prefix[1] != '' else suffix[1])
+
+    @classmethod
+    def create_no_canned_text_argument(cls, arg):
+        return Argument(text=arg.text, arg_type=arg.type, base_response=arg.text, canned_text=['', ''],
+                        expression=DEFAULT_EXPRESSION)
+
+    @classmethod
+    def create_full_argument(cls, text, arg_type, expression):
+        return Argument(text=text, arg_type=arg_type, base_response=text, canned_text=['', ''],
+                        expression=expression)
 
     def get_single_text(self, intent, persona):
         return self.rephrase([], intent['label'],
@@ -141,13 +153,13 @@ class ConnectingTextLibrary:
         return self.connecting_text_library[intent_type][persona]
 
 
-class ConnectingTextLibraryML:
+class ConnectingTextLibraryML(LanguageML):
     def __init__(self, advisory_mode, language_codes):
-        self.libraries = {language_code: ConnectingTextLibrary(advisory_mode, language_code)
-                          for language_code in language_codes}
+        self.advisory_mode = advisory_mode
+        super().__init__(language_codes)
 
-    def __getitem__(self, item):
-        return self.libraries[item]
+    def create(self, language_code):
+        return ConnectingTextLibrary(self.advisory_mode, language_code)
 
 
 def main():
@@ -3,47 +3,91 @@
 # SPDX-License-Identifier: Apache2.0
 #
 
+import asyncio
+import contextvars
+import logging
 import os
-import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from time import time
-from components.kp_matching import KpMatching
+from components.kp_matching import KpMatching, LocalKpMatcherML
 from components.response_selection import ResponseSelection
 from components.response_db import ResponseDBML
+from components.connecting_text_index import ConnectingTextIndexML
 from components.connecting_text_library import ConnectingTextLibraryML
+from components.embedding_scorer import EMBEDDING_MODEL, CandidateVectorsML, EmbeddingScorer
 from components.intent_detection import IntentDetection
 from components.persona_detection import PersonaDetection
 from components.concern_classifier import LexicalConcernClassifier
 from components.profanity_classifier import ProfanityClassifier
-from tools.db_manager import DBManager
+from tools.db_manager import DBManager, AsyncDBManager
 from tools.coref_resolution import SimpleCoRefResolution
 # from tools.code_generator import code_generator
+from tools.dialog_turn import DialogTurn
 from tools.kp_utils import KPUtilsML
+from tools.metrics import observe_stage_times
 from tools.opening_survey import OpeningSurveyML
+from tools.resilience import Resilience
 from tools.singleton import Singleton
+from tools.stage_timer import StageTimer
+from tools.text_analysis import analyze_text
 from tools.translator import WatsonTranslator
 
+# actions to take for a user text while the opening survey is on
+OPENING_SURVEY_CONTINUE = 'continue'
+OPENING_SURVEY_DISCONTINUE = 'discontinue'
+
 
 class DialogManager(metaclass=Singleton):
     RANDOM_SEED = 1024 * 1024
     DATA_DIR = os.path.join('data')
 
-    def __init__(self):
+    def __init__(self, classifier_executor=None):
         self.configuration = DBManager().read_configuration()
         self.advisory_mode = self.configuration.get_advisory_mode()
-        self.random_state = np.random.RandomState(self.RANDOM_SEED)
         self.response_db_ml = ResponseDBML(self.configuration.get_language_codes())
         self.kp_utils_ml = KPUtilsML(self.configuration.get_language_codes())
-        self.kp_matcher = KpMatching()
-        self.response_selector = ResponseSelection(self.random_state)
+        self.kp_matcher = self.create_kp_matcher()
         self.user_intent_detection = IntentDetection(self.advisory_mode, self.configuration, self.kp_utils_ml)
         self.connecting_text_ml = ConnectingTextLibraryML(self.advisory_mode['enabled'],
                                                           self.configuration.get_language_codes())
+        self.connecting_text_index_ml = self.create_connecting_text_index()
+        self.response_selector = ResponseSelection(self.RANDOM_SEED, self.create_candidate_scorer())
         self.persona_detection = PersonaDetection()
         self.coref_resolution = SimpleCoRefResolution()
         self.concern_classifier = LexicalConcernClassifier()
         self.profanity_classifier = ProfanityClassifier()
         self.opening_survey_ml = OpeningSurveyML(self.configuration, self.configuration.get_language_codes())
         self.watson_translator = WatsonTranslator(self.configuration)
+        # the executor is passed on to the next generation when the content is reloaded
+        classifier_fan_out = self.configuration.get_classifier_fan_out()
+        self.classifier_executor = classifier_executor if classifier_executor is not None else \
+            ThreadPoolExecutor(max_workers=classifier_fan_out['max_workers'], thread_name_prefix='classifier') \
+            if classifier_fan_out['enabled'] else None
+
+    def create_kp_matcher(self):
+        settings = self.configuration.get_local_kp_matching_settings()
+        if not settings['enabled']:
+            return KpMatching()
+        local_matcher_ml = LocalKpMatcherML(DBManager().read_kp_idx_mapping(), self.kp_utils_ml,
+                                            self.configuration.get_language_codes(), settings['n_features'])
+        return KpMatching(local_matcher_ml, settings)
+
+    def create_candidate_scorer(self):
+        # the random scorer is used by default
+        if self.configuration.get_model_name() != EMBEDDING_MODEL:
+            return None
+        settings = self.configuration.get_embedding_scorer_settings()
+        return EmbeddingScorer(CandidateVectorsML(self.response_db_ml, self.connecting_text_ml,
+                                                  self.configuration.get_language_codes(), settings['n_features']),
+                               settings)
+
+    def create_connecting_text_index(self):
+        settings = self.configuration.get_connecting_text_index_settings()
+        if not settings['enabled']:
+            return None
+        return ConnectingTextIndexML(self.response_db_ml, self.connecting_text_ml,
+                                     self.configuration.get_language_codes(), settings['verify'],
+                                     self.configuration.get_shared_content_store_settings())
 
     @classmethod
     def process_user_feedback(cls, session_id, message_id, feedback):
@@ -52,6 +96,13 @@ class DialogManager(metaclass=Singleton):
         DBManager().commit(dialog_data)
         return {'response': None}
 
+    @classmethod
+    async def async_process_user_feedback(cls, session_id, message_id, feedback):
+        dialog_data = await AsyncDBManager().get_dialog_data(session_id)
+        dialog_data.update_message_feedback(message_id, feedback)
+        await AsyncDBManager().commit(dialog_data)
+        return {'response': None}
+
     @classmethod
     def process_user_survey(cls, session_id, survey):
         dialog_data = DBManager().get_dialog_data(session_id)
@@ -59,17 +110,41 @@ class DialogManager(metaclass=Singleton):
         DBManager().commit(dialog_data)
         return {'response': None}
 
+    @classmethod
+    async def async_process_user_survey(cls, session_id, survey):
+        dialog_data = await AsyncDBManager().get_dialog_data(session_id)
+        dialog_data.set_survey(survey)
+        await AsyncDBManager().commit(dialog_data)
+        return {'response': None}
+
     def process_new_session(self, dialog_label, campaign_id, opening_survey_flow, platform, language_code):
+        language_code, opening_survey_flow = self.get_new_session_settings(opening_survey_flow, language_code)
+        response = self.process_user_text(session_id=None, user_arg_raw=None, feedback=False, answer=False,
+                                          disable_cache=False, dialog_label=dialog_label, campaign_id=campaign_id,
+                                          opening_survey_flow=opening_survey_flow, platform=platform,
+                                          language_code=language_code)
+        return self.add_new_session_settings(response, language_code)
+
+    async def async_process_new_session(self, dialog_label, campaign_id, opening_survey_flow, platform,
+                                        language_code):
+        language_code, opening_survey_flow = self.get_new_session_settings(opening_survey_flow, language_code)
+        response = await self.async_process_user_text(session_id=None, user_arg_raw=None, feedback=False,
+                                                      answer=False, disable_cache=False, dialog_label=dialog_label,
+                                                      campaign_id=campaign_id,
+                                                      opening_survey_flow=opening_survey_flow, platform=platform,
+                                                      language_code=language_code)
+        return self.add_new_session_settings(response, language_code)
+
+    def get_new_session_settings(self, opening_survey_flow, language_code):
         if language_code is None:
             language_code = self.configuration.get_default_language()
         if opening_survey_flow is None:
             opening_survey_flow = self.opening_survey_ml[language_code].get_default_flow()
         if opening_survey_flow not in self.opening_survey_ml[language_code].get_flows():
             raise ValueError('Invalid opening survey flow: [%s]' % opening_survey_flow)
-        response = self.process_user_text(session_id=None, user_arg_raw=None, feedback=False, answer=False,
-                                          disable_cache=False, dialog_label=dialog_label, campaign_id=campaign_id,
-                                          opening_survey_flow=opening_survey_flow, platform=platform,
-                                          language_code=language_code)
+        return language_code, opening_survey_flow
+
+    def add_new_session_settings(self, response, language_code):
         response['ui_texts'] = self.configuration.get_ui_texts(language_code)
         response['advisory_mode'] = self.advisory_mode['enabled']
         response['language_direction'] = self.configuration.get_language_direction(language_code)
@@ -77,9 +152,6 @@ class DialogManager(metaclass=Singleton):
 
     def process_opening_survey(self, dialog_data, answer, language_code):
 
-        # get the session id
-        session_id = str(dialog_data.get_dialog_id())
-
         # in case this is a response to a previous question
         if answer is not None:
             dialog_data.update_question_answer(answer)
@@ -98,34 +170,77 @@ class DialogManager(metaclass=Singleton):
             DBManager().commit(dialog_data)
 
             # submit survey question
-            response = {
-                'question': question['question'],
-                'choices': question['choices'],
-                "session_id": session_id,
-                'opening_survey': True,
-            }
+            response = self.create_survey_question_response(dialog_data, question)
         else:
-            # get the closing comment intent
-            survey_closing_intent = self.user_intent_detection.apply_to_opening_survey(
-                self.opening_survey_ml[language_code].get_survey_closing_intent())
+            text, post_survey_intent = self.close_opening_survey(language_code)
+
+            # switch to the normal dialog flow
+            response = self.process_user_text(str(dialog_data.get_dialog_id()), user_arg_raw=None, feedback=False,
+                                              answer=False, disable_cache=False, intent=post_survey_intent)
+
+            # add the survey closing comment
+            response['survey_response'] = text
+
+        return response
+
+    async def async_process_opening_survey(self, dialog_data, answer, language_code):
+
+        # in case this is a response to a previous question
+        if answer is not None:
+            dialog_data.update_question_answer(answer)
+
+            # sync to db
+            await AsyncDBManager().commit(dialog_data)
 
-            # create text for the system closing comment
-            connecting_text = self.connecting_text_ml[language_code]
-            text = connecting_text.rephrase([], intent=survey_closing_intent['label'], persona='general')[0].text
+        # get the next question
+        question = self.opening_survey_ml[language_code].get_next_question(dialog_data)
 
-            # get the intent for the dialog intro
-            post_survey_intent = self.user_intent_detection.apply_to_opening_survey(
-                self.opening_survey_ml[language_code].get_post_survey_intent())
+        if question:
+            # store the question in the dialog data
+            dialog_data.add_question(question)
+
+            # sync to db
+            await AsyncDBManager().commit(dialog_data)
+
+            # submit survey question
+            response = self.create_survey_question_response(dialog_data, question)
+        else:
+            text, post_survey_intent = self.close_opening_survey(language_code)
 
             # switch to the normal dialog flow
-            response = self.process_user_text(session_id, user_arg_raw=None, feedback=False, answer=False,
-                                              disable_cache=False, intent=post_survey_intent)
+            response = await self.async_process_user_text(str(dialog_data.get_dialog_id()), user_arg_raw=None,
+                                                          feedback=False, answer=False, disable_cache=False,
+                                                          intent=post_survey_intent)
 
             # add the survey closing comment
             response['survey_response'] = text
 
         return response
 
+    @classmethod
+    def create_survey_question_response(cls, dialog_data, question):
+        return {
+            'question': question['question'],
+            'choices': question['choices'],
+            "session_id": str(dialog_data.get_dialog_id()),
+            'opening_survey': True,
+        }
+
+    def close_opening_survey(self, language_code):
+        # get the closing comment intent
+        survey_closing_intent = self.user_intent_detection.apply_to_opening_survey(
+            self.opening_survey_ml[language_code].get_survey_closing_intent())
+
+        # create text for the system closing comment
+        connecting_text = self.connecting_text_ml[language_code]
+        text = connecting_text.rephrase([], intent=survey_closing_intent['label'], persona='general')[0].text
+
+        # get the intent for the dialog intro
+        post_survey_intent = self.user_intent_detection.apply_to_opening_survey(
+            self.opening_survey_ml[language_code].get_post_survey_intent())
+
+        return text, post_survey_intent
+
     def discontinue_opening_survey(self, dialog_data):
         # mark the opening survey of this session as discontinued
         dialog_data.set_opening_survey_discontinued()
@@ -150,164 +265,340 @@ class DialogManager(metaclass=Singleton):
         # sync to db
         DBManager().commit(dialog_data)
 
-    # con_arg => con_kp => pro_kp => pro_args
-    def process_user_text(self, session_id, user_arg_raw, feedback, answer, disable_cache,
-                          dialog_label=None, campaign_id=None, intent=None,
-                          opening_survey_flow=None, platform=None, language_code=None):
-        start_time = time()
+    async def async_discontinue_opening_survey(self, dialog_data):
+        # mark the opening survey of this session as discontinued
+        dialog_data.set_opening_survey_discontinued()
 
-        # retrieve the dialog data
-        dialog_data = DBManager().get_dialog_data(session_id, dialog_label, campaign_id,
-                                                  opening_survey_flow, platform, language_code)
+        # sync to db
+        await AsyncDBManager().commit(dialog_data)
 
-        if language_code is None:
-            language_code = dialog_data.get_language_code()
+        # get the session id
+        session_id = str(dialog_data.get_dialog_id())
 
-        response_db = self.response_db_ml[language_code]
+        # run with empty user text just for generating the messages
+        # array starting with an empty user message
+        await self.async_process_user_text(session_id, user_arg_raw=None, feedback=False,
+                                           answer=False, disable_cache=False)
 
-        campaign_id = dialog_data.get_campaign_id()
+        # read the updated dialog data
+        dialog_data = await AsyncDBManager().get_dialog_data(session_id)
 
+        # we won't show the system opening so mark it as hidden
+        dialog_data.set_skipped_system_opening()
+
+        # sync to db
+        await AsyncDBManager().commit(dialog_data)
+
+    def get_opening_survey_action(self, dialog_data, answer, language_code):
         # switch to the opening survey if its enabled and not over yet
         if self.opening_survey_ml[language_code].is_enabled() and \
                 not self.opening_survey_ml[language_code].discontinued(dialog_data):
             if self.opening_survey_ml[language_code].waiting_for_answer(dialog_data) and not answer:
                 # we waited for answer but the user sent a question/concern, so we
                 # discontinue the survey and after that handle the user input normally.
-                self.discontinue_opening_survey(dialog_data)
-
-                # re-read the dialog data since it was updated
-                dialog_data = DBManager().get_dialog_data(session_id)
+                return OPENING_SURVEY_DISCONTINUE
 
             elif self.opening_survey_ml[language_code].has_more_questions(dialog_data) or answer:
                 # we just started the chat, so we have more questions, or we are in the middle
                 # of the survey and still have more questions, or we don't have any more
                 # questions but the user sent an answer to the last question.
-                return self.process_opening_survey(dialog_data=dialog_data, answer=user_arg_raw,
-                                                   language_code=language_code)
+                return OPENING_SURVEY_CONTINUE
+        return None
+
+    # con_arg => con_kp => pro_kp => pro_args
+    def process_user_text(self, session_id, user_arg_raw, feedback, answer, disable_cache,
+                          dialog_label=None, campaign_id=None, intent=None,
+                          opening_survey_flow=None, platform=None, language_code=None):
+        stage_timer = StageTimer()
 
-        feedback_options = self.configuration.get_feedback_options(language_code)
+        # retrieve the dialog data
+        with stage_timer.stage('load'):
+            dialog_data = DBManager().get_dialog_data(session_id, dialog_label, campaign_id,
+                                                      opening_survey_flow, platform, language_code)
 
-        # extract the history as a list of strings and add the new user argument if it exists
-        dialog_history = dialog_data.get_history()
+        if language_code is None:
+            language_code = dialog_data.get_language_code()
 
-        system_argument_history = dialog_data.get_system_argument_history()
+        opening_survey_action = self.get_opening_survey_action(dialog_data, answer, language_code)
+        if opening_survey_action == OPENING_SURVEY_DISCONTINUE:
+            self.discontinue_opening_survey(dialog_data)
 
-        skip_kp_feedback = False
-        con_kp_candidates = None
-        con_kps = None
-        con_kp_scores = None
-        is_concern = False
-        is_profanity = False
-        # whether to request feedback or not
-        request_feedback = False
+            # re-read the dialog data since it was updated
+            dialog_data = DBManager().get_dialog_data(session_id)
+        elif opening_survey_action == OPENING_SURVEY_CONTINUE:
+            return self.process_opening_survey(dialog_data=dialog_data, answer=user_arg_raw,
+                                               language_code=language_code)
+
+        turn = DialogTurn(dialog_data, language_code, user_arg_raw, feedback, disable_cache, intent, stage_timer)
+
+        # the calls to the remote models of the turn share its time budget
+        with Resilience().turn_deadline():
+            if self.is_translation_needed(turn):
+                with stage_timer.stage('translation'):
+                    turn.user_arg_translated = self.watson_translator.translate(user_arg_raw, language_code)[0]
+
+            with stage_timer.stage('analysis'):
+                self.analyze_user_arg(turn)
+
+            self.detect_kps_and_intent(turn)
+
+        with stage_timer.stage('response'):
+            response = self.generate_response(turn)
+
+        # commit the changes in the dialog data to the database
+        with stage_timer.stage('commit'):
+            DBManager().commit(dialog_data)
+
+        observe_stage_times(stage_timer, language_code, turn.intent, time())
+
+        return response
+
+    async def async_process_user_text(self, session_id, user_arg_raw, feedback, answer, disable_cache,
+                                      dialog_label=None, campaign_id=None, intent=None,
+                                      opening_survey_flow=None, platform=None, language_code=None):
+        stage_timer = StageTimer()
+
+        # retrieve the dialog data
+        with stage_timer.stage('load'):
+            dialog_data = await AsyncDBManager().get_dialog_data(session_id, dialog_label, campaign_id,
+                                                                 opening_survey_flow, platform, language_code)
+
+        if language_code is None:
+            language_code = dialog_data.get_language_code()
+
+        opening_survey_action = self.get_opening_survey_action(dialog_data, answer, language_code)
+        if opening_survey_action == OPENING_SURVEY_DISCONTINUE:
+            await self.async_discontinue_opening_survey(dialog_data)
+
+            # re-read the dialog data since it was updated
+            dialog_data = await AsyncDBManager().get_dialog_data(session_id)
+        elif opening_survey_action == OPENING_SURVEY_CONTINUE:
+            return await self.async_process_opening_survey(dialog_data=dialog_data, answer=user_arg_raw,
+                                                           language_code=language_code)
+
+        turn = DialogTurn(dialog_data, language_code, user_arg_raw, feedback, disable_cache, intent, stage_timer)
+
+        # the calls to the remote models of the turn share its time budget
+        with Resilience().turn_deadline():
+            if self.is_translation_needed(turn):
+                with stage_timer.stage('translation'):
+                    turn.user_arg_translated = (await self.watson_translator.async_translate(user_arg_raw,
+                                                                                             language_code))[0]
+
+            with stage_timer.stage('analysis'):
+                self.analyze_user_arg(turn)
+
+            await self.async_detect_kps_and_intent(turn)
+
+        with stage_timer.stage('response'):
+            response = self.generate_response(turn)
+
+        # commit the changes in the dialog data to the database
+        with stage_timer.stage('commit'):
+            await AsyncDBManager().commit(dialog_data)
+
+        observe_stage_times(stage_timer, language_code, turn.intent, time())
+
+        return response
+
+    def is_translation_needed(self, turn):
+        return turn.user_arg_raw is not None and not turn.feedback and \
+            self.configuration.is_translator_enabled(turn.language_code)
+
+    def analyze_user_arg(self, turn):
+        stage_timer = turn.stage_timer
 
-        user_arg_translated = self.watson_translator.translate(user_arg_raw, language_code)[0] if \
-            user_arg_raw is not None and self.configuration.is_translator_enabled(language_code) and not feedback \
-            else user_arg_raw
         # apply co-ref resolution to the user-arg
-        user_arg = self.coref_resolution.apply(user_arg_translated) if user_arg_translated is not None else None
+        with stage_timer.stage('coref'):
+            if turn.user_arg_translated is not None:
+                # the text is analyzed once, and the analysis is shared by the rule based components
+                analysis = analyze_text(turn.user_arg_translated)
+                turn.user_arg = self.coref_resolution.apply(turn.user_arg_translated, analysis)
+                turn.user_arg_analysis = analysis if turn.user_arg == turn.user_arg_translated \
+                    else analyze_text(turn.user_arg)
 
         # if the user arg is a feedback, it can be either a kp or
         # 'none of the above' or 'not a concern'. in that case we
         # handle the intent and con_kp as a special case. if the
         # user arg is not a feedback (and not none) we apply the
         # kp-matching and intent detection.
-        con_kp = None
-        if feedback:
-            intent, new_kp = self.user_intent_detection.apply_to_feedback(feedback_options, user_arg_raw,
-                                                                          dialog_data.dialog_data, language_code)
+        if turn.feedback:
+            feedback_options = self.configuration.get_feedback_options(turn.language_code)
+            turn.intent, new_kp = self.user_intent_detection.apply_to_feedback(
+                feedback_options, turn.user_arg_raw, turn.dialog_data.dialog_data, turn.language_code)
             if new_kp:
                 # if the feedback is a new kp, we first need
                 # to apply reversed-mapping from a question
                 # form to the normal norm.
-                con_kp = self.kp_utils_ml[language_code].get_kp_by_qform(user_arg_raw)
-                is_concern = True
-                request_feedback = True
-        else:
-            if user_arg is not None:
-                dialog_history.append(user_arg)
-
-                # check if we have a profanity in the text
-                is_profanity = self.profanity_classifier.apply(user_arg)
-
-                if not is_profanity:
-
-                    # check if we have a concern in the user-arg
-                    is_concern = self.concern_classifier.apply(user_arg, dialog_data)
-
-                    if is_concern:
-                        if self.advisory_mode['enabled']:
-                            request_feedback = True
-
-                            # determine the number of kps and get the top k
-                            n_candidates = self.advisory_mode['candidates']
-                            con_kps, con_kp_scores = self.kp_matcher.get_top_k_kps(arg=user_arg, k=n_candidates,
-                                                                                   disable_cache=disable_cache,
-                                                                                   response_db_kps=response_db.get_con_kps())
-
-                            # if our top kp is above the confidence threshold
-                            # we will use it in the response
-                            if self.kp_matcher.is_confident(con_kp_scores[0]):
-                                con_kp = con_kps[0]
-
-                            # detect intent, context is a list of all utterances except the last user_arg
-                            intent = self.user_intent_detection.apply(user_arg,
-                                                                      dialog_data=dialog_data.dialog_data,
-                                                                      disable_cache=disable_cache,
-                                                                      con_kp=con_kp)
-
-                            if con_kp is None:
-                                # if no kp is above the confidence threshold, and the intent type is
-                                # of no response (e.g. "I'm sorry I didn't understand"), then there
-                                # is no point in asking the user to tell if the kp is to the point or not.
-                                if self.user_intent_detection.check_no_response_intent(intent):
-                                    skip_kp_feedback = True
-
-                                # for specific intent types, we don't want to ask for any feedback
-                                if self.user_intent_detection.no_feedback_intent(intent):
-                                    request_feedback = False
-                            # transform the candidates to question form
-                            con_kp_candidates = self.kp_utils_ml[language_code].get_kps_qform(con_kps)
-
-                            # add the common feedback options ('no concern', 'none of the above')
-                            for option in feedback_options:
-                                if option['candidate'] and (not option['location_specific'] or campaign_id is not None):
-                                    con_kp_candidates.append(option['text'])
-                        else:
-                            # in normal mode, we just pick the kp with the highest likelihood.
-                            con_kps, con_kp_scores = self.kp_matcher.get_top_k_kps(user_arg, 1, disable_cache)
-                            if self.kp_matcher.is_confident(con_kp_scores[0]):
-                                con_kp = con_kps[0]
-
-            if intent is None:
-                intent = self.user_intent_detection.apply(user_arg,
-                                                          dialog_data=dialog_data.dialog_data,
-                                                          disable_cache=disable_cache,
-                                                          is_concern=is_concern, con_kp=con_kp,
-                                                          is_profanity=is_profanity)
+                turn.con_kp = self.kp_utils_ml[turn.language_code].get_kp_by_qform(turn.user_arg_raw)
+                turn.is_concern = True
+                turn.request_feedback = True
+        elif turn.user_arg is not None:
+            turn.dialog_history.append(turn.user_arg)
+
+            # check if we have a profanity in the text
+            with stage_timer.stage('profanity'):
+                turn.is_profanity = self.profanity_classifier.apply(turn.user_arg, turn.user_arg_analysis)
+
+            if not turn.is_profanity:
+
+                # check if we have a concern in the user-arg
+                with stage_timer.stage('concern'):
+                    turn.is_concern = self.concern_classifier.apply(turn.user_arg, turn.dialog_data,
+                                                                    turn.user_arg_analysis)
+                turn.match_kps = turn.is_concern
+
+    def is_classifier_fan_out(self, turn):
+        # the intent classifier is needed only if the intent is not given and
+        # not detected by a rule, and in a concern turn it is independent of the
+        # kp matching, so both remote classifiers can be called concurrently.
+        return turn.match_kps and turn.intent is None and 'messages' in turn.dialog_data.dialog_data
+
+    def detect_kps_and_intent(self, turn):
+        stage_timer = turn.stage_timer
+        if self.classifier_executor is not None and self.is_classifier_fan_out(turn):
+            # the classifier runs in a copy of the context of the turn, so it shares its deadline
+            classifier_intent_future = self.classifier_executor.submit(
+                contextvars.copy_context().run,
+                stage_timer.timed('intent', self.user_intent_detection.intent_classifier.apply),
+                user_arg=turn.user_arg, disable_cache=turn.disable_cache)
+            with stage_timer.stage('kp_matching'):
+                self.set_matched_kps(turn, *self.kp_matcher.get_top_k_kps(**self.get_kp_matching_args(turn)))
+
+            # the rule-based intents depend on the kp, so they are applied once both classifiers returned
+            turn.intent = self.user_intent_detection.apply_with_classifier_intent(
+                classifier_intent_future.result(), **self.get_intent_detection_args(turn))
+            return
+
+        if turn.match_kps:
+            with stage_timer.stage('kp_matching'):
+                self.set_matched_kps(turn, *self.kp_matcher.get_top_k_kps(**self.get_kp_matching_args(turn)))
+
+        if turn.intent is None:
+            with stage_timer.stage('intent'):
+                turn.intent = self.user_intent_detection.apply(**self.get_intent_detection_args(turn))
+
+    async def async_detect_kps_and_intent(self, turn):
+        stage_timer = turn.stage_timer
+        if self.is_classifier_fan_out(turn):
+            (con_kps, con_kp_scores), classifier_intent = await asyncio.gather(
+                stage_timer.async_timed('kp_matching', self.kp_matcher.async_get_top_k_kps(
+                    **self.get_kp_matching_args(turn))),
+                stage_timer.async_timed('intent', self.user_intent_detection.intent_classifier.async_apply(
+                    user_arg=turn.user_arg, disable_cache=turn.disable_cache)))
+            self.set_matched_kps(turn, con_kps, con_kp_scores)
+
+            # the rule-based intents depend on the kp, so they are applied once both classifiers returned
+            turn.intent = self.user_intent_detection.apply_with_classifier_intent(
+                classifier_intent, **self.get_intent_detection_args(turn))
+            return
+
+        if turn.match_kps:
+            with stage_timer.stage('kp_matching'):
+                self.set_matched_kps(turn, *await self.kp_matcher.async_get_top_k_kps(
+                    **self.get_kp_matching_args(turn)))
+
+        if turn.intent is None:
+            with stage_timer.stage('intent'):
+                turn.intent = await self.user_intent_detection.async_apply(**self.get_intent_detection_args(turn))
+
+    def get_kp_matching_args(self, turn):
+        if self.advisory_mode['enabled']:
+            # determine the number of kps and get the top k
+            return {
+                'arg': turn.user_arg,
+                'k': self.advisory_mode['candidates'],
+                'disable_cache': turn.disable_cache,
+                'response_db_kps': self.response_db_ml[turn.language_code].get_con_kps(),
+                'language_code': turn.language_code,
+            }
+        # in normal mode, we just pick the kp with the highest likelihood.
+        return {'arg': turn.user_arg, 'k': 1, 'disable_cache': turn.disable_cache,
+                'language_code': turn.language_code}
 
-        # get manual mapped pro_kp
-        pro_kp = response_db.get_pro_kp_mapping(con_kp)
+    def set_matched_kps(self, turn, con_kps, con_kp_scores):
+        turn.con_kps, turn.con_kp_scores = con_kps, con_kp_scores
 
-        # detect user persona
-        persona = self.persona_detection.apply(user_arg, dialog_history)
+        # if our top kp is above the confidence threshold
+        # we will use it in the response
+        if len(con_kp_scores) > 0 and self.kp_matcher.is_confident(con_kp_scores[0]):
+            turn.con_kp = con_kps[0]
 
-        # record the user argument and associated kp and intent in the db
-        dialog_data.add_user_input(text=user_arg, keypoint=con_kp, intent=intent,
-                                   feedback=feedback, orig_text=user_arg_raw,
-                                   is_concern=is_concern, is_profanity=is_profanity,
-                                   orig_translated_text=user_arg_translated)
+    @classmethod
+    def get_intent_detection_args(cls, turn):
+        # detect intent, context is a list of all utterances except the last user_arg
+        return {
+            'user_arg': turn.user_arg,
+            'dialog_data': turn.dialog_data.dialog_data,
+            'disable_cache': turn.disable_cache,
+            'is_concern': turn.is_concern,
+            'con_kp': turn.con_kp,
+            'is_profanity': turn.is_profanity,
+        }
 
-        # get the arguments of the pro_kp
-        pro_args = response_db.get_pro_kp_args(pro_kp, campaign_id)
+    def add_kp_feedback_request(self, turn):
+        turn.request_feedback = True
 
-        # create argument combinations
-        connecting_text = self.connecting_text_ml[language_code]
-        rephrased_arguments = connecting_text.rephrase(pro_args, intent=intent['label'], persona=persona)
+        if turn.con_kp is None:
+            # if no kp is above the confidence threshold, and the intent type is
+            # of no response (e.g. "I'm sorry I didn't understand"), then there
+            # is no point in asking the user to tell if the kp is to the point or not.
+            if self.user_intent_detection.check_no_response_intent(turn.intent):
+                turn.skip_kp_feedback = True
+
+            # for specific intent types, we don't want to ask for any feedback
+            if self.user_intent_detection.no_feedback_intent(turn.intent):
+                turn.request_feedback = False
+
+        # transform the candidates to question form
+        turn.con_kp_candidates = self.kp_utils_ml[turn.language_code].get_kps_qform(turn.con_kps)
+
+        # add the common feedback options ('no concern', 'none of the above')
+        for option in self.configuration.get_feedback_options(turn.language_code):
+            if option['candidate'] and (not option['location_specific'] or
+                                        turn.dialog_data.get_campaign_id() is not None):
+                turn.con_kp_candidates.append(option['text'])
+
+    def generate_response(self, turn):
+        dialog_data = turn.dialog_data
+        language_code = turn.language_code
+        response_db = self.response_db_ml[language_code]
+        campaign_id = dialog_data.get_campaign_id()
+        intent = turn.intent
+
+        if turn.match_kps and self.advisory_mode['enabled']:
+            self.add_kp_feedback_request(turn)
 
-        # select the argument by questioning a parlai model
-        selected_argument, candidates, scores, orig_scores = \
-            self.response_selector.apply(rephrased_arguments, dialog_history, system_argument_history)
+        # get manual mapped pro_kp
+        pro_kp = response_db.get_pro_kp_mapping(turn.con_kp)
+
+        # detect user persona
+        persona = self.persona_detection.apply(turn.user_arg, turn.dialog_history)
+
+        # record the user argument and associated kp and intent in the db
+        dialog_data.add_user_input(text=turn.user_arg, keypoint=turn.con_kp, intent=intent,
+                                   feedback=turn.feedback, orig_text=turn.user_arg_raw,
+                                   is_concern=turn.is_concern, is_profanity=turn.is_profanity,
+                                   orig_translated_text=turn.user_arg_translated)
+
+        # create the combinations of the arguments of the pro_kp with the connecting texts
+        with turn.stage_timer.stage('rephrase'):
+            if self.connecting_text_index_ml is not None:
+                rephrased_arguments = self.connecting_text_index_ml[language_code].rephrase(
+                    pro_kp, campaign_id, intent['label'], persona)
+            else:
+                pro_args = response_db.get_pro_kp_args(pro_kp, campaign_id)
+                rephrased_arguments = self.connecting_text_ml[language_code].rephrase(
+                    pro_args, intent=intent['label'], persona=persona)
+
+        # select the argument by questioning a parlai model. the random choices of the selection
+        # depend only on the session and the message id of the response, so they can be replayed
+        with turn.stage_timer.stage('selection'):
+            rng = self.response_selector.create_rng(dialog_data.get_dialog_id(), len(dialog_data.get_messages()))
+            selected_argument, candidates, scores, orig_scores = \
+                self.response_selector.apply(rephrased_arguments, turn.dialog_history,
+                                             turn.system_argument_history, rng, dialog_data.get_dialog_id(),
+                                             language_code)
 
         # extract the internal data
         base_response = selected_argument.base_response
@@ -317,27 +608,27 @@ class DialogManager(metaclass=Singleton):
 
         end_time = time()
 
+        logging.debug('Stage times: %s' % turn.stage_timer.get_stage_times())
+
         # record the system response and associated kp in the db
         message_id = dialog_data.add_system_response(
             text=full_response, base_response=base_response, keypoint=pro_kp, candidates=candidates,
-            scores=scores, orig_scores=orig_scores, canned_text=canned_text, processing_time=(end_time - start_time),
-            is_concern=is_concern, request_feedback=request_feedback, skip_kp_feedback=skip_kp_feedback,
-            keypoint_candidates=con_kps, keypoint_candidates_qform=con_kp_candidates)
+            scores=scores, orig_scores=orig_scores, canned_text=canned_text,
+            processing_time=(end_time - turn.stage_timer.start_time), is_concern=turn.is_concern,
+            request_feedback=turn.request_feedback, skip_kp_feedback=turn.skip_kp_feedback,
+            keypoint_candidates=turn.con_kps, keypoint_candidates_qform=turn.con_kp_candidates)
 
         # determine if we should end the dialog here
         code_msg = None
         code = None
 
-        # commit the changes in the dialog data to the database
-        DBManager().commit(dialog_data)
-
         # whether to request feedback or not
-        request_feedback = message_id > 1 and request_feedback
+        request_feedback = message_id > 1 and turn.request_feedback
 
         return {
-            'text_translated': user_arg_translated if user_arg_translated is not None else '',
-            'text': user_arg_raw,
-            'con_kp': con_kp if con_kp is not None else '',
+            'text_translated': turn.user_arg_translated if turn.user_arg_translated is not None else '',
+            'text': turn.user_arg_raw,
+            'con_kp': turn.con_kp if turn.con_kp is not None else '',
             'pro_kp': pro_kp if pro_kp is not None else '',
             'pro_arg': base_response,
             'response': full_response,
@@ -347,11 +638,11 @@ class DialogManager(metaclass=Singleton):
             "message_id": message_id,
             "session_id": str(dialog_data.get_dialog_id()),
             "request_feedback": request_feedback,
-            'con_kps': con_kps,
-            'con_kp_scores': con_kp_scores,
-            "con_kp_candidates": con_kp_candidates,
-            "skip_kp_feedback": skip_kp_feedback,
+            'con_kps': turn.con_kps,
+            'con_kp_scores': turn.con_kp_scores,
+            "con_kp_candidates": turn.con_kp_candidates,
+            "skip_kp_feedback": turn.skip_kp_feedback,
             "expression": expression,
-            "is_concern": is_concern,
-            "is_profanity": is_profanity,
+            "is_concern": turn.is_concern,
+            "is_profanity": turn.is_profanity,
         }
@@ -0,0 +1,119 @@
+#
+# Copyright 2020-2023 IBM Inc. All rights reserved
+# SPDX-License-Identifier: Apache2.0
+#
+
+import numpy as np
+
+from tools.language_content import LanguageML
+from tools.lru_cache import LRUCache
+from tools.metrics import count_cache_lookup
+from tools.text_vectorizer import HashingVectorizer, normalize
+
+EMBEDDING_MODEL = "embedding"
+EMBEDDING_SCORE_SCALE = 10
+
+
+class CandidateVectors:
+    # the vectors of the texts the candidates of a language are made of: the responses of the
+    # response db (with their campaign links) and the canned texts. the vector of a candidate is
+    # the sum of the vectors of its base response and its canned texts.
+
+    def __init__(self, response_db, connecting_text, n_features):
+        texts = set()
+        for pro_kp in response_db.get_pro_kps():
+            for campaign_id in [None] + response_db.get_pro_kp_campaigns(pro_kp):
+                texts.update(arg.base_response for arg in response_db.get_pro_kp_args(pro_kp, campaign_id))
+        for personas in connecting_text.connecting_text_library.values():
+            for arg_types in personas.values():
+                for positions in arg_types.values():
+                    for canned_texts in positions.values():
+                        texts.update(text for text, _ in canned_texts)
+        texts.discard('')
+        # the empty text is the zero vector at row 0
+        texts = [''] + sorted(texts)
+        self.vectorizer = HashingVectorizer(n_features).fit(texts[1:])
+        self.rows = {text: i for i, text in enumerate(texts)}
+        self.vectors = self.vectorizer.transform(texts)
+
+    def get_text_vectors(self, texts):
+        rows = [self.rows.get(text, -1) for text in texts]
+        vectors = self.vectors[rows]
+        # texts that were not known at load time are vectorized on the fly
+        missing = [i for i, row in enumerate(rows) if row == -1]
+        if len(missing) > 0:
+            vectors[missing] = self.vectorizer.transform([texts[i] for i in missing])
+        return vectors
+
+    def get_candidate_vectors(self, candidates):
+        vectors = self.get_text_vectors([c.base_response for c in candidates])
+        n_canned_texts = max([len(c.canned_text or []) for c in candidates], default=0)
+        for j in range(n_canned_texts):
+            vectors += self.get_text_vectors([c.canned_text[j] if j < len(c.canned_text or []) else ''
+                                              for c in candidates])
+        return vectors
+
+    def get_size(self):
+        return self.vectors.nbytes
+
+
+class CandidateVectorsML(LanguageML):
+
+    def __init__(self, response_db_ml, connecting_text_ml, language_codes, n_features):
+        self.response_db_ml = response_db_ml
+        self.connecting_text_ml = connecting_text_ml
+        self.n_features = n_features
+        super().__init__(language_codes)
+
+    def create(self, language_code):
+        return CandidateVectors(self.response_db_ml[language_code], self.connecting_text_ml[language_code],
+                                self.n_features)
+
+    def get_size(self, item):
+        return item.get_size()
+
+
+class HistoryEncoder:
+    # encodes the dialog history as an exponentially decaying sum of the normalized vectors of its
+    # texts, so the recent texts weigh the most. the history only grows during a session, so the
+    # encoding of each session is cached, and only the texts added since are encoded on the next turn.
+
+    def __init__(self, decay, cache_size, cache_ttl):
+        self.decay = decay
+        self.cache = LRUCache(max_size=cache_size, ttl=cache_ttl, idle_ttl=True)
+
+    def encode(self, session_id, chat_history, candidate_vectors):
+        n_texts, encoding = 0, None
+        entry = self.cache.get(session_id) if session_id is not None else None
+        if entry is not None and entry[0] <= len(chat_history) and chat_history[entry[0] - 1] == entry[1]:
+            n_texts, _, encoding = entry
+        count_cache_lookup('history_encoding', n_texts > 0)
+        new_texts = chat_history[n_texts:]
+        if len(new_texts) > 0:
+            vectors = normalize(candidate_vectors.vectorizer.transform(new_texts))
+            weights = self.decay ** np.arange(len(new_texts) - 1, -1, -1, dtype=np.float32)
+            new_encoding = weights @ vectors
+            encoding = new_encoding if encoding is None else \
+                encoding * (self.decay ** len(new_texts)) + new_encoding
+        if session_id is not None and len(chat_history) > 0:
+            self.cache.put(session_id, (len(chat_history), chat_history[-1], encoding))
+        return encoding
+
+
+class EmbeddingScorer:
+    # scores the candidates by the cosine similarity of their vectors to the encoding of the dialog
+    # history, all the candidates of a turn in a single matrix product. the similarity is scaled to
+    # [0, EMBEDDING_SCORE_SCALE], so the recency factors of the response selection reduce the scores.
+
+    def __init__(self, candidate_vectors_ml, settings):
+        self.candidate_vectors_ml = candidate_vectors_ml
+        self.history_encoder = HistoryEncoder(settings['history_decay'], settings['session_cache_size'],
+                                              settings['session_cache_ttl'])
+
+    def score(self, chat_history, candidates, rng, session_id=None, language_code=None):
+        candidate_vectors = self.candidate_vectors_ml[language_code]
+        encoding = self.history_encoder.encode(session_id, chat_history, candidate_vectors)
+        similarities = normalize(candidate_vectors.get_candidate_vectors(candidates)) @ normalize(encoding)
+        return {'text_candidates': [c.text for c in candidates],
+                'cand_scores': (EMBEDDING_SCORE_SCALE * (1 + similarities) / 2).tolist(),
+                'descending': True}
@@ -3,15 +3,24 @@
 # SPDX-License-Identifier: Apache2.0
 #
 
+import json
+import logging
 import re
 from abc import abstractmethod
 
 from assessment.operators import none_of_kps_intent, has_kp
+from tools.batch_processing import apply_batch
 from tools.db_manager import DBManager
-from tools.service_utils import get_scores
+from tools.metrics import count_classifier_fallback
+from tools.resilience import Resilience
+from tools.scores_cache import ScoresCache
+from tools.service_utils import get_scores, async_get_scores
 
 what_else_regex = re.compile(r'what (else|other)[\w\d\s]*\?$', re.IGNORECASE)
 
+# the rule based intents look at the last RULES_CONTEXT_SIZE messages of the dialog at most
+RULES_CONTEXT_SIZE = 4
+
 
 class RuleBasedIntent:
 
@@ -80,6 +89,28 @@ class Profanity(RuleBasedIntent):
         return "PROFANITY"
 
 
+class RuleBasedIntents:
+    # the rule based intents, applied in order. the first that applies is the intent.
+
+    def __init__(self, rules):
+        self.rules = rules
+
+    def apply(self, context, **kwargs):
+        for rule in self.rules:
+            if rule.apply(dialog_data=context, **kwargs):
+                return create_intent(rule.get_name(), score=1.0, source='context_rule')
+        return None
+
+    # applies the rules to a list of (context, kwargs)
+    def apply_many(self, items):
+        return [self.apply(context, **kwargs) for context, kwargs in items]
+
+
+def get_rules_input_key(context, kwargs):
+    # the inputs that are identical in what the rules see are applied once
+    return json.dumps([context[-RULES_CONTEXT_SIZE:], kwargs], sort_keys=True, default=str)
+
+
 intent_classes = ['greeting', 'farewell', 'negative_reaction', 'positive_reaction', 'concern', 'query', 'default']
 
 
@@ -100,9 +131,31 @@ class IntentClassifierClient:
         configuration = DBManager().read_configuration()
         self.url = configuration.get_intent_classifier_endpoint()
         self.confidence = configuration.get_intent_classifier_confidence()
+        ScoresCache().set_fingerprint('intent_classifier', {'configuration': configuration.data})
 
     def apply(self, user_arg, disable_cache):
-        intents, intent_scores = get_scores(self.url, user_arg, disable_cache)
+        try:
+            intents, intent_scores = get_scores(self.url, user_arg, disable_cache)
+        except Exception as e:
+            return self.create_fallback_intent(e)
+        return self.create_classifier_intent(intents, intent_scores)
+
+    async def async_apply(self, user_arg, disable_cache):
+        try:
+            intents, intent_scores = await async_get_scores(self.url, user_arg, disable_cache)
+        except Exception as e:
+            return self.create_fallback_intent(e)
+        return self.create_classifier_intent(intents, intent_scores)
+
+    # when the classifier fails, the turn continues as if no intent was identified
+    def create_fallback_intent(self, e):
+        if not Resilience().fallbacks:
+            raise e
+        logging.warning('Falling back from the intent classifier at %s: %s' % (self.url, repr(e)))
+        count_classifier_fallback(self.url)
+        return create_intent(intent_classes[-1], score=1, source='fallback')
+
+    def create_classifier_intent(self, intents, intent_scores):
         if intent_scores[0] > self.confidence:
             return create_intent(label=intents[0], score=intent_scores[0], source='classifier')
         return create_intent(intent_classes[-1], score=1, source='classifier')
@@ -114,23 +167,44 @@ class IntentDetection:
         self.intent_classifier = IntentClassifierClient()
         self.advisory_mode = advisory_mode
         self.configuration = configuration
-        self.rule_based_intents = [Profanity(),
-                                   SameKPTwiceInARow(),
-                                   TwoNoneOfTheAboveInARow(),
-                                   NoConcernAfterWhatElseConcernsQuestion()]
+        self.rule_based_intents = RuleBasedIntents([Profanity(),
+                                                    SameKPTwiceInARow(),
+                                                    TwoNoneOfTheAboveInARow(),
+                                                    NoConcernAfterWhatElseConcernsQuestion()])
         self.kp_utils_ml = kp_utils_ml
 
     def apply(self, user_arg, dialog_data, disable_cache, **kwargs):
+        intent = self.apply_local_intents(user_arg, dialog_data, **kwargs)
+        # dip intent classification
+        if intent is None and 'messages' in dialog_data:
+            intent = self.intent_classifier.apply(user_arg=user_arg, disable_cache=disable_cache)
+        intent = self.modify_label(intent, kwargs['con_kp'])
+        return intent
+
+    async def async_apply(self, user_arg, dialog_data, disable_cache, **kwargs):
+        intent = self.apply_local_intents(user_arg, dialog_data, **kwargs)
+        # dip intent classification
+        if intent is None and 'messages' in dialog_data:
+            intent = await self.intent_classifier.async_apply(user_arg=user_arg, disable_cache=disable_cache)
+        intent = self.modify_label(intent, kwargs['con_kp'])
+        return intent
+
+    # completes the detection given an intent that was already obtained from the classifier
+    def apply_with_classifier_intent(self, classifier_intent, user_arg, dialog_data, **kwargs):
+        intent = self.apply_local_intents(user_arg, dialog_data, **kwargs)
+        if intent is None and 'messages' in dialog_data:
+            intent = classifier_intent
+        intent = self.modify_label(intent, kwargs['con_kp'])
+        return intent
+
+    # intents that are detected without calling the classifier
+    def apply_local_intents(self, user_arg, dialog_data, **kwargs):
         intent = None
         if user_arg is None:
             intent = create_intent('INTRO_DISCUSSION', score=1)
         # rule-based intents
         if intent is None and 'messages' in dialog_data:
             intent = self.apply_rule_based_intents(context=dialog_data['messages'], **kwargs)
-        # dip intent classification
-        if intent is None and 'messages' in dialog_data:
-            intent = self.intent_classifier.apply(user_arg=user_arg, disable_cache=disable_cache)
-        intent = self.modify_label(intent, kwargs['con_kp'])
         return intent
 
     def apply_to_opening_survey(self, intent_name):
@@ -152,10 +226,16 @@ class IntentDetection:
         raise ValueError("Intent unrecognized in [%s]" % user_arg)
 
     def apply_rule_based_intents(self, context, **kwargs):
-        for rule in self.rule_based_intents:
-            if rule.apply(dialog_data=context, **kwargs):
-                return create_intent(rule.get_name(), score=1.0, source='context_rule')
-        return None
+        return self.rule_based_intents.apply(context, **kwargs)
+
+    # applies the rule based intents to a batch of contexts, each with the kwargs of its rules
+    def apply_rule_based_intents_batch(self, contexts, kwargs_list, n_processes=1):
+        items = list(zip(contexts, kwargs_list))
+        intents = apply_batch(self.rule_based_intents, 'apply_many', items,
+                              keys=[get_rules_input_key(context, kwargs) for context, kwargs in items],
+                              n_processes=n_processes)
+        # identical inputs share their intent, and the intents are modified by the detection
+        return [dict(intent) if intent is not None else None for intent in intents]
 
     # modify the label if:
     # 1) there is no intent detected, but there is a con kp (so there is content)
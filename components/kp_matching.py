@@ -3,20 +3,75 @@
 # SPDX-License-Identifier: Apache2.0
 #
 
+import logging
+import random
+
 import numpy as np
 from tools.db_manager import DBManager
-from tools.service_utils import get_scores
+from tools.language_content import LanguageML
+from tools.metrics import count_kp_matching, count_kp_matching_agreement, count_classifier_fallback
+from tools.resilience import Resilience
+from tools.scores_cache import ScoresCache
+from tools.service_utils import get_batch_scores, get_scores, async_get_scores
+from tools.text_vectorizer import HashingVectorizer, normalize
 import pandas as pd
 
+# the number of args sent in each batch request by match_to_existing_kps
+MATCH_BATCH_SIZE = 32
+
+
+class LocalKpMatcher:
+    # a nearest neighbour index of the kps over their texts and their question forms in a language.
+    # the score of a kp is the highest cosine similarity of the user text to one of its texts.
+
+    def __init__(self, kps, kp_to_qform, n_features):
+        self.kps = kps
+        texts = []
+        text_kps = []
+        for i, kp in enumerate(kps):
+            for text in sorted({kp, kp_to_qform.get(kp, kp)}):
+                texts.append(text)
+                text_kps.append(i)
+        self.text_kps = np.array(text_kps)
+        self.vectorizer = HashingVectorizer(n_features).fit(texts)
+        self.vectors = normalize(self.vectorizer.transform(texts))
+
+    # returns all the kps and their scores, sorted by score
+    def match(self, arg):
+        similarities = self.vectors @ normalize(self.vectorizer.transform([arg]))[0]
+        kp_scores = np.zeros(len(self.kps), dtype=np.float32)
+        np.maximum.at(kp_scores, self.text_kps, similarities)
+        kp_ids = np.argsort(-kp_scores, kind='stable')
+        return [self.kps[i] for i in kp_ids], kp_scores[kp_ids].tolist()
+
+
+class LocalKpMatcherML(LanguageML):
+
+    def __init__(self, kps, kp_utils_ml, language_codes, n_features):
+        self.kps = kps
+        self.kp_utils_ml = kp_utils_ml
+        self.n_features = n_features
+        super().__init__(language_codes)
+
+    def create(self, language_code):
+        return LocalKpMatcher(self.kps, self.kp_utils_ml[language_code].kp_to_qform, self.n_features)
+
 
 class KpMatching:
+    # matches the user text to the kps using the remote kp matching model. if a local matcher is
+    # given, texts it matches with high confidence are answered locally, and only the ambiguous ones
+    # (and a sample of the others, to measure the agreement of the matchers) are matched remotely.
 
-    def __init__(self):
+    def __init__(self, local_matcher_ml=None, local_settings=None):
 
         configuration = DBManager().read_configuration()
         self.url = configuration.get_kp_matching_endpoint()
         self.confidence = configuration.get_kp_matching_confidence()
         self.idx_to_label = DBManager().read_kp_idx_mapping()
+        self.local_matcher_ml = local_matcher_ml
+        self.local_settings = local_settings
+        ScoresCache().set_fingerprint('kp_matching', {'configuration': configuration.data,
+                                                      'kp_idx_mapping': self.idx_to_label})
 
     def get_kps(self, indices):
         return [self.idx_to_label[i] for i in indices]
@@ -31,8 +86,68 @@ class KpMatching:
         kp_scores = [kp_score for i, kp_score in enumerate(kp_scores) if i not in not_supported_ids]
         return kps, kp_scores
 
-    def get_top_k_kps(self, arg, k, disable_cache, response_db_kps=None):
-        kps, kp_scores = get_scores(self.url, arg, disable_cache)
+    def is_local_confident(self, kp_scores):
+        return len(kp_scores) > 0 and kp_scores[0] >= self.local_settings['min_similarity'] and \
+            (len(kp_scores) < 2 or kp_scores[0] - kp_scores[1] >= self.local_settings['min_margin'])
+
+    # returns the local match (kps, scores, whether it is confident), or None without a local matcher
+    def get_local_match(self, arg, response_db_kps, language_code):
+        if self.local_matcher_ml is None or language_code is None:
+            return None
+        kps, kp_scores = self.local_matcher_ml[language_code].match(arg)
+        if response_db_kps is not None:
+            kps, kp_scores = self.remove_kps_not_in_response_db(kps, kp_scores, response_db_kps)
+        return kps, kp_scores, self.is_local_confident(kp_scores)
+
+    def is_local_answer(self, local_match):
+        return local_match is not None and local_match[2] and random.random() >= self.local_settings['shadow_rate']
+
+    def count_remote_match(self, local_match, kps, kp_scores, response_db_kps):
+        count_kp_matching('remote')
+        if local_match is None:
+            return
+        remote_kps, _ = self.select_top_k_kps(kps, kp_scores, 1, response_db_kps)
+        is_agreement = local_match[0][:1] == remote_kps
+        count_kp_matching_agreement(local_match[2], is_agreement)
+        if local_match[2] and not is_agreement:
+            logging.info('Local kp match %s disagrees with remote match %s' % (local_match[0][:1], remote_kps))
+
+    def get_top_k_kps(self, arg, k, disable_cache, response_db_kps=None, language_code=None):
+        local_match = self.get_local_match(arg, response_db_kps, language_code)
+        if self.is_local_answer(local_match):
+            count_kp_matching('local')
+            return local_match[0][:k], local_match[1][:k]
+        try:
+            kps, kp_scores = get_scores(self.url, arg, disable_cache)
+        except Exception as e:
+            return self.get_fallback_kps(e, local_match, k)
+        self.count_remote_match(local_match, kps, kp_scores, response_db_kps)
+        return self.select_top_k_kps(kps, kp_scores, k, response_db_kps)
+
+    async def async_get_top_k_kps(self, arg, k, disable_cache, response_db_kps=None, language_code=None):
+        local_match = self.get_local_match(arg, response_db_kps, language_code)
+        if self.is_local_answer(local_match):
+            count_kp_matching('local')
+            return local_match[0][:k], local_match[1][:k]
+        try:
+            kps, kp_scores = await async_get_scores(self.url, arg, disable_cache)
+        except Exception as e:
+            return self.get_fallback_kps(e, local_match, k)
+        self.count_remote_match(local_match, kps, kp_scores, response_db_kps)
+        return self.select_top_k_kps(kps, kp_scores, k, response_db_kps)
+
+    # when the remote model fails, the turn continues with the confident local match, or with no kps
+    def get_fallback_kps(self, e, local_match, k):
+        if not Resilience().fallbacks:
+            raise e
+        logging.warning('Falling back from the kp matching at %s: %s' % (self.url, repr(e)))
+        count_classifier_fallback(self.url)
+        if local_match is not None and local_match[2]:
+            count_kp_matching('local')
+            return local_match[0][:k], local_match[1][:k]
+        return [], []
+
+    def select_top_k_kps(self, kps, kp_scores, k, response_db_kps):
         if response_db_kps is not None:
             kps, kp_scores = self.remove_kps_not_in_response_db(kps, kp_scores, response_db_kps)
         return kps[:k], kp_scores[:k]
@@ -43,14 +158,14 @@ class KpMatching:
     # "top_kps" - the top 3 existing kps
     # "top_scores" - the scores of the top 3 existing kps
     def match_to_existing_kps(self, args):
-        kp_scores = np.array(get_scores(self.url, [[arg] for arg in args], 32, disable_cache=True))
-        kp_ids = np.array(-kp_scores).argsort()
+        matches = [match for i in range(0, len(args), MATCH_BATCH_SIZE)
+                   for match in get_batch_scores(self.url, args[i:i + MATCH_BATCH_SIZE], disable_cache=True)]
+        # the (kp, score) pairs of each arg, by descending score
+        matches = [sorted(zip(kps, kp_scores), key=lambda item: -item[1]) for kps, kp_scores in matches]
         # for each kp, creating a list of the kps on which the kp matching score is above the confidence threshold
-        confident_matches = [self.get_kps([j for j in kp_ids_list if self.is_confident(kp_scores[i,j])])  for i, kp_ids_list in enumerate(kp_ids)]
+        confident_matches = [[kp for kp, score in match if self.is_confident(score)] for match in matches]
         # for each kp, creating a dictionary of all (kp, score) pairs
-        all_matches_scores = [dict(zip(kp, score)) for kp, score in
-                              zip([self.get_kps(kp_ids_list) for kp_ids_list in kp_ids],
-                                  [kp_scores[i, ids] for i,ids in enumerate(kp_ids)])]
+        all_matches_scores = [dict(match) for match in matches]
         return confident_matches, all_matches_scores
 
 
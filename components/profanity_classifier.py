@@ -4,24 +4,46 @@
 #
 
 import re
+from tools.batch_processing import apply_batch
 from tools.db_manager import DBManager
+from tools.phrase_matcher import PhraseMatcher
 
 
 class ProfanityClassifier:
 
     def __init__(self):
         self.lexicon = DBManager().read_profanity_lexicon()
-        self.regex_lexicon = re.compile(r"\b(" + "|".join([re.escape(item.strip().lower())
-                                                           for item in self.lexicon]) + r")\b")
+        # a text is profane if it contains a lexicon term as a whole (\bterm\b), or if it is one of
+        # the profanity texts. an empty list is an empty term, as the empty alternation of a regex
+        self.lexicon_matcher = PhraseMatcher([item.strip().lower() for item in self.lexicon] or [''])
         self.texts = DBManager().read_profanity_texts()
-        self.regex_texts = re.compile(r"^(" + "|".join([re.escape(text.strip().lower())
-                                                        for text in self.texts]) + r")$")
+        self.profanity_texts = {text.strip().lower() for text in self.texts} or {''}
         self.regex_cleaner = re.compile(r"[^A-Za-z0-9\-]")
 
-    def apply(self, user_text):
+    def normalize(self, user_text):
         user_text = self.regex_cleaner.sub(" ", user_text).lower()
-        user_text = ' '.join(user_text.split())
-        return self.regex_texts.match(user_text) is not None or self.regex_lexicon.search(user_text) is not None
+        return ' '.join(user_text.split())
+
+    def apply(self, user_text, analysis=None):
+        # the analysis of the text holds its normalized form
+        return self.is_profanity(analysis.normalized_text if analysis is not None else self.normalize(user_text))
+
+    def apply_many(self, user_texts):
+        # each distinct normalized text is classified once
+        decisions = {}
+        results = []
+        for user_text in user_texts:
+            text = self.normalize(user_text)
+            if text not in decisions:
+                decisions[text] = self.is_profanity(text)
+            results.append(decisions[text])
+        return results
+
+    def apply_batch(self, user_texts, n_processes=1):
+        return apply_batch(self, 'apply_many', user_texts, n_processes=n_processes)
+
+    def is_profanity(self, text):
+        return text in self.profanity_texts or self.lexicon_matcher.search(text)
 
 
 if __name__ == "__main__":
@@ -35,4 +57,6 @@ if __name__ == "__main__":
     assert not lex.apply('what are the side effects?')
     assert not lex.apply('Does the profanity classifier pushed to production?')
     assert not lex.apply('Can jews have covid?')
+    assert lex.apply_many(['jews', 'what are the side effects?', 'JEWS!']) == [True, False, True]
+    assert lex.apply_batch(['jews', 'what are the side effects?', 'jews']) == [True, False, True]
     print("All passed")
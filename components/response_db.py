@@ -5,6 +5,7 @@
 
 from tools.argument import Argument
 from tools.db_manager import DBManager
+from tools.language_content import LanguageML
 import re
 
 
@@ -22,13 +23,24 @@ class ResponseDB:
         return self.kp_mapping[con_kp] if con_kp is not None and con_kp in self.kp_mapping.keys() else None
 
     def get_pro_kp_args(self, pro_kp, campaign_id=None):
-        pro_args = list(self.pro_kp_args[pro_kp]) if pro_kp is not None else []
-        if len(pro_args) > 0 and campaign_id is not None:
-            for arg in pro_args:
-                if campaign_id in arg.link_replacement.keys():
-                    arg.text = self.set_link(arg.text, arg.link_replacement, campaign_id)
-                    arg.base_response = self.set_link(arg.base_response, arg.link_replacement, campaign_id)
-        return pro_args
+        pro_args = self.pro_kp_args[pro_kp] if pro_kp is not None else []
+        return [self.get_campaign_arg(arg, campaign_id) for arg in pro_args]
+
+    def get_campaign_arg(self, arg, campaign_id):
+        # the arguments are shared between sessions, so the campaign links are set in a copy
+        if campaign_id is None or campaign_id not in arg.link_replacement.keys():
+            return arg
+        return Argument(text=self.set_link(arg.text, arg.link_replacement, campaign_id), arg_type=arg.type,
+                        base_response=self.set_link(arg.base_response, arg.link_replacement, campaign_id),
+                        canned_text=arg.canned_text, expression=arg.expression,
+                        link_replacement=arg.link_replacement)
+
+    def get_pro_kps(self):
+        return list(self.pro_kp_args.keys())
+
+    # returns the campaigns for which the arguments of the pro_kp have specific links
+    def get_pro_kp_campaigns(self, pro_kp):
+        return sorted({campaign_id for arg in self.pro_kp_args[pro_kp] for campaign_id in arg.link_replacement})
 
     def set_link(self, text, link_replacement, campaign_id):
         m = self.link_pattern.search(text)
@@ -40,11 +52,7 @@ class ResponseDB:
         return self.con_kps
 
 
-class ResponseDBML:
-
-    def __init__(self, language_codes):
-        self.response_dbs = {language_code: ResponseDB(language_code)
-                             for language_code in language_codes}
+class ResponseDBML(LanguageML):
 
-    def __getitem__(self, item):
-        return self.response_dbs[item]
+    def create(self, language_code):
+        return ResponseDB(language_code)
@@ -3,21 +3,72 @@
 # SPDX-License-Identifier: Apache2.0
 #
 
-import threading
+import numpy as np
 
 from tools.db_manager import DBManager
 
 RANDOM_MODEL = "random"
 RANDOM_INIT_SCORE = 10
+RANDOM_SEED = 1024 * 1024
 
 
-class RandomScorer:
+def create_turn_rng(seed, session_id, turn_index):
+    # the random generator of a turn is derived from the session id (a hex object id) and the index of
+    # the turn's message, so the selection of every turn can be replayed, and turns share no random state
+    return np.random.default_rng(np.random.SeedSequence([seed, int(str(session_id), 16), turn_index]))
+
+
+def get_last_usage_indices(system_argument_history):
+    # the index of the last usage of every base response and canned text in the history
+    base_response_indices = {}
+    canned_text_indices = {}
+    for i, arg_history in enumerate(system_argument_history):
+        base_response_indices[arg_history.base_response] = i
+        for ct in arg_history.canned_text or []:
+            canned_text_indices[ct] = i
+    return base_response_indices, canned_text_indices
+
+
+def get_usage_decay(usage_factor, history_length):
+    # the factor of a text last used d turns ago is at index d. it is computed with the builtin pow, whose
+    # results may differ in the last digit from numpy's, so the scores stay the same as when computed per text
+    return np.array([1.0] + [pow(usage_factor, 5 / distance) for distance in range(1, history_length + 1)])
+
+
+def apply_usage_factor(scores, last_used_indices, usage_decay, history_length):
+    # scores of texts that were used are multiplied by usage_factor ** (5 / turns since the last usage)
+    used = last_used_indices > -1
+    return np.where(used, scores * usage_decay[np.where(used, history_length - last_used_indices, 0)], scores)
 
-    def __init__(self, random_state):
-        self.random_state = random_state
 
-    def score(self, chat_history, candidates):
-        self.random_state.shuffle(candidates)
+def diminish_scores_by_recency_usage(args, scores, system_argument_history, last_usage_factors):
+    base_response_indices, canned_text_indices = get_last_usage_indices(system_argument_history)
+    history_length = len(system_argument_history)
+    base_response_last_used = np.array([base_response_indices.get(arg.base_response, -1) for arg in args])
+    # the canned texts of each argument by position, empty texts are not penalized
+    n_canned_texts = max([len(arg.canned_text or []) for arg in args], default=0)
+    canned_text_last_used = np.full((len(args), n_canned_texts), -1)
+    for i, arg in enumerate(args):
+        for j, ct in enumerate(arg.canned_text or []):
+            if len(ct) > 0:
+                canned_text_last_used[i, j] = canned_text_indices.get(ct, -1)
+    # the factors are applied one at a time, in the same order as they were applied to each score
+    new_scores = apply_usage_factor(np.array(scores, dtype=float), base_response_last_used,
+                                    get_usage_decay(last_usage_factors['response_db'], history_length),
+                                    history_length)
+    canned_text_decay = get_usage_decay(last_usage_factors['canned_text'], history_length)
+    for j in range(n_canned_texts):
+        new_scores = apply_usage_factor(new_scores, canned_text_last_used[:, j], canned_text_decay, history_length)
+    return new_scores.tolist()
+
+
+# a scorer returns the texts of the candidates and their scores. the scores are sorted in descending
+# or ascending order (determined by the first two scores), unless the scorer sets 'descending'.
+class RandomScorer:
+
+    def score(self, chat_history, candidates, rng, session_id=None, language_code=None):
+        candidates = [c.text for c in candidates]
+        rng.shuffle(candidates)
         return {'text_candidates': candidates, 'cand_scores': [RANDOM_INIT_SCORE - i/RANDOM_INIT_SCORE
                                                                if RANDOM_INIT_SCORE - i/RANDOM_INIT_SCORE > 0
                                                                else 0 for i in range(len(candidates))]}
@@ -25,57 +76,44 @@ class RandomScorer:
 
 class ResponseSelection:
 
-    def __init__(self, random_state):
+    def __init__(self, seed=RANDOM_SEED, scorer=None):
         configuration = DBManager().read_configuration()
-        self.scorer = RandomScorer(random_state)
-        self.lock = threading.Lock()
-        self.random_state = random_state
+        self.scorer = scorer if scorer is not None else RandomScorer()
+        self.seed = seed
         self.last_usage_factors = configuration.get_last_usage_factors()
 
-    def diminish_score_by_recency_usage(self, arg, score, system_argument_history):
-        response_base_used = [i for i, arg_history in enumerate(system_argument_history)
-                              if arg_history.base_response == arg.base_response]
-        response_base_last_used_index = response_base_used[-1] if len(response_base_used) > 0 else -1
-        canned_text_last_used_indices = []
-        for ct in arg.canned_text:
-            if len(ct) > 0:
-                canned_text_used = [i for i, arg_history in enumerate(system_argument_history)
-                                    if ct in arg_history.canned_text]
-                canned_text_last_used_indices.append(canned_text_used[-1] if len(canned_text_used) > 0 else -1)
-        if response_base_last_used_index > -1:
-            score *= pow(self.last_usage_factors['response_db'],
-                         5 / (len(system_argument_history) - response_base_last_used_index))
-        for canned_text_last_used_index in canned_text_last_used_indices:
-            if canned_text_last_used_index > -1:
-                score *= pow(self.last_usage_factors['canned_text'],
-                             5 / (len(system_argument_history) - canned_text_last_used_index))
-        return score
-
-    def apply(self, candidates, chat_history, system_argument_history):
+    def create_rng(self, session_id, turn_index):
+        return create_turn_rng(self.seed, session_id, turn_index)
+
+    def apply(self, candidates, chat_history, system_argument_history, rng, session_id=None, language_code=None):
         orig_scores = None
         sorted_scores = None
         sorted_candidates = None
         if len(candidates) == 0:
             return [], sorted_candidates, sorted_scores, orig_scores
         if len(chat_history) == 0:
-            return self.random_state.choice(candidates, 1)[0], sorted_candidates, sorted_scores, orig_scores
-        self.lock.acquire()
-        try:
-            model_response = self.scorer.score(chat_history=chat_history, candidates=[c.text for c in candidates])
-        finally:
-            self.lock.release()
+            return candidates[rng.integers(len(candidates))], sorted_candidates, sorted_scores, orig_scores
+        model_response = self.scorer.score(chat_history=chat_history, candidates=candidates, rng=rng,
+                                           session_id=session_id, language_code=language_code)
         # calculating new scores, using factors to reduce scores according to last usage
         # determining if new scores need to be sorted in descending or ascending order
-        descending_sort = len(candidates) < 2 or (model_response['cand_scores'][0] > model_response['cand_scores'][1])
-        # first, sort list of Arguments according to the order determined by the model
-        sorted_candidates = [[c for c in candidates if c.text == text][0] for text in model_response['text_candidates']]
-        sorted_candidates_to_orig_scores = dict(zip(sorted_candidates, model_response['cand_scores']))
-        # then calculate new scores for each Argument
-        cands_to_new_scores = {arg: self.diminish_score_by_recency_usage(arg, score, system_argument_history) for arg,
-                               score in zip(sorted_candidates, model_response['cand_scores'])}
-        sorted_candidates = sorted(cands_to_new_scores.items(), key=lambda x: x[1],
-                                   reverse=descending_sort)
-        sorted_scores = [sc[1] for sc in sorted_candidates]
-        orig_scores = [sorted_candidates_to_orig_scores[c[0]] for c in sorted_candidates]
-        selected_candidate = sorted_candidates[0][0]
-        return selected_candidate, [sc[0].text for sc in sorted_candidates], sorted_scores, orig_scores
+        descending_sort = model_response['descending'] if 'descending' in model_response else \
+            len(candidates) < 2 or (model_response['cand_scores'][0] > model_response['cand_scores'][1])
+        # each distinct text is ordered by its first position in the model's order, and gets the
+        # scores of its last position, and the argument of its first occurrence in the candidates
+        candidates_by_text = {}
+        for c in candidates:
+            candidates_by_text.setdefault(c.text, c)
+        text_positions = {}
+        for i, text in enumerate(model_response['text_candidates']):
+            text_positions[text] = i
+        positions = list(text_positions.values())
+        texts = list(text_positions.keys())
+        orig_scores = [model_response['cand_scores'][i] for i in positions]
+        new_scores = diminish_scores_by_recency_usage([candidates_by_text[text] for text in texts], orig_scores,
+                                                      system_argument_history, self.last_usage_factors)
+        # the sort is stable, so equal scores keep the model's order
+        order = sorted(range(len(texts)), key=new_scores.__getitem__, reverse=descending_sort)
+        selected_candidate = candidates_by_text[texts[order[0]]]
+        return selected_candidate, [texts[i] for i in order], [new_scores[i] for i in order], \
+            [orig_scores[i] for i in order]
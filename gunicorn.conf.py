@@ -0,0 +1,43 @@
+#
+# Copyright 2020-2023 IBM Inc. All rights reserved
+# SPDX-License-Identifier: Apache2.0
+#
+
+# gunicorn configuration of the pre-fork serving mode. the app, and with it the dialog manager and
+# the content of the preloaded languages, is loaded once by the master process, and the uvicorn workers
+# are forked from it, sharing the loaded objects copy-on-write.
+#
+# usage: gunicorn main:app (from the repository root, or with -c gunicorn.conf.py)
+
+import gc
+import multiprocessing
+import os
+import shutil
+
+bind = '0.0.0.0:%s' % os.environ.get('VIRA_PORT', '8000')
+workers = int(os.environ.get('VIRA_WORKERS', multiprocessing.cpu_count()))
+worker_class = 'uvicorn.workers.UvicornWorker'
+preload_app = True
+# the workers are restarted if they do not respond within the timeout
+timeout = int(os.environ.get('VIRA_WORKER_TIMEOUT', '120'))
+logconfig = os.path.join('resources', 'logging.conf')
+forwarded_allow_ips = '*'
+
+# the metrics of the workers are written to files, and are collected by the /metrics endpoint of any worker.
+# it must be set before prometheus_client is imported by the app.
+metrics_dir = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join('/dev', 'shm', 'vira', 'metrics'))
+shutil.rmtree(metrics_dir, ignore_errors=True)
+os.makedirs(metrics_dir)
+
+
+def when_ready(server):
+    # the objects loaded by the master are moved to a permanent generation that the garbage
+    # collector ignores, otherwise collections in the workers write to (and copy) their pages
+    gc.collect()
+    gc.freeze()
+    server.log.info('Froze %d objects before forking the workers' % gc.get_freeze_count())
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -6,15 +6,19 @@
 import json
 import logging.config
 import os
+import secrets
 from typing import Optional, Union, Any
 
 import uvicorn
 from fastapi import FastAPI, Depends, Request, HTTPException, status as fastapi_status
 from fastapi.security import OAuth2PasswordBearer
 from pydantic import BaseModel
-from starlette.responses import JSONResponse
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, generate_latest, multiprocess
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, Response
 
 from components.dialog_manager import DialogManager
+from tools.content_reloader import ContentReloader
 from tools.db_manager import DBManager
 from tools.service_utils import check_input_text, check_session_id, verify_bool_feedback, verify_int_feedback, \
     verify_message_id
@@ -29,6 +33,12 @@ app = FastAPI(openapi_url=None)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 VIRA_API_KEY = os.environ['VIRA_API_KEY']
+# the admin endpoints are disabled unless their own key is defined
+VIRA_ADMIN_API_KEY = os.environ.get('VIRA_ADMIN_API_KEY')
+
+# in async mode the dialog manager is awaited on the event loop using non-blocking
+# http and mongo clients, otherwise each request blocks a thread of the threadpool
+ASYNC_MODE = os.environ.get('VIRA_ASYNC_MODE', 'false').lower() == 'true'
 
 
 # bot_name = "bot"
@@ -38,7 +48,22 @@ language_codes = DBManager().read_configuration().get_language_codes()
 
 dialog_manager = DialogManager()
 
-log.info("Service initialization is complete")
+# store the content read during the initialization, so the next start does not depend on the db
+DBManager().save_content_snapshot()
+
+# the dialog manager is replaced by a new generation when the content is reloaded
+content_reloader = ContentReloader(lambda: DialogManager.renew(dialog_manager.classifier_executor), dialog_manager)
+content_reload_interval = DBManager().read_configuration().get_content_reload_settings()['poll_interval']
+
+log.info("Service initialization is complete (async mode: %s)" % ASYNC_MODE)
+
+
+# runs in every worker process. in pre-fork mode the module is loaded by the master process,
+# whose threads are not inherited by the forked workers.
+@app.on_event("startup")
+def start_worker():
+    if content_reload_interval is not None:
+        content_reloader.start_polling(content_reload_interval)
 
 
 class MessageRequest(BaseModel):
@@ -62,6 +87,17 @@ def read_root():
     return "OK"
 
 
+# entry point for prometheus scraping
+@app.get("/metrics")
+def read_metrics():
+    # in pre-fork mode the metrics of all the workers are collected from their files
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
 async def verify_token(token: str = Depends(oauth2_scheme)):
     if token != VIRA_API_KEY:
         raise HTTPException(
@@ -72,6 +108,16 @@ async def verify_token(token: str = Depends(oauth2_scheme)):
     return token
 
 
+async def verify_admin_token(token: str = Depends(oauth2_scheme)):
+    if VIRA_ADMIN_API_KEY is None or not secrets.compare_digest(token, VIRA_ADMIN_API_KEY):
+        raise HTTPException(
+            status_code=fastapi_status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return token
+
+
 @app.exception_handler(ValueError)
 async def value_error_exception_handler(_request: Request, exc: ValueError):
     log.exception(f"ValueError raised")
@@ -100,9 +146,25 @@ async def unicorn_exception_handler(_request: Request, exc: Exception):
     )
 
 
+async def call_dialog_manager(method_name, *args):
+    # the request is processed by the generation that is current when it starts
+    current_dialog_manager = content_reloader.get()
+    if ASYNC_MODE:
+        return await getattr(current_dialog_manager, 'async_' + method_name)(*args)
+    return await run_in_threadpool(getattr(current_dialog_manager, method_name), *args)
+
+
+# reloads the content in the worker process that handles the request, and bumps the content version
+# so the other workers reload on their next poll
+@app.post("/admin/reload")
+async def reload_content(_token: str = Depends(verify_admin_token)):
+    reloaded = await run_in_threadpool(content_reloader.reload_all)
+    return {'reloaded': reloaded, 'version': content_reloader.get_version()}
+
+
 @app.post("/dialog/{language_code}")
-def handle_user_input(language_code: Optional[str], request: MessageRequest,
-                      _token: str = Depends(verify_token)):
+async def handle_user_input(language_code: Optional[str], request: MessageRequest,
+                            _token: str = Depends(verify_token)):
     log.info('New message')
 
     if not request.session_id:
@@ -132,8 +194,8 @@ def handle_user_input(language_code: Optional[str], request: MessageRequest,
         platform = None
 
         # generate response
-        response = dialog_manager.process_new_session(dialog_label, campaign_id, opening_survey_flow,
-                                                      platform, language_code)
+        response = await call_dialog_manager('process_new_session', dialog_label, campaign_id,
+                                             opening_survey_flow, platform, language_code)
     else:
         log.info('Continuing existing session')
         log.info(f'Received request:\n{json.dumps(request.dict(), indent=4)}')
@@ -160,7 +222,8 @@ def handle_user_input(language_code: Optional[str], request: MessageRequest,
             disable_cache = False
 
             # generate response
-            response = dialog_manager.process_user_text(session_id, text, feedback, answer, disable_cache)
+            response = await call_dialog_manager('process_user_text', session_id, text, feedback, answer,
+                                                 disable_cache)
 
         elif all(x is not None for x in [request.message_id, request.feedback]):
             # the message to which the feedback is given
@@ -172,12 +235,12 @@ def handle_user_input(language_code: Optional[str], request: MessageRequest,
             verify_int_feedback(feedback)
 
             # generate response
-            response = dialog_manager.process_user_feedback(session_id, message_id, feedback)
+            response = await call_dialog_manager('process_user_feedback', session_id, message_id, feedback)
 
         elif request.survey is not None:
 
             # generate response
-            response = dialog_manager.process_user_survey(session_id, request.survey)
+            response = await call_dialog_manager('process_user_survey', session_id, request.survey)
 
         else:
             raise ValueError('Unsupported request')
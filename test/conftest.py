@@ -0,0 +1,78 @@
+#
+# Copyright 2020-2023 IBM Inc. All rights reserved
+# SPDX-License-Identifier: Apache2.0
+#
+
+import copy
+import json
+import os
+
+import pytest
+
+from tools.singleton import Singleton
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(autouse=True)
+def root_dir(monkeypatch):
+    # the components read their resources relative to the repository root
+    monkeypatch.chdir(ROOT_DIR)
+
+
+@pytest.fixture(autouse=True)
+def singletons():
+    # each test starts without the singletons created by the previous ones
+    instances = dict(Singleton._instances)
+    Singleton._instances.clear()
+    yield
+    Singleton._instances.clear()
+    Singleton._instances.update(instances)
+
+
+@pytest.fixture(scope='session')
+def configuration_data():
+    with open(os.path.join(ROOT_DIR, 'resources', 'configuration', 'configuration.json')) as fp:
+        return json.load(fp)
+
+
+@pytest.fixture
+def create_db_manager(configuration_data):
+    # creates the DBManager singleton over an in-memory mongo, with the shipped configuration
+    # updated by the given sections
+    mongomock = pytest.importorskip('mongomock')
+    from tools.db_manager import DB_NAME, DBManager
+
+    def create(**sections):
+        db_manager = DBManager.__new__(DBManager)
+        db_manager.client = mongomock.MongoClient()
+        db_manager.create_client = lambda: db_manager.client
+        db_manager.db_name = DB_NAME
+        db_manager.hostname = 'test'
+        db_manager.label = None
+        db_manager.dialog_cache = None
+        db_manager.content_snapshot_path = None
+        db_manager.content_snapshot = None
+        db_manager.content_upload_pending = None
+        data = copy.deepcopy(configuration_data)
+        data.update(sections)
+        db_manager.client[DB_NAME].configuration.insert_one({'name': 'general', 'data': data})
+        Singleton._instances[DBManager] = db_manager
+        return db_manager
+
+    return create
+
+
+@pytest.fixture
+def upload_content():
+    # uploads the authored content of the resources to the db of the DBManager singleton
+    def upload():
+        from tools import db_utils
+        from tools.db_manager import DBManager
+        with DBManager().content_upload():
+            db_utils.import_canned_text_path('canned_text')
+            db_utils.import_response_db_path('response_db')
+            db_utils.import_profanity_lexicon('profanity_lexicon.csv')
+            db_utils.import_profanity_texts('profanity_texts.csv')
+
+    return upload
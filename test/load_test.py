@@ -0,0 +1,170 @@
+#
+# Copyright 2020-2023 IBM Inc. All rights reserved
+# SPDX-License-Identifier: Apache2.0
+#
+
+# Drives the dialog endpoint of a running service with concurrent synthetic sessions and
+# reports the throughput and latency percentiles per request type. Each session starts a
+# new dialog, answers (or skips) the opening survey, asks questions taken from the kp
+# question forms of its language, and randomly clicks advisory feedback options, gives
+# thumbs feedback and answers the closing survey.
+#
+# usage: python test/load_test.py -url http://0.0.0.0:8100 -sessions 500 -concurrency 50 -languages en es
+
+import asyncio
+import os
+import random
+from argparse import ArgumentParser
+from collections import defaultdict
+from time import time
+
+import httpx
+import numpy as np
+import pandas as pd
+
+RESPONSE_DB_DIR = os.path.join('resources', 'response_db')
+
+NEW_SESSION = 'new_session'
+SURVEY_ANSWER = 'survey_answer'
+QUESTION = 'question'
+FEEDBACK_CLICK = 'feedback_click'
+THUMBS = 'thumbs'
+SURVEY = 'survey'
+
+
+def read_questions(language_code):
+    df = pd.read_csv(os.path.join(RESPONSE_DB_DIR, 'kps_to_qform_%s.csv' % language_code), encoding="ISO-8859-1")
+    return [text.strip()[:255] for text in df['q_form'].dropna().unique()]
+
+
+class LoadTest:
+
+    def __init__(self, args):
+        self.args = args
+        self.url = args.url.rstrip('/')
+        self.headers = {'Authorization': f'Bearer {os.environ["VIRA_API_KEY"]}'}
+        self.questions = {language_code: read_questions(language_code) for language_code in args.languages}
+        self.random = random.Random(args.seed)
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    async def post(self, client, request_type, language_code, data):
+        start_time = time()
+        try:
+            resp = await client.post('%s/dialog/%s' % (self.url, language_code), headers=self.headers, json=data)
+            self.latencies[request_type].append(time() - start_time)
+            if resp.status_code != 200:
+                self.errors[request_type] += 1
+                return None
+            return resp.json()
+        except httpx.HTTPError:
+            self.latencies[request_type].append(time() - start_time)
+            self.errors[request_type] += 1
+            return None
+
+    async def think(self):
+        if self.args.think_ms > 0:
+            await asyncio.sleep(self.random.uniform(0, 2 * self.args.think_ms) / 1000)
+
+    async def run_session(self, client, language_code):
+        response = await self.post(client, NEW_SESSION, language_code, {})
+        if response is None:
+            return
+        session_id = response['session_id']
+
+        # answer the opening survey questions, or skip the survey by asking a question
+        while response is not None and response.get('opening_survey') and \
+                self.random.random() < self.args.survey_answer_rate:
+            await self.think()
+            response = await self.post(client, SURVEY_ANSWER, language_code, {
+                'session_id': session_id, 'text': self.random.choice(response['choices']), 'answer': True})
+
+        for _ in range(self.args.turns):
+            await self.think()
+            response = await self.post(client, QUESTION, language_code, {
+                'session_id': session_id, 'text': self.random.choice(self.questions[language_code])})
+            if response is None:
+                continue
+
+            # select one of the kp candidates offered in advisory mode
+            if response.get('con_kp_candidates') and self.random.random() < self.args.feedback_click_rate:
+                await self.think()
+                response = await self.post(client, FEEDBACK_CLICK, language_code, {
+                    'session_id': session_id, 'text': self.random.choice(response['con_kp_candidates']),
+                    'feedback': True})
+                if response is None:
+                    continue
+
+            if response.get('message_id') is not None and self.random.random() < self.args.thumbs_rate:
+                await self.think()
+                await self.post(client, THUMBS, language_code, {
+                    'session_id': session_id, 'message_id': response['message_id'],
+                    'feedback': self.random.choice([1, -1])})
+
+        if self.random.random() < self.args.survey_rate:
+            await self.think()
+            await self.post(client, SURVEY, language_code, {
+                'session_id': session_id, 'survey': {'rating': self.random.randint(1, 5)}})
+
+    async def run(self):
+        semaphore = asyncio.Semaphore(self.args.concurrency)
+        limits = httpx.Limits(max_connections=self.args.concurrency,
+                              max_keepalive_connections=self.args.concurrency)
+
+        async with httpx.AsyncClient(limits=limits, timeout=self.args.timeout) as client:
+            async def run_session(language_code):
+                async with semaphore:
+                    await self.run_session(client, language_code)
+
+            start_time = time()
+            await asyncio.gather(*[run_session(self.random.choice(self.args.languages))
+                                   for _ in range(self.args.sessions)])
+            return time() - start_time
+
+    def get_report(self, duration):
+        rows = []
+        request_types = [NEW_SESSION, SURVEY_ANSWER, QUESTION, FEEDBACK_CLICK, THUMBS, SURVEY]
+        all_latencies = [latency for request_type in request_types for latency in self.latencies[request_type]]
+        for request_type, latencies in [(t, self.latencies[t]) for t in request_types] + [('total', all_latencies)]:
+            if len(latencies) == 0:
+                continue
+            errors = self.errors[request_type] if request_type != 'total' else sum(self.errors.values())
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+            rows.append({
+                'type': request_type,
+                'requests': len(latencies),
+                'errors': errors,
+                'throughput': len(latencies) / duration,
+                'p50_ms': p50,
+                'p95_ms': p95,
+                'p99_ms': p99,
+            })
+        return pd.DataFrame(rows)
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("-url", default="http://0.0.0.0:8100")
+    parser.add_argument("-sessions", type=int, default=100)
+    parser.add_argument("-concurrency", type=int, default=20, help="number of concurrent sessions")
+    parser.add_argument("-turns", type=int, default=3, help="number of questions per session")
+    parser.add_argument("-languages", nargs='+', default=['en'])
+    parser.add_argument("-survey-answer-rate", dest='survey_answer_rate', type=float, default=0.7)
+    parser.add_argument("-feedback-click-rate", dest='feedback_click_rate', type=float, default=0.2)
+    parser.add_argument("-thumbs-rate", dest='thumbs_rate', type=float, default=0.2)
+    parser.add_argument("-survey-rate", dest='survey_rate', type=float, default=0.1)
+    parser.add_argument("-think-ms", dest='think_ms', type=float, default=0,
+                        help="mean delay between the requests of a session")
+    parser.add_argument("-timeout", type=float, default=30)
+    parser.add_argument("-seed", type=int, default=0)
+    args = parser.parse_args()
+
+    load_test = LoadTest(args)
+    duration = asyncio.run(load_test.run())
+
+    print('Sessions: %d, concurrency: %d, duration: %.1fs' % (args.sessions, args.concurrency, duration))
+    print(load_test.get_report(duration).to_string(index=False, float_format='%.1f'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+#
+# Copyright 2020-2023 IBM Inc. All rights reserved
+# SPDX-License-Identifier: Apache2.0
+#
+
+import tools.lru_cache
+from tools.lru_cache import LRUCache
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(max_size=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    assert cache.get_stats() == {'size': 2, 'hits': 3, 'misses': 1, 'evictions': 1}
+
+
+def test_lru_cache_ttl_from_insertion(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(tools.lru_cache, 'monotonic', clock)
+    cache = LRUCache(max_size=10, ttl=10)
+    cache.put('a', 1)
+    clock.now += 6
+    assert cache.get('a') == 1
+    clock.now += 6
+    assert cache.get('a') is None
+
+
+def test_lru_cache_idle_ttl_from_last_access(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(tools.lru_cache, 'monotonic', clock)
+    cache = LRUCache(max_size=10, ttl=10, idle_ttl=True)
+    cache.put('a', 1)
+    for _ in range(3):
+        clock.now += 6
+        assert cache.get('a') == 1
+    clock.now += 11
+    assert cache.get('a') is None
+
+
+def test_scores_cache(create_db_manager):
+    create_db_manager(scores_cache={'enabled': True, 'max_size': 10, 'ttl': None})
+    from tools.scores_cache import ScoresCache
+    cache = ScoresCache()
+    assert not cache.is_cacheable(['a', 'list'])
+    assert cache.is_cacheable('a text')
+
+    cache.put('url', ' is it  safe?', ['kp1', 'kp2'], [0.9, 0.1])
+    # the whitespace of the texts is normalized, and the returned lists are copies
+    intents, scores = cache.get('url', 'is it safe? ')
+    assert (intents, scores) == (['kp1', 'kp2'], [0.9, 0.1])
+    intents.append('kp3')
+    assert cache.get('url', 'is it safe?')[0] == ['kp1', 'kp2']
+    assert cache.get('other_url', 'is it safe?') is None
+    # the classifiers may score texts that differ in case differently
+    assert cache.get('url', 'Is it Safe?') is None
+
+    # a changed fingerprint of the content clears the cache
+    cache.set_fingerprint('kp_matching', {'version': 1})
+    assert cache.get('url', 'is it safe?') is not None
+    cache.set_fingerprint('kp_matching', {'version': 1})
+    assert cache.get('url', 'is it safe?') is not None
+    cache.set_fingerprint('kp_matching', {'version': 2})
+    assert cache.get('url', 'is it safe?') is None
+
+
+def test_scores_cache_disabled(create_db_manager):
+    create_db_manager(scores_cache={'enabled': False})
+    from tools.scores_cache import ScoresCache
+    assert not ScoresCache().is_cacheable('a text')
@@ -0,0 +1,67 @@
+#
+# Copyright 2020-2023 IBM Inc. All rights reserved
+# SPDX-License-Identifier: Apache2.0
+#
+
+import pytest
+
+from components.intent_detection import intent_classes
+
+LANGUAGE_CODES = ['en', 'es']
+
+
+@pytest.fixture
+def create_index_ml(create_db_manager, upload_content):
+    create_db_manager()
+    upload_content()
+    from components.connecting_text_index import ConnectingTextIndexML
+    from components.connecting_text_library import ConnectingTextLibraryML
+    from components.response_db import ResponseDBML
+
+    def create(shared_store=None):
+        return ConnectingTextIndexML(ResponseDBML(LANGUAGE_CODES), ConnectingTextLibraryML(False, LANGUAGE_CODES),
+                                     LANGUAGE_CODES, shared_store=shared_store)
+
+    return create
+
+
+def get_fields(arguments):
+    return [(arg.text, arg.type, arg.base_response, tuple(arg.canned_text), arg.expression) for arg in arguments]
+
+
+def assert_rephrase_parity(index):
+    # the dialog manager looks the index up with the lowercase labels of the intents
+    library = index.connecting_text
+    labels = [label for label in intent_classes + ['kp', 'profanity']
+              if any(intent.name.lower() == label for intent in library.connecting_text_library)]
+    assert 'query' in labels
+    pro_kps = [None] + index.response_db.get_pro_kps()
+    n_lookups = 0
+    for pro_kp in pro_kps[:40]:
+        campaigns = index.response_db.get_pro_kp_campaigns(pro_kp) if pro_kp is not None else []
+        for campaign_id in [None, 'unknown_campaign'] + campaigns[:2]:
+            for label in labels:
+                assert index.get_key(pro_kp, campaign_id, label, 'general') in index.index
+                expected = library.rephrase(index.response_db.get_pro_kp_args(pro_kp, campaign_id),
+                                            intent=label, persona='general')
+                assert get_fields(index.rephrase(pro_kp, campaign_id, label, 'general')) == get_fields(expected)
+                n_lookups += 1
+    assert n_lookups > 0
+
+
+def test_rephrase_with_intent_labels(create_index_ml):
+    index_ml = create_index_ml()
+    for language_code in LANGUAGE_CODES:
+        index = index_ml[language_code]
+        index.verify()
+        assert_rephrase_parity(index)
+
+
+def test_shared_store_rephrase_with_intent_labels(create_index_ml, tmp_path):
+    from components.connecting_text_index import SharedConnectingTextIndex
+    index_ml = create_index_ml(shared_store={'enabled': True, 'path': str(tmp_path)})
+    for language_code in LANGUAGE_CODES:
+        index = index_ml[language_code]
+        assert isinstance(index, SharedConnectingTextIndex)
+        index.verify()
+        assert_rephrase_parity(index)
@@ -0,0 +1,95 @@
+#
+# Copyright 2020-2023 IBM Inc. All rights reserved
+# SPDX-License-Identifier: Apache2.0
+#
+
+import pytest
+
+from tools.content_reloader import ContentReloader
+from tools.db_manager import DBManager
+from tools.language_content import LanguageML
+
+LAZY_CONTENT = {'lazy': True, 'preload': [], 'memory_budget_mb': None}
+
+
+class TextML(LanguageML):
+    # a component that reads a text document per language when the language is first used
+
+    def create(self, language_code):
+        return DBManager().read_authored_text('text_%s' % language_code)
+
+
+def test_reload_all_reaches_the_other_workers(create_db_manager):
+    create_db_manager()
+    generations = iter(range(1, 100))
+    # two workers of the same service, each with its own reloader
+    worker = ContentReloader(lambda: next(generations), 0)
+    other_worker = ContentReloader(lambda: next(generations), 0)
+    assert not worker.reload() and not other_worker.reload()
+
+    assert worker.reload_all()
+    assert worker.get() == 1
+    assert other_worker.reload()
+    assert other_worker.get() == 2 and other_worker.get_version() == worker.get_version()
+    assert not worker.reload() and not other_worker.reload()
+
+
+def test_upload_sets_the_version_once(create_db_manager):
+    db_manager = create_db_manager()
+    worker = ContentReloader(lambda: None, None)
+    version = db_manager.read_content_version()
+    with db_manager.content_upload():
+        db_manager.upload_authored_text('text_en', 'first')
+        # a worker that polls in the middle of the upload does not reload
+        assert not worker.reload()
+        db_manager.upload_authored_text('text_es', 'second')
+        assert db_manager.read_content_version() == version
+    assert db_manager.read_content_version() != version
+    assert worker.reload()
+
+    version = db_manager.read_content_version()
+    with pytest.raises(ValueError):
+        with db_manager.content_upload():
+            db_manager.upload_authored_text('text_en', 'partial')
+            raise ValueError()
+    assert db_manager.read_content_version() == version
+
+
+def test_reload_renews_the_configured_singletons(create_db_manager):
+    db_manager = create_db_manager()
+    from tools.scores_cache import ScoresCache
+    scores_cache = ScoresCache()
+    worker = ContentReloader(lambda: ScoresCache(), scores_cache)
+    configuration = db_manager.read_configuration()
+    configuration.data['scores_cache'] = {'enabled': True, 'max_size': 10, 'ttl': None}
+    db_manager.upload_configuration(configuration)
+
+    assert worker.reload()
+    assert worker.get() is ScoresCache() and worker.get() is not scores_cache and ScoresCache().enabled
+
+    def fail():
+        raise RuntimeError()
+
+    failing_worker = ContentReloader(fail, None)
+    db_manager.update_content_version()
+    with pytest.raises(RuntimeError):
+        failing_worker.reload()
+    assert ScoresCache() is worker.get()
+
+
+def test_generation_loads_languages_from_its_content(create_db_manager):
+    db_manager = create_db_manager(language_content=LAZY_CONTENT)
+    with db_manager.content_upload():
+        db_manager.upload_authored_text('text_en', 'old en')
+        db_manager.upload_authored_text('text_es', 'old es')
+    worker = ContentReloader(lambda: TextML(['en', 'es']), TextML(['en', 'es']))
+    old_generation = worker.get()
+    assert old_generation['en'] == 'old en'
+
+    with db_manager.content_upload():
+        db_manager.upload_authored_text('text_en', 'new en')
+        db_manager.upload_authored_text('text_es', 'new es')
+    assert worker.reload()
+    # the previous generation loads its next language from the content it was created from
+    assert old_generation['es'] == 'old es'
+    assert worker.get()['en'] == 'new en' and worker.get()['es'] == 'new es'
@@ -0,0 +1,145 @@
+#
+# Copyright 2020-2023 IBM Inc. All rights reserved
+# SPDX-License-Identifier: Apache2.0
+#
+
+import pytest
+
+from tools.db_manager import create_delta_commit_update
+
+SESSION_CACHE = {'enabled': True, 'max_size': 10, 'idle_ttl': None, 'validation_interval_ms': 60000}
+
+
+@pytest.fixture
+def db_manager(create_db_manager):
+    return create_db_manager(session_cache=SESSION_CACHE)
+
+
+def add_user_message(dialog_data, text):
+    return dialog_data.add_user_input(text, None, None, False, text, False, False, None)
+
+
+def read_record(db_manager, dialog_data):
+    return db_manager.client[db_manager.db_name].dialogs.find_one({'_id': dialog_data.get_dialog_id()})
+
+
+def get_texts(record):
+    return [message['text'] for message in record['data'].get('messages', [])]
+
+
+def get_dialog_texts(dialog_data):
+    return [message['text'] for message in dialog_data.get_messages()]
+
+
+def create_committed_dialog(db_manager, *texts):
+    dialog_data = db_manager.create_dialog()
+    for text in texts:
+        add_user_message(dialog_data, text)
+    db_manager.commit(dialog_data)
+    return dialog_data
+
+
+def test_first_commit_sets_the_messages(db_manager):
+    dialog_data = db_manager.create_dialog()
+    add_user_message(dialog_data, 'first')
+    update = create_delta_commit_update(dialog_data)
+    assert list(update["$set"]) == ['data.messages']
+
+    db_manager.commit(dialog_data)
+    record = read_record(db_manager, dialog_data)
+    assert get_texts(record) == ['first'] and record['revision'] == 1
+
+
+def test_new_messages_only(db_manager):
+    dialog_data = create_committed_dialog(db_manager, 'first')
+    add_user_message(dialog_data, 'second')
+    add_user_message(dialog_data, 'third')
+    update = create_delta_commit_update(dialog_data)
+    assert list(update["$set"]) == ['data.messages.1', 'data.messages.2']
+
+    db_manager.commit(dialog_data)
+    record = read_record(db_manager, dialog_data)
+    assert get_texts(record) == ['first', 'second', 'third'] and record['revision'] == 2
+    assert dialog_data.revision == 2 and not dialog_data.has_changes()
+
+
+def test_updated_fields_only(db_manager):
+    dialog_data = create_committed_dialog(db_manager, 'first')
+    dialog_data.update_message_feedback(0, True)
+    dialog_data.add_appen_code('code')
+    update = create_delta_commit_update(dialog_data)
+    assert update == {'$set': {'data.messages.0.feedback': True, 'data.appen_code': 'code'},
+                      '$inc': {'revision': 1}}
+
+    db_manager.commit(dialog_data)
+    record = read_record(db_manager, dialog_data)
+    assert record['data']['messages'][0]['feedback'] is True and record['data']['appen_code'] == 'code'
+    assert record['revision'] == 2
+
+
+def test_new_messages_with_updated_message_in_one_update(db_manager):
+    dialog_data = create_committed_dialog(db_manager, 'first')
+    dialog_data.update_message_feedback(0, True)
+    add_user_message(dialog_data, 'second')
+    update = create_delta_commit_update(dialog_data)
+    assert set(update["$set"]) == {'data.messages.0.feedback', 'data.messages.1'}
+
+    db_manager.commit(dialog_data)
+    record = read_record(db_manager, dialog_data)
+    assert get_texts(record) == ['first', 'second'] and record['data']['messages'][0]['feedback'] is True
+    assert record['revision'] == 2 and dialog_data.revision == 2
+    cached, _ = db_manager.get_dialog_cache().get(dialog_data.get_dialog_id())
+    assert cached.revision == 2 and get_dialog_texts(cached) == ['first', 'second']
+
+
+def read_turns(db_manager, dialog_data):
+    # two turns of the same session that read the same revision
+    session_id = str(dialog_data.get_dialog_id())
+    return db_manager.get_dialog_data(session_id), db_manager.get_dialog_data(session_id)
+
+
+def test_conflict_with_updated_fields_keeps_both_writers(db_manager):
+    dialog_data = create_committed_dialog(db_manager, 'first')
+    turn1, turn2 = read_turns(db_manager, dialog_data)
+    turn1.update_message_feedback(0, True)
+    message_id = add_user_message(turn2, 'from turn 2')
+
+    db_manager.commit(turn1)
+    db_manager.commit(turn2)
+    record = read_record(db_manager, dialog_data)
+    # the message is stored at the index returned for it
+    assert get_texts(record) == ['first', 'from turn 2'] and message_id == 1
+    assert record['data']['messages'][0]['feedback'] is True and record['revision'] == 3
+
+    # the conflicting writer does not cache its view of the dialog, so the next read has both changes
+    assert db_manager.get_dialog_cache().get(dialog_data.get_dialog_id())[0] is None
+    assert turn2.revision == 1 and not turn2.has_changes()
+    assert db_manager.get_dialog_data(str(dialog_data.get_dialog_id())).get_messages()[0]['feedback'] is True
+
+
+def test_conflict_with_new_messages_rewrites_the_dialog(db_manager):
+    dialog_data = create_committed_dialog(db_manager, 'first')
+    turn1, turn2 = read_turns(db_manager, dialog_data)
+    add_user_message(turn1, 'from turn 1')
+    turn2.update_message_feedback(0, True)
+    message_id = add_user_message(turn2, 'from turn 2')
+
+    db_manager.commit(turn1)
+    db_manager.commit(turn2)
+    record = read_record(db_manager, dialog_data)
+    # the messages are not appended after the ones of the other writer, which would move them away from
+    # the indices returned for them. the dialog is stored as the last writer has it.
+    assert get_texts(record) == ['first', 'from turn 2'] and message_id == 1
+    assert record['data']['messages'][0]['feedback'] is True and record['revision'] == 3
+    assert turn2.revision == 3 and not turn2.has_changes()
+    cached, _ = db_manager.get_dialog_cache().get(dialog_data.get_dialog_id())
+    assert cached.revision == 3 and get_dialog_texts(cached) == ['first', 'from turn 2']
+
+
+def test_commit_of_deleted_dialog(db_manager):
+    dialog_data = create_committed_dialog(db_manager, 'first')
+    db_manager.client[db_manager.db_name].dialogs.delete_one({'_id': dialog_data.get_dialog_id()})
+    add_user_message(dialog_data, 'second')
+    db_manager.commit(dialog_data)
+    assert read_record(db_manager, dialog_data) is None
+    assert db_manager.get_dialog_cache().get(dialog_data.get_dialog_id())[0] is None
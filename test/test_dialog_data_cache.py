@@ -0,0 +1,70 @@
+#
+# Copyright 2020-2023 IBM Inc. All rights reserved
+# SPDX-License-Identifier: Apache2.0
+#
+
+import threading
+
+import pytest
+
+SESSION_CACHE = {'enabled': True, 'max_size': 10, 'idle_ttl': None, 'validation_interval_ms': 60000}
+
+
+@pytest.fixture
+def db_manager(create_db_manager):
+    return create_db_manager(session_cache=SESSION_CACHE)
+
+
+def add_user_message(dialog_data, text):
+    return dialog_data.add_user_input(text, None, None, False, text, False, False, None)
+
+
+def test_cache_serves_copies(db_manager):
+    dialog_data = db_manager.create_dialog()
+    session_id = str(dialog_data.get_dialog_id())
+    add_user_message(dialog_data, 'uncommitted')
+
+    first = db_manager.get_dialog_data(session_id)
+    second = db_manager.get_dialog_data(session_id)
+    assert first is not second and first.dialog_data is not second.dialog_data
+    assert first.get_messages() == []
+    add_user_message(first, 'hello')
+    assert second.get_messages() == []
+    assert db_manager.get_dialog_data(session_id).get_messages() == []
+
+
+def test_concurrent_turns_of_a_session(db_manager):
+    session_id = str(db_manager.create_dialog().get_dialog_id())
+    n_turns = 8
+    barrier = threading.Barrier(n_turns)
+    seen = [None] * n_turns
+
+    def turn(i):
+        dialog_data = db_manager.get_dialog_data(session_id)
+        barrier.wait()
+        add_user_message(dialog_data, 'turn %d' % i)
+        barrier.wait()
+        # each turn sees only its own message, even though all of them read the same cached dialog
+        seen[i] = [message['text'] for message in dialog_data.get_new_messages()]
+
+    threads = [threading.Thread(target=turn, args=(i,)) for i in range(n_turns)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert seen == [['turn %d' % i] for i in range(n_turns)]
+    assert db_manager.get_dialog_data(session_id).get_messages() == []
+
+
+def test_commit_updates_cached_copy(db_manager):
+    dialog_data = db_manager.create_dialog()
+    session_id = str(dialog_data.get_dialog_id())
+    add_user_message(dialog_data, 'hello')
+    db_manager.commit(dialog_data)
+    add_user_message(dialog_data, 'not committed')
+
+    cached, is_valid = db_manager.get_dialog_cache().get(dialog_data.get_dialog_id())
+    assert is_valid and cached.revision == 1
+    assert [message['text'] for message in cached.get_messages()] == ['hello']
+    assert not cached.has_changes()
+    assert [message['text'] for message in db_manager.get_dialog_data(session_id).get_messages()] == ['hello']
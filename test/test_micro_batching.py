@@ -0,0 +1,156 @@
+#
+# Copyright 2020-2023 IBM Inc. All rights reserved
+# SPDX-License-Identifier: Apache2.0
+#
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from tools.micro_batching import create_batch_request, split_batch_response
+
+INTENTS = ['kp_a', 'kp_b', 'kp_c']
+
+
+def score_text(text):
+    # the response of the stub classifier to a single text: all the intents, by descending score
+    scores = [(len(text) * (i + 1)) % 7 / 10 for i in range(len(INTENTS))]
+    ranked = sorted(zip(INTENTS, scores), key=lambda item: -item[1])
+    return [intent for intent, _ in ranked], [score for _, score in ranked]
+
+
+class StubClassifier:
+    # a classifier service that implements the batch contract of micro_batching, or returns
+    # the intents once for all the texts of a batch if shared_intents is set
+
+    def __init__(self):
+        self.requests = []
+        self.shared_intents = False
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_POST(self):
+                texts = json.loads(self.rfile.read(int(self.headers['Content-Length'])))['text']
+                stub.requests.append(texts)
+                if isinstance(texts, str):
+                    intents, scores = score_text(texts)
+                    data = {'intents': intents, 'scores': scores}
+                else:
+                    results = [score_text(text) for text, in texts]
+                    data = {'intents': INTENTS if stub.shared_intents else [intents for intents, _ in results],
+                            'scores': [scores for _, scores in results]}
+                body = json.dumps(data).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:%d/score' % self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub():
+    stub = StubClassifier()
+    yield stub
+    stub.close()
+
+
+@pytest.fixture
+def create_service(create_db_manager, configuration_data, stub):
+    def create(**micro_batching):
+        create_db_manager(micro_batching={'enabled': True, 'window_ms': 200, 'max_batch_size': 4, **micro_batching},
+                          kp_matching={**configuration_data['kp_matching'], 'endpoint': stub.url})
+
+    return create
+
+
+def test_split_batch_response():
+    assert split_batch_response({'intents': ['a', 'b'], 'scores': [0.9, 0.1]}, 1) == [(['a', 'b'], [0.9, 0.1])]
+    assert split_batch_response({'intents': [['a', 'b'], ['b', 'a']], 'scores': [[0.9, 0.1], [0.8, 0.2]]}, 2) == \
+        [(['a', 'b'], [0.9, 0.1]), (['b', 'a'], [0.8, 0.2])]
+    assert create_batch_request(['x']) == {'text': 'x'}
+    assert create_batch_request(['x', 'y']) == {'text': [['x'], ['y']]}
+    # any other shape fails, rather than being guessed
+    for data in [{'intents': ['a', 'b'], 'scores': [[0.9, 0.1], [0.8, 0.2]]},
+                 {'intents': [['a', 'b']], 'scores': [[0.9, 0.1]]},
+                 {'intents': [['a', 'b'], ['a']], 'scores': [[0.9, 0.1], [0.8, 0.2]]},
+                 {'scores': [[0.9, 0.1], [0.8, 0.2]]}]:
+        with pytest.raises(ValueError):
+            split_batch_response(data, 2)
+
+
+def test_concurrent_texts_are_batched(create_service, stub):
+    create_service()
+    from tools.service_utils import get_scores
+    texts = ['text %s' % ('x' * i) for i in range(4)]
+    results = [None] * len(texts)
+
+    def call(i):
+        results[i] = get_scores(stub.url, texts[i], False)
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(len(texts))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [score_text(text) for text in texts]
+    # a full batch is sent at once, without waiting for the window
+    assert len(stub.requests) == 1 and sorted(text for text, in stub.requests[0]) == sorted(texts)
+
+
+def test_single_text_is_a_plain_request(create_service, stub):
+    create_service()
+    from tools.service_utils import get_scores
+    assert get_scores(stub.url, 'a text', False) == score_text('a text')
+    assert stub.requests == ['a text']
+
+
+def test_unexpected_batch_response_fails(create_service, stub):
+    create_service(window_ms=5, max_batch_size=2)
+    stub.shared_intents = True
+    from tools.service_utils import get_scores
+    errors = []
+
+    def call(text):
+        try:
+            get_scores(stub.url, text, False)
+        except ValueError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call, args=(text,)) for text in ['first text', 'second text']]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(errors) == 2
+
+
+def test_match_to_existing_kps(create_service, stub, monkeypatch):
+    create_service()
+    from tools import db_utils
+    db_utils.import_kp_idx_path('kps_to_parent.csv')
+    import components.kp_matching
+    from components.kp_matching import KpMatching
+    monkeypatch.setattr(components.kp_matching, 'MATCH_BATCH_SIZE', 2)
+    kp_matching = KpMatching()
+    args = ['first', 'second arg', 'the third arg', 'x', 'y']
+    confident_matches, all_matches_scores = kp_matching.match_to_existing_kps(args)
+    assert stub.requests == [[['first'], ['second arg']], [['the third arg'], ['x']], 'y']
+    for arg, confident, all_scores in zip(args, confident_matches, all_matches_scores):
+        intents, scores = score_text(arg)
+        assert list(all_scores.items()) == list(zip(intents, scores))
+        assert confident == [intent for intent, score in zip(intents, scores) if score > kp_matching.confidence]
@@ -0,0 +1,112 @@
+#
+# Copyright 2020-2023 IBM Inc. All rights reserved
+# SPDX-License-Identifier: Apache2.0
+#
+
+import os
+import random
+import re
+
+import pandas as pd
+import pytest
+
+from tools.phrase_matcher import PhraseMatcher
+
+RESPONSE_DB_DIR = os.path.join('resources', 'response_db')
+# the texts around a phrase: punctuation, apostrophes, hyphens, digits, underscores and non-ascii
+# word and non-word characters, each of which may or may not be a word boundary
+AFFIXES = ['', ' ', '  ', 'x', 's', "'", "'s", "n't ", '-', '--', '.', '!?', '_', '1', 'é', 'ß', 'я', '中',
+           ' é ', ' ', '\t', '🖕', ' a ']
+
+
+def read_lexicon():
+    # the lexicon as uploaded by db_utils
+    df = pd.read_csv(os.path.join(RESPONSE_DB_DIR, 'profanity_lexicon.csv'))
+    terms = [term.strip().lower() for term in df['lexicon'].tolist()]
+    return [term for term in terms if len(term) > 0]
+
+
+def create_regex(phrases):
+    # the lexicon regex of the profanity classifier before the phrase matcher
+    return re.compile(r"\b(" + "|".join([re.escape(phrase) for phrase in phrases]) + r")\b")
+
+
+def create_texts(lexicon, rng):
+    texts = []
+    for term in lexicon:
+        variants = [term, term[:-1], term + term[-1], term.replace(' ', '-'), term.replace(' ', '  '),
+                    term.replace(' ', "'"), term.upper()]
+        for variant in variants:
+            texts.extend(rng.choice(AFFIXES) + variant + rng.choice(AFFIXES) for _ in range(6))
+        texts.extend(prefix + term + suffix for prefix in AFFIXES for suffix in ['', ' ', 'x', "'", 'é', '-'])
+    # sequences of terms and affixes, where terms overlap or are cut by their neighbours
+    for _ in range(5000):
+        texts.append(''.join(rng.choice(lexicon) if rng.random() < 0.4 else rng.choice(AFFIXES)
+                             for _ in range(rng.randint(1, 6))))
+    return texts
+
+
+@pytest.fixture(scope='module')
+def lexicon():
+    return read_lexicon()
+
+
+def test_lexicon_parity(lexicon):
+    assert len(lexicon) > 500 and any(' ' in term for term in lexicon)
+    assert any(re.search(r'[^\x00-\x7f]', term) for term in lexicon)
+    matcher = PhraseMatcher(lexicon)
+    regex = create_regex(lexicon)
+    texts = create_texts(lexicon, random.Random(0))
+    mismatches = [text for text in texts if matcher.search(text) != (regex.search(text) is not None)]
+    assert mismatches == []
+    assert 0 < sum(matcher.search(text) for text in texts) < len(texts)
+
+
+@pytest.mark.parametrize('phrases', [
+    ['a b', 'b c'],
+    ["don't", "'", "t'"],
+    ['-', 'x-', '-x', 'x - x'],
+    ['é', 'café', 'naïve word'],
+    ['🖕', '🖕🖕', 'a🖕'],
+    ['ab', 'b', 'abc d', 'c d e'],
+    ['', 'x'],
+    [''],
+])
+def test_adversarial_parity(phrases):
+    matcher = PhraseMatcher(phrases)
+    regex = create_regex(phrases)
+    rng = random.Random(1)
+    texts = [''.join(rng.choice(phrases + AFFIXES) for _ in range(rng.randint(0, 5))) for _ in range(3000)]
+    mismatches = [text for text in texts if matcher.search(text) != (regex.search(text) is not None)]
+    assert mismatches == []
+
+
+def test_profanity_classifier_parity(create_db_manager, upload_content, lexicon):
+    # the classifier decisions on response db texts, with lexicon terms and adversarial affixes
+    # inserted into some of them, are the decisions of the previous regexes
+    create_db_manager()
+    upload_content()
+    from components.profanity_classifier import ProfanityClassifier
+    from tools.db_manager import DBManager
+    classifier = ProfanityClassifier()
+    profanity_texts = [text.strip().lower() for text in DBManager().read_profanity_texts()]
+    regex_lexicon = create_regex(lexicon)
+    regex_texts = re.compile(r"^(" + "|".join([re.escape(text) for text in profanity_texts]) + r")$")
+
+    def apply_regex(user_text):
+        user_text = classifier.normalize(user_text)
+        return regex_texts.match(user_text) is not None or regex_lexicon.search(user_text) is not None
+
+    rng = random.Random(2)
+    df = pd.read_csv(os.path.join(RESPONSE_DB_DIR, 'response_db_en.csv'))
+    responses = df['system_response'].dropna().tolist()
+    user_texts = list(profanity_texts)
+    for _ in range(3000):
+        words = rng.choice(responses).split()[:rng.randint(1, 20)]
+        if rng.random() < 0.5:
+            words.insert(rng.randint(0, len(words)), rng.choice(AFFIXES) + rng.choice(lexicon) + rng.choice(AFFIXES))
+        user_texts.append(' '.join(words))
+    expected = [apply_regex(user_text) for user_text in user_texts]
+    assert [bool(classifier.apply(user_text)) for user_text in user_texts] == expected
+    assert [bool(decision) for decision in classifier.apply_many(user_texts)] == expected
+    assert 0 < sum(expected) < len(expected)
@@ -0,0 +1,48 @@
+#
+# Copyright 2020-2023 IBM Inc. All rights reserved
+# SPDX-License-Identifier: Apache2.0
+#
+
+import pandas as pd
+import pytest
+
+from tools import profanity_utils
+from tools.profanity_utils import append_cases, get_chunk_cases, read_case_keys
+
+
+@pytest.fixture
+def cases_files(tmp_path, monkeypatch):
+    cases_files = {case_type: str(tmp_path / path) for case_type, path in profanity_utils.CASES_FILES.items()}
+    monkeypatch.setattr(profanity_utils, 'CASES_FILES', cases_files)
+    return cases_files
+
+
+def create_chunk(dialog_id):
+    user_messages = [(dialog_id, 1, {'text': 'missed', 'date': '2023-01-01'}),
+                     (dialog_id, 3, {'text': 'flagged', 'date': '2023-01-01', 'is_profanity': True}),
+                     (dialog_id, 5, {'text': 'clean', 'date': '2023-01-01', 'is_profanity': False})]
+    return user_messages, [True, False, False]
+
+
+def test_chunk_cases():
+    cases, missed_message_ids = get_chunk_cases(*create_chunk('d1'))
+    assert [(case_type, case['message_id']) for case_type, case in cases] == [('missed', 1), ('diff_old', 3)]
+    assert missed_message_ids == {'d1': [1]}
+
+
+def test_resumed_chunk_does_not_duplicate_cases(cases_files):
+    case_keys = read_case_keys()
+    for i, dialog_id in enumerate(['d1', 'd2']):
+        cases, _ = get_chunk_cases(*create_chunk(dialog_id))
+        assert len(append_cases(cases, i == 0, case_keys)) == 2
+    # the job stopped after the cases of d2 were written and before its checkpoint, so it
+    # continues after d1 and processes d2 again
+    case_keys = read_case_keys()
+    for dialog_id in ['d2', 'd3']:
+        cases, _ = get_chunk_cases(*create_chunk(dialog_id))
+        append_cases(cases, False, case_keys)
+    for case_type, message_id in [('missed', 1), ('diff_old', 3)]:
+        df = pd.read_csv(cases_files[case_type], index_col=0, dtype={'dialog_id': str})
+        assert df[['dialog_id', 'message_id']].values.tolist() == [[d, message_id] for d in ['d1', 'd2', 'd3']]
+        assert df.index.tolist() == [0, 1, 2]
+    assert len(pd.read_csv(cases_files['diff_new'], index_col=0)) == 0
@@ -0,0 +1,137 @@
+#
+# Copyright 2020-2023 IBM Inc. All rights reserved
+# SPDX-License-Identifier: Apache2.0
+#
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from tools.resilience import CircuitOpenError, DeadlineExceeded, HedgeBudget, deadline_scope
+
+URL = 'http://classifier'
+
+
+@pytest.fixture
+def create_resilience(create_db_manager):
+    def create(**settings):
+        create_db_manager(resilience={'turn_budget': None, 'hedge_delay_ms': None, 'hedge_budget': 0.1,
+                                      'hedge_max_workers': 4, 'fallbacks': False,
+                                      'circuit_breaker': {'enabled': True, 'failure_threshold': 2,
+                                                          'reset_timeout': 60}, **settings})
+        from tools.resilience import Resilience
+        return Resilience()
+
+    return create
+
+
+class Endpoint:
+    # a classifier call that takes delay seconds, and records the threads it was called from
+
+    def __init__(self, delay=0.0, error=None):
+        self.delay = delay
+        self.error = error
+        self.threads = []
+        self.lock = threading.Lock()
+
+    def __call__(self, text):
+        with self.lock:
+            self.threads.append(threading.current_thread().name)
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return text
+
+    def get_calls(self):
+        return len(self.threads)
+
+
+def test_hedge_budget():
+    budget = HedgeBudget(0.25)
+    assert not budget.try_take()
+    for _ in range(4):
+        budget.on_call()
+    assert budget.try_take() and not budget.try_take()
+    for _ in range(1000):
+        budget.on_call()
+    assert sum(budget.try_take() for _ in range(100)) == 10
+
+
+def test_hedges_are_limited_by_the_budget(create_resilience):
+    resilience = create_resilience(hedge_delay_ms=5, hedge_budget=0.25)
+    endpoint = Endpoint(delay=0.03)
+    for i in range(20):
+        assert resilience.call(URL, endpoint, i) == i
+    # 20 calls, of which 5 were hedged
+    assert endpoint.get_calls() == 25
+
+
+def test_trial_call_is_not_hedged(create_resilience):
+    resilience = create_resilience(hedge_delay_ms=5, hedge_budget=1,
+                                   circuit_breaker={'enabled': True, 'failure_threshold': 1, 'reset_timeout': 0})
+    with pytest.raises(ValueError):
+        resilience.call(URL, Endpoint(error=ValueError()), 'text')
+    assert resilience.get_breaker(URL).is_open()
+    endpoint = Endpoint(delay=0.03)
+    assert resilience.call(URL, endpoint, 'text') == 'text'
+    assert endpoint.get_calls() == 1 and not resilience.get_breaker(URL).is_open()
+
+
+def test_busy_executor_is_not_hedged(create_resilience):
+    resilience = create_resilience(hedge_delay_ms=5, hedge_budget=1, hedge_max_workers=1)
+    blocker = Endpoint(delay=0.2)
+    thread = threading.Thread(target=resilience.call, args=(URL, blocker, 'blocker'))
+    thread.start()
+    time.sleep(0.05)
+    endpoint = Endpoint(delay=0.03)
+    assert resilience.call(URL, endpoint, 'text') == 'text'
+    # the call was made directly by the caller, without a hedge
+    assert endpoint.threads == [threading.current_thread().name]
+    thread.join()
+    assert resilience.hedge_in_flight == 0
+
+
+def test_deadline_is_not_an_endpoint_failure(create_resilience):
+    resilience = create_resilience(circuit_breaker={'enabled': True, 'failure_threshold': 1, 'reset_timeout': 60})
+    with pytest.raises(DeadlineExceeded):
+        resilience.call(URL, Endpoint(error=DeadlineExceeded()), 'text')
+    # a call whose timeout was cut to the remaining time of the turn
+    with deadline_scope(0.01):
+        with pytest.raises(TimeoutError):
+            resilience.call(URL, Endpoint(delay=0.02, error=TimeoutError()), 'text')
+    assert not resilience.get_breaker(URL).is_open()
+
+    with pytest.raises(ValueError):
+        resilience.call(URL, Endpoint(error=ValueError()), 'text')
+    assert resilience.get_breaker(URL).is_open()
+    with pytest.raises(CircuitOpenError):
+        resilience.call(URL, Endpoint(), 'text')
+
+
+def test_aborted_trial_call_releases_the_trial(create_resilience):
+    resilience = create_resilience(circuit_breaker={'enabled': True, 'failure_threshold': 1, 'reset_timeout': 0})
+    with pytest.raises(ValueError):
+        resilience.call(URL, Endpoint(error=ValueError()), 'text')
+    with pytest.raises(DeadlineExceeded):
+        resilience.call(URL, Endpoint(error=DeadlineExceeded()), 'text')
+    assert not resilience.get_breaker(URL).is_half_open()
+    assert resilience.call(URL, Endpoint(), 'text') == 'text'
+    assert not resilience.get_breaker(URL).is_open()
+
+
+def test_async_hedges_are_limited_by_the_budget(create_resilience):
+    resilience = create_resilience(hedge_delay_ms=5, hedge_budget=0.5)
+    calls = []
+
+    async def endpoint(text):
+        calls.append(text)
+        await asyncio.sleep(0.03)
+        return text
+
+    async def run():
+        return [await resilience.async_call(URL, endpoint, i) for i in range(10)]
+
+    assert asyncio.run(run()) == list(range(10))
+    assert len(calls) == 15
@@ -8,6 +8,8 @@ NO_CANNED_TEXT_TYPE = 'no_canned_text'
 
 
 class Argument:
+    __slots__ = ('text', 'type', 'base_response', 'canned_text', 'expression', 'link_replacement')
+
     def __init__(self, text, arg_type, base_response=None, canned_text=None, expression=None, link_replacement=None):
         self.text = text
         self.type = arg_type
@@ -0,0 +1,50 @@
+#
+# Copyright 2020-2023 IBM Inc. All rights reserved
+# SPDX-License-Identifier: Apache2.0
+#
+
+from concurrent.futures import ProcessPoolExecutor
+
+BATCH_CHUNK_SIZE = 2000
+
+# the component of the processes of a pool, set once when each process starts
+worker_component = None
+
+
+def init_worker(component):
+    global worker_component
+    worker_component = component
+
+
+def apply_worker(method_name, inputs):
+    return getattr(worker_component, method_name)(inputs)
+
+
+# a pool of processes, each with a copy of the component. the list method of the component is applied
+# to inputs with executor.submit(apply_worker, method_name, inputs).
+def create_batch_executor(component, n_processes):
+    return ProcessPoolExecutor(max_workers=n_processes, initializer=init_worker, initargs=(component,))
+
+
+# applies the list method of a component (a method that takes a list of inputs and returns a list of
+# results) to a batch of inputs. each distinct key is processed once, and if n_processes is above 1
+# the distinct inputs are split into chunks that are processed by a pool of processes, to which the
+# component is copied once. the keys are the inputs if not given.
+def apply_batch(component, method_name, inputs, keys=None, n_processes=1, chunk_size=BATCH_CHUNK_SIZE):
+    unique_ids = {}
+    unique_inputs = []
+    positions = []
+    for item, key in zip(inputs, keys if keys is not None else inputs):
+        if key not in unique_ids:
+            unique_ids[key] = len(unique_inputs)
+            unique_inputs.append(item)
+        positions.append(unique_ids[key])
+
+    if n_processes > 1 and len(unique_inputs) > chunk_size:
+        chunks = [unique_inputs[i:i + chunk_size] for i in range(0, len(unique_inputs), chunk_size)]
+        with create_batch_executor(component, n_processes) as executor:
+            results = [result for chunk_results in executor.map(apply_worker, [method_name] * len(chunks), chunks)
+                       for result in chunk_results]
+    else:
+        results = getattr(component, method_name)(unique_inputs)
+    return [results[i] for i in positions]
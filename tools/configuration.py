@@ -5,6 +5,110 @@
 
 import os
 
+CLASSIFIER_FAN_OUT_DEFAULTS = {
+    'enabled': False,
+    'max_workers': 40,
+}
+
+HTTP_CLIENT_DEFAULTS = {
+    'connect_timeout': 2,
+    'read_timeout': 10,
+    'retries': 2,
+    'backoff_factor': 0.05,
+    'max_backoff': 1,
+    'retry_statuses': [502, 503, 504],
+    'pool_connections': 10,
+    'pool_maxsize': 50,
+    'keepalive_expiry': 30,
+}
+
+RESILIENCE_DEFAULTS = {
+    # the time (in seconds) the remote calls of a turn may take together, None for no limit
+    'turn_budget': None,
+    # a second request is sent if a call to a classifier did not return within the delay, None disables it
+    'hedge_delay_ms': None,
+    # the fraction of the calls that may be hedged
+    'hedge_budget': 0.1,
+    'hedge_max_workers': 40,
+    # whether a failed classifier call falls back to the default intent and no confident kp,
+    # rather than failing the turn
+    'fallbacks': False,
+    'circuit_breaker': {
+        'enabled': False,
+        # consecutive failures that open the circuit of an endpoint
+        'failure_threshold': 5,
+        # seconds until a trial call is let through an open circuit
+        'reset_timeout': 30,
+    },
+}
+
+SCORES_CACHE_DEFAULTS = {
+    'enabled': False,
+    'max_size': 20000,
+    'ttl': 3600,
+}
+
+MICRO_BATCHING_DEFAULTS = {
+    'enabled': False,
+    'window_ms': 5,
+    'max_batch_size': 32,
+}
+
+SESSION_CACHE_DEFAULTS = {
+    'enabled': False,
+    'max_size': 10000,
+    'idle_ttl': 1800,
+    'validation_interval_ms': 0,
+}
+
+LANGUAGE_CONTENT_DEFAULTS = {
+    # whether to create the content of a language on first use, rather than at startup
+    'lazy': False,
+    # languages created at startup (and never evicted) in lazy mode
+    'preload': [],
+    # evict the least recently used languages once their content exceeds this size
+    'memory_budget_mb': None,
+}
+
+CONTENT_RELOAD_DEFAULTS = {
+    # seconds between checks of the content version, None disables polling
+    'poll_interval': None,
+}
+
+LOCAL_KP_MATCHING_DEFAULTS = {
+    'enabled': False,
+    # the number of hashed features of the text vectors
+    'n_features': 4096,
+    # a local match is used if the similarity of the top kp is at least min_similarity, and
+    # exceeds the similarity of the second kp by at least min_margin
+    'min_similarity': 0.8,
+    'min_margin': 0.1,
+    # the rate of confident local matches that are also matched remotely, to measure their agreement
+    'shadow_rate': 0.05,
+}
+
+EMBEDDING_SCORER_DEFAULTS = {
+    # the number of hashed features of the text vectors
+    'n_features': 2048,
+    # the weight of each text of the dialog history relative to the next one
+    'history_decay': 0.5,
+    # the history encodings of recently active sessions
+    'session_cache_size': 5000,
+    'session_cache_ttl': 1800,
+}
+
+SHARED_CONTENT_STORE_DEFAULTS = {
+    # whether the worker processes of a host share the connecting text index through memory mapped files
+    'enabled': False,
+    'path': os.path.join('/dev', 'shm', 'vira'),
+}
+
+CONNECTING_TEXT_INDEX_DEFAULTS = {
+    'enabled': False,
+    # check at load time that the index produces the same arguments as the connecting text library
+    'verify': False,
+}
+
 
 class Configuration:
 
@@ -17,6 +121,9 @@ class Configuration:
     def get_kp_matching_confidence(self):
         return self.data['kp_matching']['confidence']
 
+    def get_local_kp_matching_settings(self):
+        return {**LOCAL_KP_MATCHING_DEFAULTS, **self.data['kp_matching'].get('local', {})}
+
     def get_wa_endpoint(self):
         return self.data['wa']['endpoint']
 
@@ -40,6 +147,9 @@ class Configuration:
             self.data['candidate_scorer']['base_dir'],
             self.data['candidate_scorer']['model_name'])
 
+    def get_embedding_scorer_settings(self):
+        return {**EMBEDDING_SCORER_DEFAULTS, **self.data['candidate_scorer'].get('embedding', {})}
+
     def get_last_usage_factors(self):
         model_name = self.data['candidate_scorer']['model_name']
         return self.data['candidate_scorer']['last_usage_factors'][model_name]
@@ -59,6 +169,38 @@ class Configuration:
     def get_advisory_mode(self):
         return self.data['advisory_mode']
 
+    def get_classifier_fan_out(self):
+        return {**CLASSIFIER_FAN_OUT_DEFAULTS, **self.data.get('classifier_fan_out', {})}
+
+    def get_http_client_settings(self):
+        return {**HTTP_CLIENT_DEFAULTS, **self.data.get('http_client', {})}
+
+    def get_resilience_settings(self):
+        settings = self.data.get('resilience', {})
+        return {**RESILIENCE_DEFAULTS, **settings,
+                'circuit_breaker': {**RESILIENCE_DEFAULTS['circuit_breaker'], **settings.get('circuit_breaker', {})}}
+
+    def get_scores_cache_settings(self):
+        return {**SCORES_CACHE_DEFAULTS, **self.data.get('scores_cache', {})}
+
+    def get_micro_batching_settings(self):
+        return {**MICRO_BATCHING_DEFAULTS, **self.data.get('micro_batching', {})}
+
+    def get_session_cache_settings(self):
+        return {**SESSION_CACHE_DEFAULTS, **self.data.get('session_cache', {})}
+
+    def get_language_content_settings(self):
+        return {**LANGUAGE_CONTENT_DEFAULTS, **self.data.get('language_content', {})}
+
+    def get_content_reload_settings(self):
+        return {**CONTENT_RELOAD_DEFAULTS, **self.data.get('content_reload', {})}
+
+    def get_shared_content_store_settings(self):
+        return {**SHARED_CONTENT_STORE_DEFAULTS, **self.data.get('shared_content_store', {})}
+
+    def get_connecting_text_index_settings(self):
+        return {**CONNECTING_TEXT_INDEX_DEFAULTS, **self.data.get('connecting_text_index', {})}
+
     def get_assessment_operators(self):
         return self.data['dialog_assessment']['operators']
 
@@ -0,0 +1,82 @@
+#
+# Copyright 2020-2023 IBM Inc. All rights reserved
+# SPDX-License-Identifier: Apache2.0
+#
+
+import logging
+import threading
+import time
+
+from tools.db_manager import DBManager
+from tools.http_client import HttpClient
+from tools.language_content import LanguageContent
+from tools.micro_batching import MicroBatching
+from tools.resilience import Resilience
+from tools.scores_cache import ScoresCache
+from tools.singleton import Singleton
+
+# the singletons created from the configuration, which are renewed with each content generation
+CONFIGURED_SINGLETONS = [LanguageContent, HttpClient, ScoresCache, Resilience, MicroBatching]
+
+
+class ContentReloader:
+    # holds the current generation of the components that depend on the content (i.e. the dialog
+    # manager). a reload builds a complete new generation from the current content while the previous
+    # one keeps serving, and then swaps it in. requests that already got the previous generation
+    # finish with it. the singletons created from the configuration are renewed together with the
+    # generation, and are restored if it fails.
+
+    def __init__(self, create_generation, generation):
+        self.create_generation = create_generation
+        self.generation = generation
+        self.version = DBManager().get_content_version()
+        self.lock = threading.Lock()
+
+    def get(self):
+        return self.generation
+
+    def get_version(self):
+        return self.version
+
+    # reloads if the content version changed (or if forced), and returns whether it reloaded
+    def reload(self, force=False):
+        with self.lock:
+            version = DBManager().refresh_content()
+            if version == self.version and not force:
+                return False
+            start_time = time.time()
+            logging.info('Reloading content version %s' % version)
+            generation = self.create_generation_with_singletons()
+            self.version = version
+            self.generation = generation
+            DBManager().save_content_snapshot()
+            logging.info('Reloaded content version %s (%.2fs)' % (version, time.time() - start_time))
+            return True
+
+    def create_generation_with_singletons(self):
+        instances = {cls: Singleton._instances.pop(cls) for cls in CONFIGURED_SINGLETONS
+                     if cls in Singleton._instances}
+        try:
+            return self.create_generation()
+        except BaseException:
+            for cls in CONFIGURED_SINGLETONS:
+                Singleton._instances.pop(cls, None)
+            Singleton._instances.update(instances)
+            raise
+
+    # reloads this process now, and the other processes that poll for content changes on their next
+    # poll, as a new content version is set (as when content is uploaded)
+    def reload_all(self):
+        DBManager().update_content_version()
+        return self.reload()
+
+    def start_polling(self, interval):
+        def poll():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.reload()
+                except Exception:
+                    logging.exception('Failed reloading the content')
+
+        threading.Thread(target=poll, name='content-reloader', daemon=True).start()
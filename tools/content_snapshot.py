@@ -0,0 +1,58 @@
+#
+# Copyright 2020-2023 IBM Inc. All rights reserved
+# SPDX-License-Identifier: Apache2.0
+#
+
+import copy
+import gzip
+import json
+import logging
+import os
+import uuid
+
+# the db collections holding the content (configuration and authored texts) of the service
+CONTENT_COLLECTIONS = ['configuration', 'authored_texts']
+
+
+def create_content_version():
+    return uuid.uuid4().hex
+
+
+class ContentSnapshot:
+    # a copy of the content documents read from the db, tagged with the content version they
+    # were read at. the documents are copied in and out, as callers may modify them.
+
+    def __init__(self, version, documents=None):
+        self.version = version
+        self.documents = documents if documents is not None else {}
+        self.changed = False
+
+    @classmethod
+    def get_key(cls, collection, name):
+        return '%s/%s' % (collection, name)
+
+    def get(self, collection, name):
+        data = self.documents.get(self.get_key(collection, name))
+        return copy.deepcopy(data) if data is not None else None
+
+    def put(self, collection, name, data):
+        self.documents[self.get_key(collection, name)] = copy.deepcopy(data)
+        self.changed = True
+
+    def has_changes(self):
+        return self.changed
+
+    @classmethod
+    def load(cls, path):
+        with gzip.open(path, 'rt', encoding='utf-8') as fp:
+            data = json.load(fp)
+        return cls(data['version'], data['documents'])
+
+    def save(self, path):
+        # written to a temporary file first, so a concurrent reader never sees a partial snapshot
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as fp:
+            json.dump({'version': self.version, 'documents': self.documents}, fp)
+        os.replace(tmp_path, path)
+        self.changed = False
+        logging.info('Saved content snapshot %s to %s (%d documents)' % (self.version, path, len(self.documents)))
@@ -4,6 +4,8 @@
 #
 
 import re
+from tools.batch_processing import apply_batch
+from tools.text_analysis import TextAnalysis
 from tools.text_cleansing import clean_words
 
 
@@ -13,14 +15,21 @@ class CoRefResolution:
     CONDITION_THEME = 'vaccine'
     MAX_LENGTH = 5
 
-    def apply(self, text):
+    def apply(self, text, analysis=None):
         pass
 
 
 class SimpleCoRefResolution(CoRefResolution):
 
-    def apply(self, text):
-        if len(clean_words(text)) <= self.MAX_LENGTH and self.CONDITION_THEME not in text:
+    def apply(self, text, analysis=None):
+        words = analysis.content_words if analysis is not None else clean_words(text)
+        if len(words) <= self.MAX_LENGTH and self.CONDITION_THEME not in text:
             text = re.sub(r"\bit's\b", self.GLOBAL_THEME + ' is', text)
             text = re.sub(r"\bit\b", self.GLOBAL_THEME, text)
         return text
+
+    def apply_many(self, texts):
+        return [self.apply(text, TextAnalysis(text)) for text in texts]
+
+    def apply_batch(self, texts, n_processes=1):
+        return apply_batch(self, 'apply_many', texts, n_processes=n_processes)
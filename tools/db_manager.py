@@ -8,17 +8,37 @@ import logging
 import os
 import re
 import socket
+from contextlib import contextmanager
+from contextvars import ContextVar
 from datetime import datetime, timedelta
 
 from bson.objectid import ObjectId
-from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, MongoClient, ReturnDocument, UpdateOne
+from pymongo.errors import OperationFailure
 from tqdm import tqdm
 
 from tools.configuration import Configuration
+from tools.content_snapshot import CONTENT_COLLECTIONS, ContentSnapshot, create_content_version
 from tools.dialog_data import DialogData
+from tools.dialog_data_cache import DialogDataCache
 from tools.singleton import Singleton
 
 
+DB_NAME = "vira"
+# replaces the configured database, e.g. by a local one for benchmarks
+DB_URL_VARIABLE = 'VIRA_DB_URL'
+DB_TIMEOUT_MS = 180 * 1000
+# a commit is retried at the current revision after conflicts with other writers of the dialog
+COMMIT_ATTEMPTS = 3
+CONFLICT_PROJECTION = {'revision': True, 'data.messages.side': True}
+# the content is read again if a new version was set while it was read
+CONTENT_READ_ATTEMPTS = 3
+# the content snapshot that the content reads of the current context are pinned to, if any (e.g. the
+# snapshot of the content generation that loads a language)
+pinned_content_snapshot = ContextVar('pinned_content_snapshot', default=None)
+
+
 def db_renew_client_on_exception(func):
     def inner(*args, **kwargs):
         try:
@@ -31,126 +51,424 @@ def db_renew_client_on_exception(func):
     return inner
 
 
+def async_db_renew_client_on_exception(func):
+    async def inner(*args, **kwargs):
+        try:
+            return await func(*args, **kwargs)
+        except Exception as e:
+            logging.error('Exception caught in %s - recreating client' % func.__name__)
+            self = args[0]
+            self.client = self.create_client()
+            raise e
+    return inner
+
+
+def read_db_url():
+    if DB_URL_VARIABLE in os.environ:
+        return os.environ[DB_URL_VARIABLE]
+    return read_credentials_db_url()
+
+
+def read_credentials_db_url():
+    db_conf_file = os.path.join('resources', 'db', 'db_credentials.json')
+    with open(db_conf_file, 'rt', encoding='utf-8') as fp:
+        data = json.load(fp)
+    return "mongodb://" + data['username'] + ":" + data['password'] + "@" + ''.join(data['endpoint'])
+
+
+# the certificate of the configured database. the tls options of a database set by VIRA_DB_URL, if any,
+# are given in its url
+def read_certificate_path():
+    return os.path.join('resources', 'db', 'certificate.crt') if DB_URL_VARIABLE not in os.environ else None
+
+
+def get_tls_options(certificate):
+    return {'tls': True, 'tlsCAFile': certificate} if certificate is not None else {}
+
+
+def read_content_snapshot_path():
+    return os.environ.get('VIRA_CONTENT_SNAPSHOT')
+
+
+def read_eval_label():
+    if 'EVAL_LABEL' in os.environ:
+        logging.info("Using label: [%s]" % os.environ['EVAL_LABEL'])
+        return os.environ['EVAL_LABEL']
+    return None
+
+
+def create_dialog_record(default_label, dialog_label=None, campaign_id=None, opening_survey_flow=None,
+                         platform=None, language_code=None):
+    record = {
+        "date": datetime.now(),
+        'data': {},
+        'revision': 0
+    }
+    if dialog_label is not None:
+        record['label'] = dialog_label
+    elif default_label is not None:
+        record['label'] = default_label
+    if campaign_id is not None:
+        record['campaign_id'] = campaign_id
+    if opening_survey_flow is not None:
+        record['opening_survey_flow'] = opening_survey_flow
+    if platform is not None:
+        record['platform'] = platform
+    if language_code is not None:
+        record['language_code'] = language_code
+    return record
+
+
+def to_dialog_id(session_id):
+    return ObjectId(session_id) if isinstance(session_id, str) else session_id
+
+
+def create_dialog_data(record, session_id, campaign_id=None, opening_survey_flow=None,
+                       platform=None, language_code=None):
+    if record is None:
+        raise ValueError("Session id not found in database (%s, %s)" % (DB_NAME, str(session_id)))
+    dialog_id = record['_id']
+    dialog_data = record['data']
+    if 'opening_survey_flow' in record:
+        opening_survey_flow = record['opening_survey_flow']
+    if 'campaign_id' in record.keys():
+        campaign_id = record['campaign_id']
+    if 'platform' in record.keys():
+        platform = record['platform']
+    if 'language_code' in record.keys():
+        language_code = record['language_code']
+    return DialogData(dialog_id, dialog_data, opening_survey_flow, campaign_id, platform, language_code,
+                      record.get('revision', 0))
+
+
+def create_dialogs_query(start_date=None, end_date=None, label=None, appen_codes=None,
+                         campaign_id=None, platform=None, language_code=None):
+    start = datetime.strptime(start_date, '%Y-%m-%d') if start_date is not None\
+        else datetime.strptime("2021-1-1", '%Y-%m-%d')
+    end = datetime.strptime(end_date, '%Y-%m-%d') if end_date is not None \
+        else datetime.now()
+    appen_codes_query = {"data.appen_code": {"$in": appen_codes}} if appen_codes is not None else {}
+    label_query = {"label": {"$eq": label}} if label is not None else {}
+    campaign_id_query = {"campaign_id": {"$eq": campaign_id}} if campaign_id is not None else {}
+    if platform is not None:
+        if platform == 'vaxchat':
+            platform_query = {"platform": {"$exists": False}}
+        else:
+            platform_query = {"platform": {"$eq": platform}}
+    else:
+        platform_query = {}
+    if language_code is not None:
+        if language_code == 'en':
+            language_query = {"$or": [{"language_code": {"$eq": 'en'}},
+                                      {"language_code": {"$exists": False}}]}
+        else:
+            language_query = {"language_code": {"$eq": language_code}}
+    else:
+        language_query = {}
+    return {"$and": [
+        {"date": {"$lt": end, "$gte": start}},
+        label_query,
+        appen_codes_query,
+        campaign_id_query,
+        platform_query,
+        language_query,
+    ]}
+
+
+def create_commit_update(dialog_data):
+    return {"$set": {'data': dialog_data.dialog_data}, "$inc": {'revision': 1}}
+
+
+def create_delta_commit_update(dialog_data):
+    # a single update that sets the updated fields and the new messages at their indices, which follow the
+    # committed messages of the revision the dialog was read at. the messages of a dialog that has none
+    # committed are set as a whole, since setting an index of a missing array creates a document.
+    fields = {'data.' + path: value for path, value in dialog_data.get_updated_fields().items()}
+    new_messages = dialog_data.get_new_messages()
+    if dialog_data.committed_message_count == 0:
+        if len(new_messages) > 0:
+            fields['data.messages'] = new_messages
+    else:
+        for i, message in enumerate(new_messages):
+            fields['data.messages.%d' % (dialog_data.committed_message_count + i)] = message
+    return {"$set": fields, "$inc": {'revision': 1}}
+
+
+def create_delta_commit_filter(dialog_data, revision):
+    # an update applies only to the revision it follows (dialogs created before revisions were introduced
+    # have none)
+    return {'_id': dialog_data.dialog_id, 'revision': revision if revision > 0 else {"$in": [0, None]}}
+
+
+def get_conflict_update(dialog_data, record):
+    # the update to apply after a revision conflict, given the current revision and messages of the
+    # dialog, and whether the dialog in the db then differs from the dialog data. the delta still applies
+    # if the other writer did not add messages. otherwise the new messages would not be at the indices
+    # this writer returned for them, so the dialog is rewritten as it has it, as commits did before deltas.
+    if len(record.get('data', {}).get('messages', [])) == dialog_data.committed_message_count:
+        return create_delta_commit_update(dialog_data), True
+    logging.warning('Dialog %s was rewritten over messages of another writer' % dialog_data.dialog_id)
+    return create_commit_update(dialog_data), False
+
+
+def set_committed(dialog_data, record, is_conflict, dialog_cache):
+    # the dialog may have been deleted in the meantime, or not committed, in which case it is not cached.
+    # after a conflict the dialog in the db has fields of another writer, so it is not cached either, and
+    # the dialog data keeps its revision, so it is not mistaken for the dialog in the db.
+    if record is None or is_conflict:
+        dialog_cache.remove(dialog_data.get_dialog_id())
+        dialog_data.set_committed(dialog_data.revision)
+        return
+    dialog_data.set_committed(record['revision'])
+    dialog_cache.put(dialog_data)
+
+
 class DBManager(metaclass=Singleton):
 
     def __init__(self):
 
-        db_conf_file = os.path.join('resources', 'db', 'db_credentials.json')
-        with open(db_conf_file, 'rt', encoding='utf-8') as fp:
-            data = json.load(fp)
-        self.url = "mongodb://" + data['username'] + ":" + data['password'] + "@" + ''.join(data['endpoint'])
-        self.certificate = os.path.join('resources', 'db', 'certificate.crt')
-        self.timeout_ms = 180 * 1000
+        self.url = read_db_url()
+        self.certificate = read_certificate_path()
+        self.timeout_ms = DB_TIMEOUT_MS
         self.client = self.create_client()
         self.hostname = socket.gethostname()
-        self.db_name = "vira"
-
-        if 'EVAL_LABEL' in os.environ:
-            self.label = os.environ['EVAL_LABEL']
-            logging.info("Using label: [%s]" % self.label)
-        else:
-            self.label = None
+        self.db_name = DB_NAME
+        self.label = read_eval_label()
+        self.dialog_cache = None
+        self.content_snapshot_path = read_content_snapshot_path()
+        self.content_snapshot = None
+        # whether content was uploaded in the current upload scope, or None outside of one
+        self.content_upload_pending = None
 
         logging.info("Using DB: [%s]" % self.db_name)
 
+    def get_dialog_cache(self):
+        if self.dialog_cache is None:
+            self.dialog_cache = DialogDataCache(self.read_configuration().get_session_cache_settings())
+        return self.dialog_cache
+
     def create_client(self):
-        return MongoClient(self.url, tls=True, tlsCAFile=self.certificate,
-                           socketTimeoutMS=self.timeout_ms, wTimeoutMS=self.timeout_ms)
+        return MongoClient(self.url, socketTimeoutMS=self.timeout_ms, wTimeoutMS=self.timeout_ms,
+                           **get_tls_options(self.certificate))
 
     @db_renew_client_on_exception
     def create_dialog(self, dialog_label=None, campaign_id=None, opening_survey_flow=None,
                       platform=None, language_code=None):
-        record = {
-            "date": datetime.now(),
-            'data': {}
-        }
-        if dialog_label is not None:
-            record['label'] = dialog_label
-        elif self.label is not None:
-            record['label'] = self.label
-        if campaign_id is not None:
-            record['campaign_id'] = campaign_id
-        if opening_survey_flow is not None:
-            record['opening_survey_flow'] = opening_survey_flow
-        if platform is not None:
-            record['platform'] = platform
-        if language_code is not None:
-            record['language_code'] = language_code
-        dialog_id = self.client[self.db_name].dialogs.insert_one(record).inserted_id
-        dialog_data = record['data']
-        return DialogData(dialog_id, dialog_data, opening_survey_flow, campaign_id, platform, language_code)
+        record = create_dialog_record(self.label, dialog_label, campaign_id, opening_survey_flow,
+                                      platform, language_code)
+        record['_id'] = self.client[self.db_name].dialogs.insert_one(record).inserted_id
+        dialog_data = create_dialog_data(record, None)
+        self.get_dialog_cache().put(dialog_data)
+        return dialog_data
 
     @db_renew_client_on_exception
     def get_dialog_data(self, session_id, dialog_label=None, campaign_id=None,
                         opening_survey_flow=None, platform=None, language_code=None):
         if session_id is None:
             return self.create_dialog(dialog_label, campaign_id, opening_survey_flow, platform, language_code)
-        dialog_id = ObjectId(session_id) if isinstance(session_id, str) else session_id
-        record = self.client[self.db_name].dialogs.find_one({'_id': dialog_id})
-        if record is None:
-            raise ValueError("Session id not found in database (%s, %s)" % (self.db_name, str(session_id)))
-        dialog_id = record['_id']
-        dialog_data = record['data']
-        if 'opening_survey_flow' in record:
-            opening_survey_flow = record['opening_survey_flow']
-        if 'campaign_id' in record.keys():
-            campaign_id = record['campaign_id']
-        if 'platform' in record.keys():
-            platform = record['platform']
-        if 'language_code' in record.keys():
-            language_code = record['language_code']
-        return DialogData(dialog_id, dialog_data, opening_survey_flow, campaign_id, platform, language_code)
+        dialog_id = to_dialog_id(session_id)
+        dialog_cache = self.get_dialog_cache()
+        dialog_data, is_valid = dialog_cache.get(dialog_id)
+        if dialog_data is not None and not is_valid:
+            record = self.client[self.db_name].dialogs.find_one({'_id': dialog_id}, {'revision': True})
+            is_valid = record is not None and record.get('revision', 0) == dialog_data.revision
+        if not is_valid:
+            record = self.client[self.db_name].dialogs.find_one({'_id': dialog_id})
+            dialog_data = create_dialog_data(record, session_id, campaign_id, opening_survey_flow,
+                                             platform, language_code)
+        dialog_cache.put(dialog_data)
+        return dialog_data
 
     @db_renew_client_on_exception
     def read_dialogs(self, start_date=None, end_date=None, label=None, appen_codes=None,
                      campaign_id=None, platform=None, language_code=None):
-        start = datetime.strptime(start_date, '%Y-%m-%d') if start_date is not None\
-            else datetime.strptime("2021-1-1", '%Y-%m-%d')
-        end = datetime.strptime(end_date, '%Y-%m-%d') if end_date is not None \
-            else datetime.now()
-        appen_codes_query = {"data.appen_code": {"$in": appen_codes}} if appen_codes is not None else {}
-        label_query = {"label": {"$eq": label}} if label is not None else {}
-        campaign_id_query = {"campaign_id": {"$eq": campaign_id}} if campaign_id is not None else {}
-        if platform is not None:
-            if platform == 'vaxchat':
-                platform_query = {"platform": {"$exists": False}}
-            else:
-                platform_query = {"platform": {"$eq": platform}}
-        else:
-            platform_query = {}
-        if language_code is not None:
-            if language_code == 'en':
-                language_query = {"$or": [{"language_code": {"$eq": 'en'}},
-                                          {"language_code": {"$exists": False}}]}
-            else:
-                language_query = {"language_code": {"$eq": language_code}}
-        else:
-            language_query = {}
-
-        cursor = self.client[self.db_name]['dialogs'].find({"$and": [
-                                                                        {"date": {"$lt": end, "$gte": start}},
-                                                                        label_query,
-                                                                        appen_codes_query,
-                                                                        campaign_id_query,
-                                                                        platform_query,
-                                                                        language_query,
-                                                                        ]})
+        cursor = self.client[self.db_name]['dialogs'].find(create_dialogs_query(
+            start_date, end_date, label, appen_codes, campaign_id, platform, language_code))
         return [doc for doc in tqdm(cursor, desc='Dialogs read', unit='d')]
 
+    def iterate_dialogs(self, projection=None, after_id=None, batch_size=1000, **filters):
+        # streams the dialogs in the order of their ids (so a scan can be resumed after the last
+        # dialog it processed), with only the projected fields
+        query = create_dialogs_query(**filters)
+        if after_id is not None:
+            query["$and"].append({"_id": {"$gt": ObjectId(after_id)}})
+        return self.client[self.db_name]['dialogs'].find(query, projection=projection, sort=[('_id', ASCENDING)],
+                                                         batch_size=batch_size)
+
+    @db_renew_client_on_exception
+    def set_profanity_retro_bulk(self, message_ids_by_dialog):
+        # sets the retrospective profanity of messages in a single bulk write, with one update per dialog
+        # that sets only the flags of its messages. a dialog is updated only if it still has the messages.
+        requests = []
+        for dialog_id, message_ids in message_ids_by_dialog.items():
+            fields = {}
+            for message_id in message_ids:
+                fields['data.messages.%d.is_profanity' % message_id] = True
+                fields['data.messages.%d.is_retrospective_profanity' % message_id] = True
+            requests.append(UpdateOne({'_id': dialog_id, 'data.messages.%d' % max(message_ids): {"$exists": True}},
+                                      {"$set": fields, "$inc": {'revision': 1}}))
+            if self.dialog_cache is not None:
+                self.dialog_cache.remove(dialog_id)
+        if len(requests) == 0:
+            return 0
+        return self.client[self.db_name]['dialogs'].bulk_write(requests, ordered=False).modified_count
+
     @db_renew_client_on_exception
     def commit(self, dialog_data):
-        self.client[self.db_name].dialogs.update_one({'_id': dialog_data.dialog_id},
-                                                     {"$set": {'data': dialog_data.dialog_data}})
+        if not dialog_data.has_changes():
+            return
+        dialogs = self.client[self.db_name].dialogs
+        record = None
+        revision = dialog_data.revision
+        update = create_delta_commit_update(dialog_data)
+        is_conflict = False
+        for _ in range(COMMIT_ATTEMPTS):
+            try:
+                record = dialogs.find_one_and_update(create_delta_commit_filter(dialog_data, revision), update,
+                                                     projection={'revision': True},
+                                                     return_document=ReturnDocument.AFTER)
+            except OperationFailure as e:
+                # the delta could not be applied to the stored dialog, which is rewritten as a whole
+                if 'data' in update["$set"]:
+                    raise
+                logging.warning('Delta commit of dialog %s failed (%s)' % (dialog_data.dialog_id, e))
+                update = create_commit_update(dialog_data)
+                continue
+            if record is not None:
+                break
+            # the dialog was changed by another writer since it was read, or deleted
+            current = dialogs.find_one({'_id': dialog_data.dialog_id}, CONFLICT_PROJECTION)
+            if current is None:
+                break
+            logging.info('Revision conflict in the commit of dialog %s' % dialog_data.dialog_id)
+            revision = current.get('revision', 0)
+            update, is_conflict = get_conflict_update(dialog_data, current)
+        if record is None:
+            logging.error('Dialog %s was not committed' % dialog_data.dialog_id)
+        set_committed(dialog_data, record, is_conflict, self.get_dialog_cache())
 
     @db_renew_client_on_exception
     def upload_document(self, collection, name, data):
         self.client[self.db_name][collection].replace_one(
             {'name': name},
             {'name': name, 'data': data}, upsert=True)
+        if collection in CONTENT_COLLECTIONS:
+            if self.content_upload_pending is None:
+                self.update_content_version()
+            else:
+                self.content_upload_pending = True
+
+    # sets a new content version once, after all the content documents uploaded in the scope, so the
+    # processes that poll for content changes do not reload from a partial upload. a failed upload does
+    # not set a new version.
+    @contextmanager
+    def content_upload(self):
+        if self.content_upload_pending is not None:
+            yield
+            return
+        self.content_upload_pending = False
+        try:
+            yield
+            if self.content_upload_pending:
+                self.update_content_version()
+        finally:
+            self.content_upload_pending = None
 
     @db_renew_client_on_exception
     def read_document(self, collection, name):
-        return self.client[self.db_name][collection].find_one({'name': name})['data']
+        # content documents are read once per content version, from the local snapshot if it is up to date
+        if collection not in CONTENT_COLLECTIONS:
+            return self.client[self.db_name][collection].find_one({'name': name})['data']
+        content_snapshot = self.get_content_snapshot()
+        data = content_snapshot.get(collection, name)
+        if data is None:
+            data = self.client[self.db_name][collection].find_one({'name': name})['data']
+            content_snapshot.put(collection, name, data)
+        return data
+
+    @db_renew_client_on_exception
+    def read_content_version(self):
+        # the version is created on the first read if the content was uploaded before versions were introduced
+        record = self.client[self.db_name].content_version.find_one_and_update(
+            {'name': 'content'}, {"$setOnInsert": {'version': create_content_version(), 'date': datetime.now()}},
+            upsert=True, return_document=ReturnDocument.AFTER)
+        return record['version']
+
+    @db_renew_client_on_exception
+    def update_content_version(self):
+        self.client[self.db_name].content_version.update_one(
+            {'name': 'content'}, {"$set": {'version': create_content_version(), 'date': datetime.now()}},
+            upsert=True)
+        self.content_snapshot = None
+
+    def get_content_version(self):
+        return self.get_content_snapshot().version
+
+    # drops the content read so far if the content version changed, and returns the current version
+    def refresh_content(self):
+        version = self.read_content_version()
+        if self.content_snapshot is not None and self.content_snapshot.version != version:
+            self.content_snapshot = None
+        return version
+
+    def get_content_snapshot(self):
+        content_snapshot = pinned_content_snapshot.get()
+        if content_snapshot is not None:
+            return content_snapshot
+        if self.content_snapshot is None:
+            self.content_snapshot = self.load_content_snapshot()
+        return self.content_snapshot
+
+    def load_content_snapshot(self):
+        version = self.read_content_version()
+        if self.content_snapshot_path is not None and os.path.exists(self.content_snapshot_path):
+            try:
+                content_snapshot = ContentSnapshot.load(self.content_snapshot_path)
+                if content_snapshot.version == version:
+                    logging.info('Using content snapshot %s' % version)
+                    return content_snapshot
+                logging.info('Content snapshot %s is outdated (current version is %s)' %
+                             (content_snapshot.version, version))
+            except (OSError, ValueError, KeyError) as e:
+                logging.warning('Failed reading content snapshot from %s (%s)' % (self.content_snapshot_path, e))
+        return self.read_content_snapshot()
+
+    # pins the content reads of the current context (and the tasks it starts) to a snapshot
+    @contextmanager
+    def use_content_snapshot(self, content_snapshot):
+        token = pinned_content_snapshot.set(content_snapshot)
+        try:
+            yield
+        finally:
+            pinned_content_snapshot.reset(token)
+
+    def save_content_snapshot(self):
+        # saves the content, if it was not read from the snapshot
+        if self.content_snapshot_path is not None and self.content_snapshot is not None and \
+                self.content_snapshot.has_changes():
+            try:
+                self.content_snapshot.save(self.content_snapshot_path)
+            except OSError as e:
+                logging.warning('Failed saving content snapshot to %s (%s)' % (self.content_snapshot_path, e))
+
+    # reads all the content documents at a single content version, so a content generation (including the
+    # languages it loads later) is created from a consistent content
+    @db_renew_client_on_exception
+    def read_content_snapshot(self):
+        for _ in range(CONTENT_READ_ATTEMPTS):
+            version = self.read_content_version()
+            content_snapshot = ContentSnapshot(version)
+            for collection in CONTENT_COLLECTIONS:
+                for record in self.client[self.db_name][collection].find():
+                    content_snapshot.put(collection, record['name'], record['data'])
+            if self.read_content_version() == version:
+                break
+            logging.info('Content version changed while reading content version %s' % version)
+        return content_snapshot
+
+    def export_content_snapshot(self, path):
+        # saves all the content documents, e.g. for baking the snapshot into an image
+        self.read_content_snapshot().save(path)
 
     def upload_authored_text(self, name, data):
         self.upload_document('authored_texts', name, data)
@@ -329,6 +647,103 @@ class DBManager(metaclass=Singleton):
                                                                {"$set": {'show_kps': status}})
 
 
+class AsyncDBManager(metaclass=Singleton):
+    # non-blocking counterpart of the dialog related operations of DBManager,
+    # used when the service runs in async mode. the client is created lazily
+    # so it is bound to the event loop of the serving process. the dialog data
+    # cache is shared with DBManager.
+
+    def __init__(self):
+        self.url = read_db_url()
+        self.certificate = read_certificate_path()
+        self.timeout_ms = DB_TIMEOUT_MS
+        self.client = None
+        self.db_name = DB_NAME
+        self.label = read_eval_label()
+
+    def create_client(self):
+        return AsyncIOMotorClient(self.url, socketTimeoutMS=self.timeout_ms, wTimeoutMS=self.timeout_ms,
+                                  **get_tls_options(self.certificate))
+
+    def get_dialogs_collection(self):
+        if self.client is None:
+            self.client = self.create_client()
+        return self.client[self.db_name].dialogs
+
+    @async_db_renew_client_on_exception
+    async def create_dialog(self, dialog_label=None, campaign_id=None, opening_survey_flow=None,
+                            platform=None, language_code=None):
+        record = create_dialog_record(self.label, dialog_label, campaign_id, opening_survey_flow,
+                                      platform, language_code)
+        record['_id'] = (await self.get_dialogs_collection().insert_one(record)).inserted_id
+        dialog_data = create_dialog_data(record, None)
+        DBManager().get_dialog_cache().put(dialog_data)
+        return dialog_data
+
+    @async_db_renew_client_on_exception
+    async def get_dialog_data(self, session_id, dialog_label=None, campaign_id=None,
+                              opening_survey_flow=None, platform=None, language_code=None):
+        if session_id is None:
+            return await self.create_dialog(dialog_label, campaign_id, opening_survey_flow, platform, language_code)
+        dialog_id = to_dialog_id(session_id)
+        dialog_cache = DBManager().get_dialog_cache()
+        dialog_data, is_valid = dialog_cache.get(dialog_id)
+        if dialog_data is not None and not is_valid:
+            record = await self.get_dialogs_collection().find_one({'_id': dialog_id}, {'revision': True})
+            is_valid = record is not None and record.get('revision', 0) == dialog_data.revision
+        if not is_valid:
+            record = await self.get_dialogs_collection().find_one({'_id': dialog_id})
+            dialog_data = create_dialog_data(record, session_id, campaign_id, opening_survey_flow,
+                                             platform, language_code)
+        dialog_cache.put(dialog_data)
+        return dialog_data
+
+    @async_db_renew_client_on_exception
+    async def commit(self, dialog_data):
+        if not dialog_data.has_changes():
+            return
+        dialogs = self.get_dialogs_collection()
+        record = None
+        revision = dialog_data.revision
+        update = create_delta_commit_update(dialog_data)
+        is_conflict = False
+        for _ in range(COMMIT_ATTEMPTS):
+            try:
+                record = await dialogs.find_one_and_update(create_delta_commit_filter(dialog_data, revision), update,
+                                                           projection={'revision': True},
+                                                           return_document=ReturnDocument.AFTER)
+            except OperationFailure as e:
+                if 'data' in update["$set"]:
+                    raise
+                logging.warning('Delta commit of dialog %s failed (%s)' % (dialog_data.dialog_id, e))
+                update = create_commit_update(dialog_data)
+                continue
+            if record is not None:
+                break
+            current = await dialogs.find_one({'_id': dialog_data.dialog_id}, CONFLICT_PROJECTION)
+            if current is None:
+                break
+            logging.info('Revision conflict in the commit of dialog %s' % dialog_data.dialog_id)
+            revision = current.get('revision', 0)
+            update, is_conflict = get_conflict_update(dialog_data, current)
+        if record is None:
+            logging.error('Dialog %s was not committed' % dialog_data.dialog_id)
+        set_committed(dialog_data, record, is_conflict, DBManager().get_dialog_cache())
+
+
+def reset_clients_after_fork():
+    # mongo clients are not fork safe, so forked workers create their own
+    db_manager = DBManager.get_instance()
+    if db_manager is not None:
+        db_manager.client = db_manager.create_client()
+    async_db_manager = AsyncDBManager.get_instance()
+    if async_db_manager is not None:
+        async_db_manager.client = None
+
+
+os.register_at_fork(after_in_child=reset_clients_after_fork)
+
+
 def main():
     db_manager = DBManager()
     dialog_data = db_manager.create_dialog()
@@ -210,13 +210,14 @@ def delete_self_expiring_dialogs():
 
 
 def import_conf_canned_db():
-    import_canned_text_path('canned_text')
-    import_response_db_path('response_db')
-    import_kp_qform_path('kps_to_qform')
-    import_kp_idx_path('kps_to_parent.csv')
-    import_configuration_path('configuration.json')
-    import_profanity_lexicon('profanity_lexicon.csv')
-    import_profanity_texts('profanity_texts.csv')
+    with DBManager().content_upload():
+        import_canned_text_path('canned_text')
+        import_response_db_path('response_db')
+        import_kp_qform_path('kps_to_qform')
+        import_kp_idx_path('kps_to_parent.csv')
+        import_configuration_path('configuration.json')
+        import_profanity_lexicon('profanity_lexicon.csv')
+        import_profanity_texts('profanity_texts.csv')
 
 
 def relabel_dialogs(path, label):
@@ -277,29 +278,32 @@ def main():
     parser.add_argument("-profanity_lexicon", dest="profanity_lexicon_path", required=False,
                         help="input profanity lexicon file", metavar="FILE",
                         default=None, type=lambda x: is_file_exists(parser, x))
+    parser.add_argument("-export-content-snapshot", dest="content_snapshot_path", required=False,
+                        help="output content snapshot file", metavar="FILE", default=None)
     parser.add_argument("-profanity_texts", dest="profanity_texts_path", required=False,
                         help="input profanity texts file", metavar="FILE",
                         default=None, type=lambda x: is_file_exists(parser, x))
 
     args = parser.parse_args()
 
-    if args.kp_index_path is not None:
-        import_kp_idx_path(args.kp_index_qform_path)
+    with DBManager().content_upload():
+        if args.kp_index_path is not None:
+            import_kp_idx_path(args.kp_index_qform_path)
 
-    if args.canned_text_path is not None:
-        import_canned_text_path(args.canned_text_path)
+        if args.canned_text_path is not None:
+            import_canned_text_path(args.canned_text_path)
 
-    if args.profanity_lexicon_path is not None:
-        import_profanity_lexicon(args.profanity_lexicon_path)
+        if args.profanity_lexicon_path is not None:
+            import_profanity_lexicon(args.profanity_lexicon_path)
 
-    if args.profanity_texts_path is not None:
-        import_profanity_texts(args.profanity_texts_path)
+        if args.profanity_texts_path is not None:
+            import_profanity_texts(args.profanity_texts_path)
 
-    if args.response_db_file is not None:
-        import_response_db_path(args.response_db_file)
+        if args.response_db_file is not None:
+            import_response_db_path(args.response_db_file)
 
-    if args.configuration_file is not None:
-        import_configuration_path(args.configuration_file)
+        if args.configuration_file is not None:
+            import_configuration_path(args.configuration_file)
 
     if args.dialog_file is not None:
         appen_codes = list(set(pd.read_csv(args.appen_codes_path)['appen_code'].tolist())) if args.appen_codes_path is \
@@ -322,6 +326,9 @@ def main():
     if args.relabel_file and args.label:
         relabel_dialogs(args.relabel_file, args.label)
 
+    if args.content_snapshot_path is not None:
+        DBManager().export_content_snapshot(args.content_snapshot_path)
+
 
 if __name__ == '__main__':
     main()
@@ -3,23 +3,64 @@
 # SPDX-License-Identifier: Apache2.0
 #
 
+from copy import deepcopy
 from datetime import datetime
 from tools.argument import Argument
 
 
 class DialogData:
 
-    def __init__(self, dialog_id, dialog_data, dialog_opening_survey_flow, campaign_id, platform, language_code):
+    def __init__(self, dialog_id, dialog_data, dialog_opening_survey_flow, campaign_id, platform, language_code,
+                 revision=0):
         self.dialog_id = dialog_id
         self.dialog_data = dialog_data
         self.dialog_opening_survey_flow = dialog_opening_survey_flow
         self.campaign_id = campaign_id
         self.platform = platform
         self.language_code = language_code
+        # the revision of the dialog in the db, and the changes made since it was read or committed:
+        # the messages added after the first committed_message_count ones, and the updated fields
+        self.revision = revision
+        self.committed_message_count = len(self.get_messages())
+        self.updated_fields = set()
 
     def get_dialog_id(self):
         return self.dialog_id
 
+    # a copy that can be changed independently, e.g. by concurrent turns of the same session
+    def copy(self):
+        dialog_data = DialogData(self.dialog_id, deepcopy(self.dialog_data), self.dialog_opening_survey_flow,
+                                 self.campaign_id, self.platform, self.language_code, self.revision)
+        dialog_data.committed_message_count = self.committed_message_count
+        dialog_data.updated_fields = set(self.updated_fields)
+        return dialog_data
+
+    def has_changes(self):
+        return len(self.get_messages()) > self.committed_message_count or len(self.updated_fields) > 0
+
+    def get_new_messages(self):
+        return self.get_messages()[self.committed_message_count:]
+
+    # returns the updated fields by their dotted path within the dialog data
+    def get_updated_fields(self):
+        fields = {}
+        for path in self.updated_fields:
+            value = self.dialog_data
+            for key in path.split('.'):
+                value = value[int(key)] if isinstance(value, list) else value[key]
+            fields[path] = value
+        return fields
+
+    def set_committed(self, revision):
+        self.revision = revision
+        self.committed_message_count = len(self.get_messages())
+        self.updated_fields = set()
+
+    def set_message_updated(self, message_id, *fields):
+        # new messages are committed as a whole
+        if message_id < self.committed_message_count:
+            self.updated_fields.update('messages.%d.%s' % (message_id, field) for field in fields)
+
     def add_user_input(self, text, keypoint, intent, feedback, orig_text, is_concern, is_profanity,
                        orig_translated_text):
         return self.add_message('user', text, keypoint, intent=intent, feedback=feedback, orig_text=orig_text,
@@ -102,7 +143,7 @@ class DialogData:
         return len(user_messages)
 
     def get_messages(self):
-        return self.dialog_data['messages']
+        return self.dialog_data['messages'] if 'messages' in self.dialog_data else []
 
     def get_side_messages(self, side):
         return [message for message in self.dialog_data['messages']
@@ -125,11 +166,13 @@ class DialogData:
         messages = self.get_messages()
         if len(messages) > message_id:
             messages[message_id]['feedback'] = feedback
+            self.set_message_updated(message_id, 'feedback')
         else:
             raise ValueError('Invalid message id')
 
     def add_appen_code(self, code):
         self.dialog_data['appen_code'] = code
+        self.updated_fields.add('appen_code')
 
     def has_appen_code(self):
         return 'appen_code' in self.dialog_data
@@ -139,6 +182,7 @@ class DialogData:
 
     def set_survey(self, survey):
         self.dialog_data['survey'] = survey
+        self.updated_fields.add('survey')
 
     def get_survey(self):
         return self.dialog_data['survey'] if 'survey' in self.dialog_data else None
@@ -149,6 +193,7 @@ class DialogData:
             message = messages[message_id]
             message['is_profanity'] = True
             message['is_retrospective_profanity'] = True
+            self.set_message_updated(message_id, 'is_profanity', 'is_retrospective_profanity')
         else:
             raise ValueError('Invalid message id')
 
@@ -160,11 +205,13 @@ class DialogData:
             "question_date": datetime.now()
         }
         self.dialog_data['opening_survey'].append(record)
+        self.updated_fields.add('opening_survey')
 
     def update_question_answer(self, answer):
         message = self.dialog_data['opening_survey'][-1]
         message['answer'] = answer
         message['answer_date'] = datetime.now()
+        self.updated_fields.add('opening_survey')
 
     def is_opening_survey_waiting_for_answer(self):
         return 'opening_survey' in self.dialog_data and \
@@ -173,6 +220,7 @@ class DialogData:
     def set_opening_survey_discontinued(self):
         message = self.dialog_data['opening_survey'][-1]
         message['discontinued'] = True
+        self.updated_fields.add('opening_survey')
 
     def is_opening_survey_discontinued(self):
         return 'opening_survey' in self.dialog_data and \
@@ -193,6 +241,8 @@ class DialogData:
     def set_skipped_system_opening(self):
         system_messages = self.get_side_messages('system')
         system_messages[0]['skipped'] = True
+        message_id = next(i for i, message in enumerate(self.get_messages()) if message is system_messages[0])
+        self.set_message_updated(message_id, 'skipped')
 
     def get_language_code(self):
         return self.language_code
@@ -0,0 +1,45 @@
+#
+# Copyright 2020-2023 IBM Inc. All rights reserved
+# SPDX-License-Identifier: Apache2.0
+#
+
+from time import monotonic
+
+from tools.lru_cache import LRUCache
+from tools.metrics import count_cache_lookup
+
+
+class DialogDataCache:
+    # keeps the dialog data of recently active sessions in memory. a cached dialog is
+    # served as is if it was read or committed within the validation interval (e.g. when
+    # it is re-read during the same turn), otherwise its revision is first checked against
+    # the db. dialogs with uncommitted changes (e.g. of a failed turn) are never served.
+    # the cache holds its own copy of each dialog and serves copies of it, so turns of the
+    # same session that run concurrently never change each other's dialog data.
+
+    def __init__(self, settings):
+        self.enabled = settings['enabled']
+        self.validation_interval = settings['validation_interval_ms'] / 1000
+        self.cache = LRUCache(max_size=settings['max_size'], ttl=settings['idle_ttl'], idle_ttl=True)
+
+    # returns the cached dialog data (or None), and whether it can be used without validation
+    def get(self, dialog_id):
+        if not self.enabled:
+            return None, False
+        entry = self.cache.get(dialog_id)
+        if entry is None or entry[0].has_changes():
+            count_cache_lookup('session', False)
+            return None, False
+        dialog_data, validated_at = entry
+        count_cache_lookup('session', True)
+        return dialog_data.copy(), monotonic() - validated_at < self.validation_interval
+
+    def put(self, dialog_data):
+        if self.enabled:
+            self.cache.put(dialog_data.get_dialog_id(), (dialog_data.copy(), monotonic()))
+
+    def remove(self, dialog_id):
+        self.cache.pop(dialog_id)
+
+    def get_stats(self):
+        return self.cache.get_stats()
@@ -0,0 +1,34 @@
+#
+# Copyright 2020-2023 IBM Inc. All rights reserved
+# SPDX-License-Identifier: Apache2.0
+#
+
+
+class DialogTurn:
+    # holds the state of a single user turn while it is processed by the dialog manager,
+    # so the sync and the async flows can share the processing stages.
+
+    def __init__(self, dialog_data, language_code, user_arg_raw, feedback, disable_cache, intent, stage_timer):
+        self.dialog_data = dialog_data
+        self.language_code = language_code
+        self.user_arg_raw = user_arg_raw
+        self.feedback = feedback
+        self.disable_cache = disable_cache
+        self.intent = intent
+        self.stage_timer = stage_timer
+        self.user_arg_translated = user_arg_raw
+        self.user_arg = None
+        self.user_arg_analysis = None
+        self.dialog_history = dialog_data.get_history()
+        self.system_argument_history = dialog_data.get_system_argument_history()
+        self.skip_kp_feedback = False
+        self.con_kp_candidates = None
+        self.con_kps = None
+        self.con_kp_scores = None
+        self.con_kp = None
+        self.is_concern = False
+        self.is_profanity = False
+        # whether to request feedback or not
+        self.request_feedback = False
+        # whether the user arg should be matched to the kps
+        self.match_kps = False
@@ -0,0 +1,132 @@
+#
+# Copyright 2020-2023 IBM Inc. All rights reserved
+# SPDX-License-Identifier: Apache2.0
+#
+
+import asyncio
+import logging
+import os
+import random
+import time
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from tools.db_manager import DBManager
+from tools.resilience import get_remaining_time, limit_timeout
+from tools.singleton import Singleton
+
+
+class HttpClient(metaclass=Singleton):
+    # shared http client for the remote classifiers and the translator. connections are kept
+    # alive in per-host pools, and failed calls are retried with an exponential backoff with
+    # full jitter. the same settings are used by the sync (requests) and the async (httpx) clients.
+
+    def __init__(self):
+        settings = DBManager().read_configuration().get_http_client_settings()
+        self.connect_timeout = settings['connect_timeout']
+        self.read_timeout = settings['read_timeout']
+        self.retries = settings['retries']
+        self.backoff_factor = settings['backoff_factor']
+        self.max_backoff = settings['max_backoff']
+        self.retry_statuses = set(settings['retry_statuses'])
+        self.pool_connections = settings['pool_connections']
+        self.pool_maxsize = settings['pool_maxsize']
+        self.keepalive_expiry = settings['keepalive_expiry']
+        self.session = self.create_session()
+        self.async_client = None
+
+    def reset(self):
+        self.session = self.create_session()
+        self.async_client = None
+
+    def create_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize,
+                              max_retries=0)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def create_async_client(self):
+        # httpx limits the connections globally rather than per host
+        limits = httpx.Limits(max_connections=self.pool_connections * self.pool_maxsize,
+                              max_keepalive_connections=self.pool_maxsize,
+                              keepalive_expiry=self.keepalive_expiry)
+        return httpx.AsyncClient(limits=limits, timeout=httpx.Timeout(self.read_timeout,
+                                                                      connect=self.connect_timeout))
+
+    def get_async_client(self):
+        # the client is created lazily, so it is bound to the event loop of the serving process
+        if self.async_client is None:
+            self.async_client = self.create_async_client()
+        return self.async_client
+
+    def get_backoff(self, attempt):
+        return random.uniform(0, min(self.max_backoff, self.backoff_factor * (2 ** attempt)))
+
+    # the timeouts of each attempt, and the backoff before the next one, are limited by the time left
+    # in the deadline of the turn (if any). there is no retry if the backoff would exceed it.
+    def get_timeouts(self):
+        remaining = get_remaining_time()
+        return limit_timeout(self.connect_timeout, remaining), limit_timeout(self.read_timeout, remaining)
+
+    def can_retry(self, attempt, retries, backoff):
+        remaining = get_remaining_time()
+        return attempt < retries and (remaining is None or backoff < remaining)
+
+    def request(self, method, url, retries=None, **kwargs):
+        retries = self.retries if retries is None else retries
+        timeout = kwargs.pop('timeout', None)
+        for attempt in range(retries + 1):
+            backoff = self.get_backoff(attempt)
+            try:
+                resp = self.session.request(method, url, timeout=timeout or self.get_timeouts(), **kwargs)
+                if resp.status_code not in self.retry_statuses or not self.can_retry(attempt, retries, backoff):
+                    return resp
+                logging.warning('%s to %s failed (%d), retrying' % (method, url, resp.status_code))
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if not self.can_retry(attempt, retries, backoff):
+                    raise e
+                logging.warning('%s to %s failed (%s), retrying' % (method, url, type(e).__name__))
+            time.sleep(backoff)
+
+    async def async_request(self, method, url, retries=None, **kwargs):
+        retries = self.retries if retries is None else retries
+        for attempt in range(retries + 1):
+            backoff = self.get_backoff(attempt)
+            connect_timeout, read_timeout = self.get_timeouts()
+            try:
+                resp = await self.get_async_client().request(
+                    method, url, timeout=httpx.Timeout(read_timeout, connect=connect_timeout), **kwargs)
+                if resp.status_code not in self.retry_statuses or not self.can_retry(attempt, retries, backoff):
+                    return resp
+                logging.warning('%s to %s failed (%d), retrying' % (method, url, resp.status_code))
+            except httpx.TransportError as e:
+                if not self.can_retry(attempt, retries, backoff):
+                    raise e
+                logging.warning('%s to %s failed (%s), retrying' % (method, url, type(e).__name__))
+            await asyncio.sleep(backoff)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url, **kwargs)
+
+    async def async_post(self, url, **kwargs):
+        return await self.async_request('POST', url, **kwargs)
+
+
+def reset_client_after_fork():
+    # the pooled connections of the parent process must not be shared by forked workers
+    http_client = HttpClient.get_instance()
+    if http_client is not None:
+        http_client.reset()
+
+
+os.register_at_fork(after_in_child=reset_client_after_fork)
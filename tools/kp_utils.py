@@ -4,6 +4,7 @@
 #
 
 from tools.db_manager import DBManager
+from tools.language_content import LanguageML
 
 
 class KPUtils:
@@ -19,10 +20,7 @@ class KPUtils:
         return self.qform_to_kp[qform]
 
 
-class KPUtilsML:
-    def __init__(self, language_codes):
-        self.utils = {language_code: KPUtils(language_code)
-                      for language_code in language_codes}
+class KPUtilsML(LanguageML):
 
-    def __getitem__(self, item):
-        return self.utils[item]
+    def create(self, language_code):
+        return KPUtils(language_code)
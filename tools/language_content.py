@@ -0,0 +1,118 @@
+#
+# Copyright 2020-2023 IBM Inc. All rights reserved
+# SPDX-License-Identifier: Apache2.0
+#
+
+import logging
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+from tools.db_manager import DBManager
+from tools.memory_utils import format_size, get_deep_size
+from tools.singleton import Singleton
+
+
+class LanguageContent(metaclass=Singleton):
+    # coordinates the per-language content of the components (response db, connecting texts, etc.).
+    # in lazy mode only the preloaded languages are created at startup, and the others on first use.
+    # if a memory budget is set, once it is exceeded the least recently used languages that are not
+    # preloaded are evicted from all the components, and are created again when used.
+
+    def __init__(self):
+        settings = DBManager().read_configuration().get_language_content_settings()
+        self.lazy = settings['lazy']
+        self.preload = set(settings['preload'])
+        self.memory_budget = settings['memory_budget_mb'] * 1024 * 1024 \
+            if settings['memory_budget_mb'] is not None else None
+        # the components of previous content generations are dropped once they are no longer used
+        self.components = weakref.WeakSet()
+        self.usage = OrderedDict()
+        self.lock = threading.Lock()
+
+    def is_preloaded(self, language_code):
+        return not self.lazy or language_code in self.preload
+
+    def register(self, component):
+        with self.lock:
+            self.components.add(component)
+
+    def set_used(self, language_code):
+        with self.lock:
+            self.usage[language_code] = True
+            self.usage.move_to_end(language_code)
+
+    def check_memory_budget(self, language_code):
+        if self.memory_budget is None:
+            return
+        with self.lock:
+            components = list(self.components)
+            size = sum(component.get_loaded_size() for component in components)
+            evictable = [code for code in self.usage.keys()
+                         if code != language_code and not self.is_preloaded(code)]
+            while size > self.memory_budget and len(evictable) > 0:
+                evicted = evictable.pop(0)
+                size -= sum(component.evict(evicted) for component in components)
+                del self.usage[evicted]
+                logging.info('Evicted the content of %s (loaded content: %s)' % (evicted, format_size(size)))
+
+
+class LanguageML:
+    # holds a component per language code, created by create(language_code) according to the
+    # LanguageContent settings. each language is created once, behind its own lock, from the content
+    # snapshot of the generation the component belongs to (even if the content was reloaded since).
+
+    def __init__(self, language_codes):
+        self.content_snapshot = DBManager().get_content_snapshot()
+        self.items = {}
+        self.sizes = {}
+        self.lock = threading.Lock()
+        self.load_locks = {language_code: threading.Lock() for language_code in language_codes}
+        self.language_content = LanguageContent()
+        self.language_content.register(self)
+        for language_code in language_codes:
+            if self.language_content.is_preloaded(language_code):
+                self.load(language_code)
+
+    def create(self, language_code):
+        raise NotImplementedError()
+
+    def get_size(self, item):
+        return get_deep_size(item)
+
+    def __getitem__(self, item):
+        component = self.items.get(item)
+        if component is None:
+            if item not in self.load_locks:
+                raise KeyError(item)
+            component = self.load(item)
+        self.language_content.set_used(item)
+        return component
+
+    def load(self, language_code):
+        with self.load_locks[language_code]:
+            component = self.items.get(language_code)
+            if component is not None:
+                return component
+            start_time = time.time()
+            with DBManager().use_content_snapshot(self.content_snapshot):
+                component = self.create(language_code)
+            # the size is only needed (and measured) when there is a memory budget
+            size = self.get_size(component) if self.language_content.memory_budget is not None else 0
+            with self.lock:
+                self.items[language_code] = component
+                self.sizes[language_code] = size
+            logging.info('Loaded %s of %s (%.2fs)' % (type(component).__name__, language_code,
+                                                      time.time() - start_time))
+        self.language_content.check_memory_budget(language_code)
+        return component
+
+    def evict(self, language_code):
+        with self.lock:
+            self.items.pop(language_code, None)
+            return self.sizes.pop(language_code, 0)
+
+    def get_loaded_size(self):
+        with self.lock:
+            return sum(self.sizes.values())
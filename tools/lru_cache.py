@@ -0,0 +1,68 @@
+#
+# Copyright 2020-2023 IBM Inc. All rights reserved
+# SPDX-License-Identifier: Apache2.0
+#
+
+import threading
+from collections import OrderedDict
+from time import monotonic
+
+
+class LRUCache:
+    # a thread-safe cache bounded by size (least recently used entries are evicted first)
+    # and by age. if idle_ttl is set the age is measured from the last access, otherwise
+    # from the insertion of the entry. a ttl of None means the entries do not expire.
+
+    def __init__(self, max_size, ttl=None, idle_ttl=False):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.idle_ttl = idle_ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and self.ttl is not None and monotonic() - entry[1] > self.ttl:
+                del self.entries[key]
+                self.evictions += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self.entries.move_to_end(key)
+            if self.idle_ttl:
+                self.entries[key] = (entry[0], monotonic())
+            return entry[0]
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, monotonic())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            return entry[0] if entry is not None else default
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get_stats(self):
+        return {
+            'size': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
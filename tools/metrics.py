@@ -0,0 +1,70 @@
+#
+# Copyright 2020-2023 IBM Inc. All rights reserved
+# SPDX-License-Identifier: Apache2.0
+#
+
+from prometheus_client import Counter, Histogram
+
+# the stages are recorded by the StageTimer of each turn, and are observed once the turn
+# is committed, when its intent is known
+STAGE_SECONDS = Histogram('vira_stage_seconds', 'Duration of the processing stages of a user turn',
+                          ['stage', 'language_code', 'intent'],
+                          buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+
+TURN_SECONDS = Histogram('vira_turn_seconds', 'Duration of the processing of a user turn',
+                         ['language_code', 'intent'],
+                         buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+
+CLASSIFIER_ERRORS = Counter('vira_classifier_errors_total', 'Failed calls to the remote classifiers', ['endpoint'])
+
+CACHE_REQUESTS = Counter('vira_cache_requests_total', 'Lookups in the in-process caches', ['cache', 'result'])
+
+CLASSIFIER_FALLBACKS = Counter('vira_classifier_fallbacks_total',
+                               'Turns that used a fallback result since a remote classifier failed', ['endpoint'])
+
+CIRCUIT_BREAKER_REJECTIONS = Counter('vira_circuit_breaker_rejections_total',
+                                     'Calls that were not made since the circuit of the endpoint was open', ['endpoint'])
+
+KP_MATCHING_REQUESTS = Counter('vira_kp_matching_requests_total', 'KP matching requests by the matcher that answered',
+                               ['matcher'])
+
+# the local matcher is compared with the remote one whenever both match the same text
+KP_MATCHING_AGREEMENT = Counter('vira_kp_matching_agreement_total',
+                                'Agreement of the top kps of the local and the remote kp matchers',
+                                ['local_confidence', 'result'])
+
+
+def get_intent_label(intent):
+    return intent['label'] if intent is not None else 'none'
+
+
+def observe_stage_times(stage_timer, language_code, intent, end_time):
+    intent_label = get_intent_label(intent)
+    for stage in stage_timer.get_stage_times():
+        STAGE_SECONDS.labels(stage['stage'], language_code, intent_label).observe(stage['end'] - stage['start'])
+    TURN_SECONDS.labels(language_code, intent_label).observe(end_time - stage_timer.start_time)
+
+
+def count_classifier_error(url):
+    CLASSIFIER_ERRORS.labels(url).inc()
+
+
+def count_classifier_fallback(url):
+    CLASSIFIER_FALLBACKS.labels(url).inc()
+
+
+def count_circuit_breaker_rejection(url):
+    CIRCUIT_BREAKER_REJECTIONS.labels(url).inc()
+
+
+def count_cache_lookup(cache, is_hit):
+    CACHE_REQUESTS.labels(cache, 'hit' if is_hit else 'miss').inc()
+
+
+def count_kp_matching(matcher):
+    KP_MATCHING_REQUESTS.labels(matcher).inc()
+
+
+def count_kp_matching_agreement(is_local_confident, is_agreement):
+    KP_MATCHING_AGREEMENT.labels('high' if is_local_confident else 'low',
+                                 'agree' if is_agreement else 'disagree').inc()
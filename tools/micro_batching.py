@@ -0,0 +1,184 @@
+#
+# Copyright 2020-2023 IBM Inc. All rights reserved
+# SPDX-License-Identifier: Apache2.0
+#
+
+import asyncio
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from time import sleep
+
+from tools.db_manager import DBManager
+from tools.http_client import HttpClient
+from tools.resilience import get_remaining_time, DeadlineExceeded
+from tools.singleton import Singleton
+
+
+# the batch contract of the classifier services: a batch of texts is sent as a list of single-text
+# contexts, {'text': [[text_1], ..., [text_n]]}, and the response holds a list of intents and a list
+# of scores per text, in the order of the texts: {'intents': [intents_1, ..., intents_n], 'scores':
+# [scores_1, ..., scores_n]}, where intents_i and scores_i are the response to text_i alone. a batch
+# of a single text is sent as a plain request, {'text': text_1}.
+def create_batch_request(texts):
+    return {'text': texts[0]} if len(texts) == 1 else {'text': [[text] for text in texts]}
+
+
+def is_batch_list(value, n_texts):
+    return isinstance(value, list) and len(value) == n_texts and all(isinstance(item, list) for item in value)
+
+
+def split_batch_response(data, n_texts):
+    if n_texts == 1:
+        return [(data['intents'], data['scores'])]
+    intents = data.get('intents')
+    scores = data.get('scores')
+    if not is_batch_list(intents, n_texts) or not is_batch_list(scores, n_texts) or \
+            any(len(text_intents) != len(text_scores) for text_intents, text_scores in zip(intents, scores)):
+        raise ValueError('Unexpected batch response: expected the intents and the scores of each of %d texts'
+                         % n_texts)
+    return list(zip(intents, scores))
+
+
+def check_batch_response(url, status_code, reason):
+    if status_code != 200:
+        raise ConnectionError('Failed calling server at %s: (%d) %s' % (url, status_code, reason))
+
+
+class Batch:
+
+    def __init__(self):
+        self.texts = []
+        self.disable_cache = False
+        self.futures = []
+
+    def add(self, text, disable_cache, future):
+        self.texts.append(text)
+        self.disable_cache = self.disable_cache or disable_cache
+        self.futures.append(future)
+
+    def get_headers(self):
+        return {'Pragma': 'no-cache'} if self.disable_cache else None
+
+    def set_results(self, data):
+        for future, result in zip(self.futures, split_batch_response(data, len(self.texts))):
+            future.set_result(result)
+
+    def set_exception(self, e):
+        for future in self.futures:
+            if not future.done():
+                future.set_exception(e)
+
+    def __len__(self):
+        return len(self.texts)
+
+
+class MicroBatcher:
+    # aggregates concurrent calls to a classifier endpoint. the first caller of a batch waits
+    # for the batch window and then sends the batch, unless the batch was filled (and sent by
+    # the caller that filled it) before that. every caller gets the scores of its own text.
+
+    def __init__(self, url, window, max_batch_size):
+        self.url = url
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.lock = threading.Lock()
+        self.batch = None
+
+    def get_scores(self, text, disable_cache):
+        future = Future()
+        with self.lock:
+            batch = self.batch
+            is_leader = batch is None
+            if is_leader:
+                batch = self.batch = Batch()
+            batch.add(text, disable_cache, future)
+            send_batch = len(batch) >= self.max_batch_size
+            if send_batch:
+                self.batch = None
+        if not send_batch and is_leader:
+            sleep(self.window)
+            with self.lock:
+                send_batch = self.batch is batch
+                if send_batch:
+                    self.batch = None
+        if send_batch:
+            self.send(batch)
+        try:
+            return future.result(timeout=get_remaining_time())
+        except FutureTimeoutError:
+            raise DeadlineExceeded('The time budget of the turn is exhausted')
+
+    def send(self, batch):
+        try:
+            resp = HttpClient().post(self.url, json=create_batch_request(batch.texts), headers=batch.get_headers())
+            check_batch_response(self.url, resp.status_code, resp.reason)
+            batch.set_results(resp.json())
+        except Exception as e:
+            batch.set_exception(e)
+
+
+class AsyncMicroBatcher:
+    # the asyncio counterpart of MicroBatcher, all callers run on the same event loop
+
+    def __init__(self, url, window, max_batch_size):
+        self.url = url
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.batch = None
+
+    async def get_scores(self, text, disable_cache):
+        future = asyncio.get_running_loop().create_future()
+        batch = self.batch
+        is_leader = batch is None
+        if is_leader:
+            batch = self.batch = Batch()
+        batch.add(text, disable_cache, future)
+        send_batch = len(batch) >= self.max_batch_size
+        if send_batch:
+            self.batch = None
+        elif is_leader:
+            await asyncio.sleep(self.window)
+            send_batch = self.batch is batch
+            if send_batch:
+                self.batch = None
+        if send_batch:
+            await self.send(batch)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), get_remaining_time())
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded('The time budget of the turn is exhausted')
+
+    async def send(self, batch):
+        try:
+            resp = await HttpClient().async_post(self.url, json=create_batch_request(batch.texts),
+                                                 headers=batch.get_headers())
+            check_batch_response(self.url, resp.status_code, resp.reason_phrase)
+            batch.set_results(resp.json())
+        except Exception as e:
+            batch.set_exception(e)
+
+
+class MicroBatching(metaclass=Singleton):
+
+    def __init__(self):
+        settings = DBManager().read_configuration().get_micro_batching_settings()
+        self.enabled = settings['enabled']
+        self.window = settings['window_ms'] / 1000
+        self.max_batch_size = settings['max_batch_size']
+        self.batchers = {}
+        self.async_batchers = {}
+        self.lock = threading.Lock()
+
+    def is_batchable(self, candidate):
+        return self.enabled and isinstance(candidate, str)
+
+    def get_scores(self, url, text, disable_cache):
+        with self.lock:
+            if url not in self.batchers:
+                self.batchers[url] = MicroBatcher(url, self.window, self.max_batch_size)
+        return self.batchers[url].get_scores(text, disable_cache)
+
+    async def async_get_scores(self, url, text, disable_cache):
+        if url not in self.async_batchers:
+            self.async_batchers[url] = AsyncMicroBatcher(url, self.window, self.max_batch_size)
+        return await self.async_batchers[url].get_scores(text, disable_cache)
@@ -3,6 +3,10 @@
 # SPDX-License-Identifier: Apache2.0
 #
 
+from tools.language_content import LanguageML
+from tools.memory_utils import get_deep_size
+
+
 class OpeningSurvey:
 
     def __init__(self, configuration, language_code):
@@ -53,11 +57,15 @@ class OpeningSurvey:
         return self.default_flow
 
 
-class OpeningSurveyML:
+class OpeningSurveyML(LanguageML):
 
     def __init__(self, configuration, language_codes):
-        self.opening_surveys = {language_code: OpeningSurvey(configuration, language_code)
-                                for language_code in language_codes}
+        self.configuration = configuration
+        super().__init__(language_codes)
+
+    def create(self, language_code):
+        return OpeningSurvey(self.configuration, language_code)
 
-    def __getitem__(self, item):
-        return self.opening_surveys[item]
+    def get_size(self, item):
+        # the configuration is shared by all the languages
+        return get_deep_size(item, exclude=[self.configuration])
@@ -0,0 +1,85 @@
+#
+# Copyright 2020-2023 IBM Inc. All rights reserved
+# SPDX-License-Identifier: Apache2.0
+#
+
+import re
+from collections import deque
+
+# a text is split into runs of word characters and runs of non-word characters, with the same
+# definition of a word character as the \b of the re module
+RUN_PATTERN = re.compile(r'(\w+)|(\W+)')
+
+
+def split_runs(text):
+    return [(word or other, len(word) > 0) for word, other in RUN_PATTERN.findall(text)]
+
+
+class PhraseMatcher:
+    # finds whether a text contains one of a set of phrases as a whole, which is what a search with
+    # the regex \b(phrase1|phrase2|...)\b does. the word boundaries of a text are exactly the edges
+    # of its runs (except the edges of the text itself, that are boundaries only next to a word run),
+    # so a phrase matches if its runs are a sequence of the runs of the text. the phrases are kept
+    # in an Aho-Corasick automaton over run ids, so a text is scanned once, one step per run,
+    # whatever the number of phrases.
+
+    def __init__(self, phrases):
+        self.run_ids = {}
+        self.transitions = [{}]
+        self.outputs = [set()]
+        # the empty phrase matches at any word boundary, as the empty alternative of the regex
+        self.match_empty = False
+        for phrase in phrases:
+            runs = split_runs(phrase)
+            if len(runs) == 0:
+                self.match_empty = True
+                continue
+            state = 0
+            for run, _ in runs:
+                run_id = self.run_ids.setdefault(run, len(self.run_ids))
+                if run_id not in self.transitions[state]:
+                    self.transitions[state][run_id] = len(self.transitions)
+                    self.transitions.append({})
+                    self.outputs.append(set())
+                state = self.transitions[state][run_id]
+            # a phrase that starts (ends) with a non-word run cannot match at the start (end) of a text
+            self.outputs[state].add((len(runs), runs[0][1], runs[-1][1]))
+        self.fail = self.create_fail_links()
+
+    def create_fail_links(self):
+        # the fail link of a state is the state of its longest proper suffix, and the phrases
+        # of the suffix are added to the outputs of the state
+        fail = [0] * len(self.transitions)
+        queue = deque(self.transitions[0].values())
+        while len(queue) > 0:
+            state = queue.popleft()
+            for run_id, next_state in self.transitions[state].items():
+                suffix_state = fail[state]
+                while suffix_state > 0 and run_id not in self.transitions[suffix_state]:
+                    suffix_state = fail[suffix_state]
+                fail[next_state] = self.transitions[suffix_state].get(run_id, 0)
+                self.outputs[next_state] |= self.outputs[fail[next_state]]
+                queue.append(next_state)
+        self.outputs = [tuple(outputs) for outputs in self.outputs]
+        return fail
+
+    def search(self, text):
+        runs = split_runs(text)
+        if self.match_empty and any(is_word for _, is_word in runs):
+            return True
+        state = 0
+        for end, (run, _) in enumerate(runs, 1):
+            run_id = self.run_ids.get(run)
+            if run_id is None:
+                state = 0
+                continue
+            while state > 0 and run_id not in self.transitions[state]:
+                state = self.fail[state]
+            state = self.transitions[state].get(run_id, 0)
+            for n_runs, starts_with_word, ends_with_word in self.outputs[state]:
+                if (end > n_runs or starts_with_word) and (end < len(runs) or ends_with_word):
+                    return True
+        return False
+
+    def get_size(self):
+        return len(self.transitions)
@@ -3,61 +3,193 @@
 # SPDX-License-Identifier: Apache2.0
 #
 
+# Applies the profanity classifier retrospectively to the user messages of the stored dialogs, and
+# marks the profane messages that were not marked when they were sent. The dialogs are streamed in
+# the order of their ids with only the fields of their messages that are needed, classified in chunks
+# by a pool of processes. By default the job is a dry run, that only writes the cases. With -apply, the
+# flags of the missed messages of each chunk are also set in a single bulk write, and the id of the last
+# dialog of each written chunk is kept in a checkpoint file, so a job that was stopped continues after
+# it. The cases of a chunk are written before its dialogs are updated and its checkpoint is written, so
+# a chunk that is processed again after a failure adds only the cases that were not already written.
+#
+# usage: PYTHONPATH=. python tools/profanity_utils.py -label jhu-production [-apply] [-restart]
+
+import json
+import os
+from argparse import ArgumentParser
+from collections import deque
 from time import time
+
 import pandas as pd
+from tqdm import tqdm
+
+from assessment.operators import is_user, is_not_intro, has_profanity, get_profanity
 from components.profanity_classifier import ProfanityClassifier
+from tools.batch_processing import apply_worker, create_batch_executor
 from tools.db_manager import DBManager
-from assessment.operators import is_user, is_not_intro, has_profanity, get_profanity
-from tqdm import tqdm
+
+MESSAGES_PROJECTION = {'data.messages.side': True, 'data.messages.intent': True, 'data.messages.text': True,
+                       'data.messages.date': True, 'data.messages.is_profanity': True}
+CASES_FILES = {
+    'missed': 'profanity_missing_retrospective_.csv',
+    'diff_old': 'profanity_diff_old.csv',
+    'diff_new': 'profanity_diff_new.csv',
+}
+CASE_COLUMNS = ['dialog_id', 'message_id', 'date', 'text']
+
+
+def get_user_messages(dialogs):
+    return [(dialog['_id'], message_id, message)
+            for dialog in dialogs
+            for message_id, message in enumerate(dialog.get('data', {}).get('messages', []))
+            if is_user(message) and is_not_intro(message)]
+
+
+def get_case_type(message, is_profanity):
+    if has_profanity(message):
+        if is_profanity is not get_profanity(message):
+            return 'diff_new' if is_profanity else 'diff_old'
+        return None
+    return 'missed' if is_profanity else None
+
+
+def iterate_chunks(cursor, chunk_size):
+    chunk = []
+    for dialog in cursor:
+        chunk.append(dialog)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if len(chunk) > 0:
+        yield chunk
+
+
+def read_checkpoint(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as fp:
+        return json.load(fp)
+
+
+def write_checkpoint(path, checkpoint):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as fp:
+        json.dump(checkpoint, fp)
+    os.replace(tmp_path, path)
+
+
+def get_case_key(case):
+    return case['dialog_id'], int(case['message_id'])
+
+
+# the keys of the cases written by the previous runs of a job that is continued
+def read_case_keys():
+    case_keys = {}
+    for case_type, path in CASES_FILES.items():
+        df = pd.read_csv(path, index_col=0, dtype={'dialog_id': str}) if os.path.exists(path) else \
+            pd.DataFrame(columns=CASE_COLUMNS)
+        case_keys[case_type] = {get_case_key(case) for case in df.to_dict('records')}
+    return case_keys
+
+
+# appends the cases that were not written yet, and returns them. the rows are numbered across the
+# chunks, as in the files written by the job before it was run in chunks.
+def append_cases(cases, is_new, case_keys):
+    new_cases = []
+    for case_type, case in cases:
+        if get_case_key(case) not in case_keys[case_type]:
+            case_keys[case_type].add(get_case_key(case))
+            new_cases.append((case_type, case))
+    for case_type, path in CASES_FILES.items():
+        type_cases = [case for t, case in new_cases if t == case_type]
+        start = len(case_keys[case_type]) - len(type_cases)
+        df = pd.DataFrame(type_cases, columns=CASE_COLUMNS, index=range(start, start + len(type_cases)))
+        if is_new or len(df) > 0:
+            df.to_csv(path, mode='w' if is_new else 'a', header=is_new)
+    return new_cases
+
+
+def get_chunk_cases(user_messages, decisions):
+    cases = []
+    missed_message_ids = {}
+    for (dialog_id, message_id, message), is_profanity in zip(user_messages, decisions):
+        case_type = get_case_type(message, is_profanity)
+        if case_type is None:
+            continue
+        cases.append((case_type, {'dialog_id': str(dialog_id), 'message_id': message_id,
+                                  'date': message.get('date'), 'text': message['text']}))
+        if case_type == 'missed':
+            missed_message_ids.setdefault(dialog_id, []).append(message_id)
+    return cases, missed_message_ids
 
 
 def main():
-    print('Reading dialogs...', end=" ")
-    t0 = time()
-    dialogs = DBManager().read_dialogs(label='jhu-production')
-    print("done in %.3f secs" % (time()-t0))
+    parser = ArgumentParser(description="Retrospective profanity detection")
+    parser.add_argument("-label", dest="label", type=str, default='jhu-production', help="dialogs label")
+    parser.add_argument("-start_date", dest="start_date", type=str, default=None, help="yyyy-mm-dd")
+    parser.add_argument("-end_date", dest="end_date", type=str, default=None, help="yyyy-mm-dd")
+    parser.add_argument("-processes", dest="processes", type=int, default=os.cpu_count(),
+                        help="number of classification processes")
+    parser.add_argument("-chunk_size", dest="chunk_size", type=int, default=1000, help="dialogs per chunk")
+    parser.add_argument("-checkpoint", dest="checkpoint_path", type=str,
+                        default='profanity_retrospective_checkpoint.json', help="checkpoint file")
+    parser.add_argument("-restart", dest="restart", action='store_true',
+                        help="ignore the checkpoint and start from the first dialog")
+    parser.add_argument("-apply", dest="apply", action='store_true',
+                        help="update the dialogs, rather than only writing the cases")
+    args = parser.parse_args()
+
+    checkpoint = read_checkpoint(args.checkpoint_path) if args.apply and not args.restart else None
+    if checkpoint is None:
+        checkpoint = {'last_dialog_id': None, 'dialogs': 0, 'messages': 0, 'updated': 0,
+                      'cases': {case_type: 0 for case_type in CASES_FILES}}
+    else:
+        print('Continuing after dialog %s' % checkpoint['last_dialog_id'])
+    is_new = checkpoint['last_dialog_id'] is None
+    case_keys = read_case_keys() if not is_new else {case_type: set() for case_type in CASES_FILES}
+
     profanity_classifier = ProfanityClassifier()
-    profanity_missed_cases = []
-    profanity_diff_old_cases = []
-    profanity_diff_new_cases = []
-    print('Collecting profanity cases...', end=" ")
+    cursor = DBManager().iterate_dialogs(projection=MESSAGES_PROJECTION, after_id=checkpoint['last_dialog_id'],
+                                         batch_size=args.chunk_size, label=args.label,
+                                         start_date=args.start_date, end_date=args.end_date)
+
+    def complete_chunk(chunk_item):
+        nonlocal is_new
+        last_dialog_id, n_dialogs, user_messages, future = chunk_item
+        cases, missed_message_ids = get_chunk_cases(user_messages, future.result())
+        new_cases = append_cases(cases, is_new, case_keys)
+        is_new = False
+        n_updated = DBManager().set_profanity_retro_bulk(missed_message_ids) if args.apply else 0
+        checkpoint['last_dialog_id'] = str(last_dialog_id)
+        checkpoint['dialogs'] += n_dialogs
+        checkpoint['messages'] += len(user_messages)
+        checkpoint['updated'] += n_updated
+        for case_type, _ in new_cases:
+            checkpoint['cases'][case_type] += 1
+        if args.apply:
+            write_checkpoint(args.checkpoint_path, checkpoint)
+        progress.update(n_dialogs)
+
     t0 = time()
-    for dialog in tqdm(dialogs):
-        dialog_id = str(dialog['_id'])
-        for message_id, message in enumerate(dialog['data']['messages']):
-            if is_user(message) and is_not_intro(message):
-                text = message['text']
-                is_profanity = profanity_classifier.apply(text)
-                cases = None
-                if has_profanity(message):
-                    if is_profanity is not get_profanity(message):
-                        cases = profanity_diff_new_cases if is_profanity else profanity_diff_old_cases
-                elif is_profanity:
-                    cases = profanity_missed_cases
-                if cases is not None:
-                    cases.append({
-                        'dialog_id': dialog_id,
-                        'message_id': message_id,
-                        'date': message['date'],
-                        'text': text
-                    })
-    print("Done in %.3f secs" % (time()-t0))
-    pd.DataFrame(profanity_missed_cases).to_csv("profanity_missing_retrospective_.csv")
-    pd.DataFrame(profanity_diff_old_cases).to_csv("profanity_diff_old.csv")
-    pd.DataFrame(profanity_diff_new_cases).to_csv("profanity_diff_new.csv")
-
-    print('Add profanity to %d messages? [y/n]' % len(profanity_missed_cases))
-    choice = input().lower()
-
-    if choice == 'y':
-        # update the missing cases
-        print('Adding profanity...', end=" ")
-        t0 = time()
-        for case in tqdm(profanity_missed_cases):
-            dialog_data = DBManager().get_dialog_data(case['dialog_id'])
-            dialog_data.set_profanity_retro(case['message_id'])
-            DBManager().commit(dialog_data)
-        print("Done in %.3f secs" % (time()-t0))
+    # the chunks are classified while the next ones are read, and are completed in order, so the
+    # checkpoint only moves past dialogs that were written
+    with create_batch_executor(profanity_classifier, args.processes) as executor, \
+            tqdm(desc='Dialogs', unit='d') as progress:
+        pending = deque()
+        for dialogs in iterate_chunks(cursor, args.chunk_size):
+            user_messages = get_user_messages(dialogs)
+            future = executor.submit(apply_worker, 'apply_many', [message['text'] for _, _, message in user_messages])
+            pending.append((dialogs[-1]['_id'], len(dialogs), user_messages, future))
+            if len(pending) > 2 * args.processes:
+                complete_chunk(pending.popleft())
+        while len(pending) > 0:
+            complete_chunk(pending.popleft())
+
+    print("Done in %.3f secs: %d dialogs, %d user messages, %d dialogs updated%s" %
+          (time() - t0, checkpoint['dialogs'], checkpoint['messages'], checkpoint['updated'],
+           ' (dry run)' if not args.apply else ''))
+    for case_type, path in CASES_FILES.items():
+        print('%s: %d cases in %s' % (case_type, checkpoint['cases'][case_type], path))
 
 
 if __name__ == '__main__':
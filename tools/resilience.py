@@ -0,0 +1,302 @@
+#
+# Copyright 2020-2023 IBM Inc. All rights reserved
+# SPDX-License-Identifier: Apache2.0
+#
+
+import asyncio
+import concurrent.futures
+import contextvars
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from time import monotonic
+
+from tools.db_manager import DBManager
+from tools.metrics import count_circuit_breaker_rejection
+from tools.singleton import Singleton
+
+# the number of hedges the budget can save up, so a burst of slow calls after a quiet period
+# hedges at most this many of them
+HEDGE_BUDGET_BURST = 10
+
+# the deadline of the turn being processed. it is set per turn, and is inherited by the asyncio
+# tasks of the turn (and by the threads the turn submits work to, if run in a copy of its context)
+CURRENT_DEADLINE = contextvars.ContextVar('deadline', default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+class CircuitOpenError(ConnectionError):
+    pass
+
+
+class Deadline:
+
+    def __init__(self, budget):
+        self.expires_at = monotonic() + budget
+
+    def get_remaining(self):
+        return max(0.0, self.expires_at - monotonic())
+
+
+@contextmanager
+def deadline_scope(budget):
+    # a budget of None means no deadline
+    token = CURRENT_DEADLINE.set(Deadline(budget) if budget is not None else None)
+    try:
+        yield
+    finally:
+        CURRENT_DEADLINE.reset(token)
+
+
+# returns the remaining time of the current deadline (None if there is none), and raises
+# DeadlineExceeded if there is no time left
+def get_remaining_time():
+    deadline = CURRENT_DEADLINE.get()
+    if deadline is None:
+        return None
+    remaining = deadline.get_remaining()
+    if remaining <= 0:
+        raise DeadlineExceeded('The time budget of the turn is exhausted')
+    return remaining
+
+
+def is_deadline_expired():
+    deadline = CURRENT_DEADLINE.get()
+    return deadline is not None and deadline.get_remaining() <= 0
+
+
+def limit_timeout(timeout, remaining):
+    return timeout if remaining is None else min(timeout, remaining)
+
+
+class HedgeBudget:
+    # limits the hedges to a fraction of the calls: each call adds the fraction to the budget (up to
+    # a burst of HEDGE_BUDGET_BURST hedges) and each hedge takes one, so a slow endpoint does not get
+    # twice the load when it is least able to handle it.
+
+    def __init__(self, ratio):
+        self.ratio = ratio
+        self.balance = 0.0
+        self.lock = threading.Lock()
+
+    def on_call(self):
+        with self.lock:
+            self.balance = min(HEDGE_BUDGET_BURST, self.balance + self.ratio)
+
+    def try_take(self):
+        with self.lock:
+            if self.balance < 1:
+                return False
+            self.balance -= 1
+            return True
+
+
+class CircuitBreaker:
+    # stops calling an endpoint after failure_threshold consecutive failures. once reset_timeout
+    # seconds have passed a single trial call is let through, and its result closes the circuit
+    # or opens it again.
+
+    def __init__(self, name, failure_threshold, reset_timeout):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+        self.lock = threading.Lock()
+
+    def before_call(self):
+        with self.lock:
+            if self.opened_at is None:
+                return
+            if not self.trial and monotonic() - self.opened_at >= self.reset_timeout:
+                self.trial = True
+                return
+        count_circuit_breaker_rejection(self.name)
+        raise CircuitOpenError('The circuit of %s is open' % self.name)
+
+    def on_success(self):
+        with self.lock:
+            if self.opened_at is not None:
+                logging.info('Closing the circuit of %s' % self.name)
+            self.failures = 0
+            self.opened_at = None
+            self.trial = False
+
+    def on_abort(self):
+        # a call that was abandoned by its caller (e.g. when the turn ran out of time) says nothing
+        # about the endpoint. if it was the trial call, the next call is the trial.
+        with self.lock:
+            self.trial = False
+
+    def on_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial or (self.opened_at is None and self.failures >= self.failure_threshold):
+                logging.warning('Opening the circuit of %s after %d failures' % (self.name, self.failures))
+                self.opened_at = monotonic()
+                self.trial = False
+
+    def is_open(self):
+        with self.lock:
+            return self.opened_at is not None
+
+    def is_half_open(self):
+        with self.lock:
+            return self.trial
+
+
+class Resilience(metaclass=Singleton):
+    # guards the calls to the remote classifiers: the calls of a turn share its time budget,
+    # slow calls are hedged with a second request (within the hedge budget), and each endpoint
+    # has a circuit breaker.
+
+    def __init__(self):
+        settings = DBManager().read_configuration().get_resilience_settings()
+        self.turn_budget = settings['turn_budget']
+        self.hedge_delay = settings['hedge_delay_ms'] / 1000 if settings['hedge_delay_ms'] is not None else None
+        self.fallbacks = settings['fallbacks']
+        self.breaker_settings = settings['circuit_breaker']
+        self.breakers = {}
+        self.hedge_budget = HedgeBudget(settings['hedge_budget'])
+        self.hedge_max_workers = settings['hedge_max_workers']
+        self.hedge_executor = ThreadPoolExecutor(max_workers=self.hedge_max_workers, thread_name_prefix='hedge') \
+            if self.hedge_delay is not None else None
+        # the calls submitted to the hedge executor that did not complete
+        self.hedge_in_flight = 0
+        self.lock = threading.Lock()
+
+    def turn_deadline(self):
+        return deadline_scope(self.turn_budget)
+
+    def get_breaker(self, url):
+        if not self.breaker_settings['enabled']:
+            return None
+        with self.lock:
+            if url not in self.breakers:
+                self.breakers[url] = CircuitBreaker(url, self.breaker_settings['failure_threshold'],
+                                                    self.breaker_settings['reset_timeout'])
+            return self.breakers[url]
+
+    def should_hedge(self, breaker, hedge):
+        # the trial call of a half open circuit is not hedged, as it probes an endpoint that failed
+        if not hedge or self.hedge_delay is None or (breaker is not None and breaker.is_half_open()):
+            return False
+        self.hedge_budget.on_call()
+        return True
+
+    def call(self, url, func, *args, hedge=True):
+        # a turn that ran out of time does not count as a failure of the endpoint
+        get_remaining_time()
+        breaker = self.get_breaker(url)
+        if breaker is not None:
+            breaker.before_call()
+        try:
+            result = self.hedge(func, *args) if self.should_hedge(breaker, hedge) else func(*args)
+        except BaseException as e:
+            on_call_error(breaker, e)
+            raise e
+        if breaker is not None:
+            breaker.on_success()
+        return result
+
+    async def async_call(self, url, func, *args, hedge=True):
+        get_remaining_time()
+        breaker = self.get_breaker(url)
+        if breaker is not None:
+            breaker.before_call()
+        try:
+            result = await (self.async_hedge(func, *args) if self.should_hedge(breaker, hedge) else func(*args))
+        except BaseException as e:
+            on_call_error(breaker, e)
+            raise e
+        if breaker is not None:
+            breaker.on_success()
+        return result
+
+    def hedge(self, func, *args):
+        # when the executor has no idle worker the call is made directly, as queued calls (and
+        # hedges) would only add to the delay
+        if not self.try_reserve_worker():
+            return func(*args)
+        futures = {self.submit(func, *args)}
+        done, _ = concurrent.futures.wait(futures, timeout=limit_timeout(self.hedge_delay, get_remaining_time()))
+        if len(done) == 0 and self.try_reserve_worker():
+            if self.hedge_budget.try_take():
+                futures.add(self.submit(func, *args))
+            else:
+                self.release_worker(None)
+        return wait_first_result(futures, get_remaining_time())
+
+    def try_reserve_worker(self):
+        with self.lock:
+            if self.hedge_in_flight >= self.hedge_max_workers:
+                return False
+            self.hedge_in_flight += 1
+            return True
+
+    def release_worker(self, _):
+        with self.lock:
+            self.hedge_in_flight -= 1
+
+    def submit(self, func, *args):
+        # the calls run in the context of the caller, so they get the deadline of its turn
+        future = self.hedge_executor.submit(contextvars.copy_context().run, func, *args)
+        future.add_done_callback(self.release_worker)
+        return future
+
+    async def async_hedge(self, func, *args):
+        tasks = {asyncio.ensure_future(func(*args))}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=limit_timeout(self.hedge_delay, get_remaining_time()))
+            if len(done) == 0 and self.hedge_budget.try_take():
+                tasks.add(asyncio.ensure_future(func(*args)))
+            while True:
+                done, tasks = await asyncio.wait(tasks, timeout=get_remaining_time(),
+                                                 return_when=asyncio.FIRST_COMPLETED)
+                if len(done) == 0:
+                    raise DeadlineExceeded('The time budget of the turn is exhausted')
+                result = get_first_result(done, tasks)
+                if result is not None:
+                    return result[0]
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+def on_call_error(breaker, e):
+    if breaker is None:
+        return
+    # the caller running out of time (or cancelling the call) is not a failure of the endpoint,
+    # even if the call failed because its timeout was cut to the remaining time of the turn
+    if not isinstance(e, Exception) or isinstance(e, DeadlineExceeded) or is_deadline_expired():
+        breaker.on_abort()
+    else:
+        breaker.on_failure()
+
+
+# returns the result of the first call that succeeded, or raises the error of the last one that failed
+def wait_first_result(futures, timeout):
+    pending = futures
+    while True:
+        done, pending = concurrent.futures.wait(pending, timeout=timeout,
+                                                return_when=concurrent.futures.FIRST_COMPLETED)
+        if len(done) == 0:
+            raise DeadlineExceeded('The time budget of the turn is exhausted')
+        result = get_first_result(done, pending)
+        if result is not None:
+            return result[0]
+        timeout = get_remaining_time()
+
+
+def get_first_result(done, pending):
+    for future in done:
+        if future.exception() is None:
+            return future.result(),
+    if len(pending) == 0:
+        raise next(iter(done)).exception()
+    return None
@@ -0,0 +1,54 @@
+#
+# Copyright 2020-2023 IBM Inc. All rights reserved
+# SPDX-License-Identifier: Apache2.0
+#
+
+import hashlib
+import json
+import logging
+
+from tools.db_manager import DBManager
+from tools.lru_cache import LRUCache
+from tools.metrics import count_cache_lookup
+from tools.singleton import Singleton
+
+
+class ScoresCache(metaclass=Singleton):
+    # caches the responses of the remote classifiers per (endpoint, text with normalized whitespace). the cache
+    # is cleared whenever the content it depends on (e.g. the configuration or the kp-idx
+    # mapping) is loaded with a different fingerprint than the one previously registered.
+
+    def __init__(self):
+        settings = DBManager().read_configuration().get_scores_cache_settings()
+        self.enabled = settings['enabled']
+        self.cache = LRUCache(max_size=settings['max_size'], ttl=settings['ttl'])
+        self.fingerprints = {}
+
+    @classmethod
+    def get_key(cls, url, text):
+        return url, ' '.join(text.split())
+
+    def is_cacheable(self, candidate):
+        return self.enabled and isinstance(candidate, str)
+
+    def get(self, url, text):
+        scores = self.cache.get(self.get_key(url, text))
+        count_cache_lookup('scores', scores is not None)
+        if scores is None:
+            return None
+        intents, intent_scores = scores
+        return list(intents), list(intent_scores)
+
+    def put(self, url, text, intents, intent_scores):
+        self.cache.put(self.get_key(url, text), (tuple(intents), tuple(intent_scores)))
+
+    def set_fingerprint(self, name, data):
+        fingerprint = hashlib.sha1(json.dumps(data, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        previous_fingerprint = self.fingerprints.get(name)
+        if previous_fingerprint is not None and previous_fingerprint != fingerprint:
+            logging.info('Content of %s changed - clearing the scores cache' % name)
+            self.cache.clear()
+        self.fingerprints[name] = fingerprint
+
+    def get_stats(self):
+        return self.cache.get_stats()
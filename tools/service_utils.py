@@ -4,21 +4,89 @@
 #
 
 import re
-import requests
 from urllib.parse import urlparse
 from urllib.parse import parse_qsl
 
 from tools.db_manager import DBManager
+from tools.http_client import HttpClient
+from tools.metrics import count_classifier_error
+from tools.micro_batching import MicroBatching, check_batch_response, create_batch_request, split_batch_response
+from tools.resilience import Resilience
+from tools.scores_cache import ScoresCache
 
 
 def get_scores(url, candidate, disable_cache):
-    scores = []
+    scores = get_cached_scores(url, candidate, disable_cache)
+    if scores is not None:
+        return scores
+    try:
+        # a micro batched text is not hedged, the batch it is sent in is shared with other turns
+        return cache_scores(url, candidate, Resilience().call(url, request_scores, url, candidate, disable_cache,
+                                                              hedge=not MicroBatching().is_batchable(candidate)))
+    except Exception as e:
+        count_classifier_error(url)
+        raise e
+
+
+async def async_get_scores(url, candidate, disable_cache):
+    scores = get_cached_scores(url, candidate, disable_cache)
+    if scores is not None:
+        return scores
+    try:
+        return cache_scores(url, candidate, await Resilience().async_call(
+            url, async_request_scores, url, candidate, disable_cache,
+            hedge=not MicroBatching().is_batchable(candidate)))
+    except Exception as e:
+        count_classifier_error(url)
+        raise e
+
+
+def request_scores(url, candidate, disable_cache):
+    if MicroBatching().is_batchable(candidate):
+        intents, intent_scores = MicroBatching().get_scores(url, candidate, disable_cache)
+        return {'intents': intents, 'scores': intent_scores}
     headers = {'Pragma': 'no-cache'} if disable_cache else None
-    resp = requests.post(url, json={'text': candidate}, headers=headers)
+    resp = HttpClient().post(url, json={'text': candidate}, headers=headers)
     if resp.status_code != 200:
         raise ConnectionError('Failed calling server at %s: (%d) %s' %
                               (url, resp.status_code, resp.reason))
-    data = resp.json()
+    return resp.json()
+
+
+async def async_request_scores(url, candidate, disable_cache):
+    if MicroBatching().is_batchable(candidate):
+        intents, intent_scores = await MicroBatching().async_get_scores(url, candidate, disable_cache)
+        return {'intents': intents, 'scores': intent_scores}
+    headers = {'Pragma': 'no-cache'} if disable_cache else None
+    resp = await HttpClient().async_post(url, json={'text': candidate}, headers=headers)
+    if resp.status_code != 200:
+        raise ConnectionError('Failed calling server at %s: (%d) %s' %
+                              (url, resp.status_code, resp.reason_phrase))
+    return resp.json()
+
+
+# returns the intents and scores of each of the texts, which are sent in a single batch request
+def get_batch_scores(url, texts, disable_cache):
+    headers = {'Pragma': 'no-cache'} if disable_cache else None
+    try:
+        resp = HttpClient().post(url, json=create_batch_request(texts), headers=headers)
+        check_batch_response(url, resp.status_code, resp.reason)
+        return split_batch_response(resp.json(), len(texts))
+    except Exception as e:
+        count_classifier_error(url)
+        raise e
+
+
+def get_cached_scores(url, candidate, disable_cache):
+    if disable_cache or not ScoresCache().is_cacheable(candidate):
+        return None
+    return ScoresCache().get(url, candidate)
+
+
+def cache_scores(url, candidate, data):
+    # the response is stored even if the cache was disabled for this call, so it is refreshed
+    if ScoresCache().is_cacheable(candidate):
+        ScoresCache().put(url, candidate, data['intents'], data['scores'])
     return data['intents'], data['scores']
 
 
@@ -0,0 +1,88 @@
+#
+# Copyright 2020-2023 IBM Inc. All rights reserved
+# SPDX-License-Identifier: Apache2.0
+#
+
+import fcntl
+import glob
+import logging
+import mmap
+import os
+import struct
+
+# the id of None in a string table
+NONE_ID = 0xFFFFFFFF
+
+
+class StringTableBuilder:
+    # assigns ids to distinct strings, to be stored once in a string table
+
+    def __init__(self):
+        self.ids = {}
+        self.strings = []
+
+    def add(self, text):
+        if text is None:
+            return NONE_ID
+        string_id = self.ids.get(text)
+        if string_id is None:
+            string_id = self.ids[text] = len(self.strings)
+            self.strings.append(text)
+        return string_id
+
+    def to_bytes(self):
+        # the offsets of the strings in the blob, followed by the utf-8 blob
+        encoded = [text.encode('utf-8') for text in self.strings]
+        offsets = [0]
+        for data in encoded:
+            offsets.append(offsets[-1] + len(data))
+        return struct.pack('<%dI' % len(offsets), *offsets) + b''.join(encoded)
+
+
+class StringTable:
+    # reads strings from a string table in a shared buffer, without copying the table
+
+    def __init__(self, buffer, offset, n_strings):
+        self.offsets = buffer[offset:offset + 4 * (n_strings + 1)].cast('I')
+        self.blob = buffer[offset + 4 * (n_strings + 1):]
+
+    def get(self, string_id):
+        if string_id == NONE_ID:
+            return None
+        return str(self.blob[self.offsets[string_id]:self.offsets[string_id + 1]], 'utf-8')
+
+    def get_size(self):
+        return self.offsets.nbytes + self.offsets[-1]
+
+
+def get_store_path(store_dir, name, version):
+    return os.path.join(store_dir, '%s-%s.bin' % (name, version))
+
+
+def open_shared_store(store_dir, name, version, build):
+    # returns a read-only memory map of the store of the given content version. the store is
+    # built (by calling build, which returns its bytes) by the first process that needs it, while
+    # the other processes of the host wait for it and then map the same file.
+    os.makedirs(store_dir, exist_ok=True)
+    path = get_store_path(store_dir, name, version)
+    with open(os.path.join(store_dir, '%s.lock' % name), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            if not os.path.exists(path):
+                tmp_path = '%s.%d.tmp' % (path, os.getpid())
+                with open(tmp_path, 'wb') as fp:
+                    fp.write(build())
+                os.replace(tmp_path, path)
+                logging.info('Built shared store %s (%d bytes)' % (path, os.path.getsize(path)))
+                remove_previous_stores(store_dir, name, path)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+    with open(path, 'rb') as fp:
+        return mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def remove_previous_stores(store_dir, name, path):
+    # processes still mapping a removed store keep their mapping
+    for previous_path in glob.glob(get_store_path(store_dir, name, '*')):
+        if previous_path != path:
+            os.remove(previous_path)
@@ -11,3 +11,12 @@ class Singleton(type):
         if cls not in cls._instances:
             cls._instances[cls] = super(Singleton, cls).__call__(*args, **kwargs)
         return cls._instances[cls]
+
+    # creates a new instance, which replaces the existing one
+    def renew(cls, *args, **kwargs):
+        cls._instances[cls] = super(Singleton, cls).__call__(*args, **kwargs)
+        return cls._instances[cls]
+
+    # returns the existing instance, or None if it was not created
+    def get_instance(cls):
+        return cls._instances.get(cls)
@@ -0,0 +1,37 @@
+#
+# Copyright 2020-2023 IBM Inc. All rights reserved
+# SPDX-License-Identifier: Apache2.0
+#
+
+from contextlib import contextmanager
+from time import time
+
+
+class StageTimer:
+    # records the start and end offsets (in seconds, relative to the turn start)
+    # of the processing stages of a turn, so overlapping stages are visible
+
+    def __init__(self, start_time=None):
+        self.start_time = start_time if start_time is not None else time()
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name):
+        start = time()
+        try:
+            yield
+        finally:
+            self.stages.append({'stage': name, 'start': start - self.start_time, 'end': time() - self.start_time})
+
+    def timed(self, name, func):
+        def inner(*args, **kwargs):
+            with self.stage(name):
+                return func(*args, **kwargs)
+        return inner
+
+    async def async_timed(self, name, awaitable):
+        with self.stage(name):
+            return await awaitable
+
+    def get_stage_times(self):
+        return list(self.stages)
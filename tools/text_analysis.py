@@ -0,0 +1,42 @@
+#
+# Copyright 2020-2023 IBM Inc. All rights reserved
+# SPDX-License-Identifier: Apache2.0
+#
+
+import re
+
+from tools.lru_cache import LRUCache
+from tools.metrics import count_cache_lookup
+from tools.text_cleansing import stop_words
+
+# the characters that are kept by the cleansing of the rule based components
+CLEANER_PATTERN = re.compile(r"[^A-Za-z0-9\-]")
+ANALYSIS_CACHE_SIZE = 4096
+
+
+class TextAnalysis:
+    # the cleansed forms of a user text that the rule based components work on, computed once:
+    # the lowercase tokens of the text (with any other character as a separator), the tokens
+    # joined by single spaces (as matched by the profanity classifier), and the tokens that are
+    # not stop words (as returned by clean_words). the analysis is shared, so it is immutable.
+
+    __slots__ = ('text', 'normalized_text', 'tokens', 'content_words')
+
+    def __init__(self, text):
+        self.text = text
+        self.tokens = tuple(CLEANER_PATTERN.sub(" ", text).lower().split())
+        self.normalized_text = ' '.join(self.tokens)
+        self.content_words = tuple(token for token in self.tokens if token not in stop_words)
+
+
+# the same texts are sent by many users (answers, feedback options), so the analyses are kept by text
+analysis_cache = LRUCache(max_size=ANALYSIS_CACHE_SIZE)
+
+
+def analyze_text(text):
+    analysis = analysis_cache.get(text)
+    count_cache_lookup('text_analysis', analysis is not None)
+    if analysis is None:
+        analysis = TextAnalysis(text)
+        analysis_cache.put(text, analysis)
+    return analysis
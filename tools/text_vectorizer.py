@@ -0,0 +1,58 @@
+#
+# Copyright 2020-2023 IBM Inc. All rights reserved
+# SPDX-License-Identifier: Apache2.0
+#
+
+import re
+import zlib
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+
+class HashingVectorizer:
+    # represents texts by their word unigrams and bigrams, hashed (with a stable hash, so all the
+    # processes agree) into a fixed number of features with a random sign, and weighted by their
+    # idf in the texts the vectorizer was fitted on. the vectors are not normalized, so the vector
+    # of texts joined together is about the sum of their vectors.
+
+    def __init__(self, n_features=2048):
+        self.n_features = n_features
+        self.idf = np.ones(n_features, dtype=np.float32)
+
+    @classmethod
+    def get_features(cls, text):
+        tokens = TOKEN_PATTERN.findall(text.lower())
+        return tokens + [tokens[i] + ' ' + tokens[i + 1] for i in range(len(tokens) - 1)]
+
+    def get_feature_index(self, feature):
+        h = zlib.crc32(feature.encode('utf-8'))
+        return h % self.n_features, -1.0 if h & 0x80000000 else 1.0
+
+    def get_counts(self, text):
+        counts = {}
+        for feature in self.get_features(text):
+            index, sign = self.get_feature_index(feature)
+            counts[index] = counts.get(index, 0.0) + sign
+        return counts
+
+    def fit(self, texts):
+        document_frequency = np.zeros(self.n_features, dtype=np.float32)
+        for text in texts:
+            for index in self.get_counts(text).keys():
+                document_frequency[index] += 1
+        self.idf = (np.log((1 + len(texts)) / (1 + document_frequency)) + 1).astype(np.float32)
+        return self
+
+    def transform(self, texts):
+        vectors = np.zeros((len(texts), self.n_features), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for index, count in self.get_counts(text).items():
+                vectors[i, index] = count
+        return vectors * self.idf
+
+
+def normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1)
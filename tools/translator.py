@@ -4,10 +4,11 @@
 #
 
 import re
-import requests
 import pandas as pd
 import math
 
+from tools.http_client import HttpClient
+
 
 ENGLISH_CODE = 'en'
 
@@ -19,7 +20,7 @@ class WatsonTranslator:
 		self.api_key = configuration.get_translator_apikey()
 		self.url = configuration.get_translator_endpoint()
 
-	def get_translation(self, text, language_code):
+	def get_translation_request(self, text, language_code):
 		model_id = self.configuration.get_translator_model_id(language_code)
 		headers = {'apikey': self.api_key, 'content-type': 'application/json'}
 		data = {
@@ -27,14 +28,27 @@ class WatsonTranslator:
 			'model_id': model_id,
 			'translations': [],
 		}
+		return data, headers
 
-		resp = requests.post(self.url, json=data, headers=headers, auth=('apikey', self.api_key))
+	def get_translation(self, text, language_code):
+		data, headers = self.get_translation_request(text, language_code)
+		resp = HttpClient().post(self.url, json=data, headers=headers, auth=('apikey', self.api_key))
 		if resp.status_code != 200:
 			print('POST to %s failed: %d: %s' % (self.url, resp.status_code, resp.reason))
 			print(resp.text)
 			return {}
 		return resp.json()
 
+	async def async_get_translation(self, text, language_code):
+		data, headers = self.get_translation_request(text, language_code)
+		resp = await HttpClient().async_post(self.url, json=data, headers=headers,
+											 auth=('apikey', self.api_key))
+		if resp.status_code != 200:
+			print('POST to %s failed: %d: %s' % (self.url, resp.status_code, resp.reason_phrase))
+			print(resp.text)
+			return {}
+		return resp.json()
+
 	def get_translation_res(self, res):
 		if 'translations' in res.keys():
 			return [trans['translation'] for trans in res['translations']]
@@ -71,31 +85,37 @@ class WatsonTranslator:
 		out_res = self.get_translation_res(res)
 		return out_res
 
+	async def async_translate(self, text, language_code):
+		res = await self.async_get_translation(text, language_code)
+		out_res = self.get_translation_res(res)
+		return out_res
+
 	def create_model(self, mode, path, language_code):
 		base_model_id = self.configuration.get_translator_base_model_id(language_code)
 		headers = {'apikey': self.api_key}
 		file = {mode: open(path, 'rb')}
-		resp = requests.post(self.url.replace("translate", "models") +
-							 f"&base_model_id={base_model_id}&name=custom-{base_model_id}",
-							 files=file, headers=headers, auth=('apikey', self.api_key))
+		# the upload is not retried since the file would already be consumed
+		resp = HttpClient().post(self.url.replace("translate", "models") +
+								 f"&base_model_id={base_model_id}&name=custom-{base_model_id}",
+								 files=file, headers=headers, auth=('apikey', self.api_key), retries=0)
 		return resp.json()['model_id']
 
 	def get_model(self, model_id):
 		headers = {'apikey': self.api_key, 'content-type': 'application/json'}
-		resp = requests.get(self.url.replace("translate", f"models/{model_id}"),
-							headers=headers, auth=('apikey', self.api_key))
+		resp = HttpClient().get(self.url.replace("translate", f"models/{model_id}"),
+								headers=headers, auth=('apikey', self.api_key))
 		return resp.json()
 
 	def delete_model(self, model_id):
 		headers = {'apikey': self.api_key, 'content-type': 'application/json'}
-		resp = requests.delete(self.url.replace("translate", f"models/{model_id}"),
-							   headers=headers, auth=('apikey', self.api_key))
+		resp = HttpClient().delete(self.url.replace("translate", f"models/{model_id}"),
+								   headers=headers, auth=('apikey', self.api_key))
 		return resp.json()
 
 	def get_identification(self, text):
 		headers = {'apikey': self.api_key, 'content-type': 'text/plain'}
-		resp = requests.post(self.url.replace("translate", "identify"), data=text.encode('utf8'), headers=headers,
-							 auth=('apikey', self.api_key))
+		resp = HttpClient().post(self.url.replace("translate", "identify"), data=text.encode('utf8'),
+								 headers=headers, auth=('apikey', self.api_key))
 		return resp.json()
 
 	def identify_language(self, text):